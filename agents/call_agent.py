@@ -1,3 +1,4 @@
+import os
 import boto3
 import json
 
@@ -12,7 +13,9 @@ AGENT_ALIAS_ID = "TP5NTBGTFE"
 SESSION_ID = "test-session-123"  # You can use any unique identifier
 USER_INPUT = "Qué es fogaes?"
 AWS_REGION = "us-east-1"  # Change to your region
-AWS_PROFILE = "sandbox"  # AWS credentials profile
+AWS_PROFILE = os.getenv("BEDROCK_PROFILE", "sandbox") or None  # AWS credentials profile
+# Optional endpoint override, e.g. http://localhost:8787 for local_bedrock_server.py
+ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")
 
 # ============================================
 # Initialize Bedrock Agent Runtime Client
@@ -20,7 +23,8 @@ AWS_PROFILE = "sandbox"  # AWS credentials profile
 session = boto3.Session(profile_name=AWS_PROFILE)
 client = session.client(
     'bedrock-agent-runtime',
-    region_name=AWS_REGION
+    region_name=AWS_REGION,
+    endpoint_url=ENDPOINT_URL
 )
 
 # ============================================
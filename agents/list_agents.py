@@ -1,6 +1,12 @@
+import os
+import sys
 import boto3
 import json
 
+# Shared modules live at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rate_limiter import RATE_LIMITER
+
 # Configuration
 PROFILE = 'sandbox'
 REGION = 'us-east-1'
@@ -8,7 +14,7 @@ OUTPUT_FILE = 'agents.json'
 
 def export_agents():
     session = boto3.Session(profile_name=PROFILE, region_name=REGION)
-    client = session.client('bedrock-agent')
+    client = RATE_LIMITER.instrument_client(session.client('bedrock-agent'))
     
     agents_list = []
     
@@ -87,12 +93,13 @@ def process_agents():
     my_config = Config(
         connect_timeout=TIMEOUT_SECONDS, 
         read_timeout=TIMEOUT_SECONDS,
-        retries={'max_attempts': 1} # Don't retry endlessly if it fails
+        # Other errors fail fast; throttles are paced and retried with backoff by RATE_LIMITER
+        retries={'max_attempts': 1}
     )
     
     try:
         session = boto3.Session(profile_name=PROFILE, region_name=REGION)
-        client = session.client('bedrock-agent', config=my_config)
+        client = RATE_LIMITER.instrument_client(session.client('bedrock-agent', config=my_config))
     except Exception as e:
         print(f"CRITICAL: Could not create AWS session. Check credentials. {e}")
         return
@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import re
 
-# FILE
-INPUT_PARQUET = "evaluations/testset_results.parquet"
+from results_store import (
+    list_runs, load_runs, load_cube, add_cube_dimensions, cube_means,
+    dimension_filter, run_columns, load_page, load_row, load_value_counts
+)
+from metric_stats import bootstrap_table
+
+# Append-only results store written by evaluation.py (one partition per run)
+RESULTS_DIR = "evaluations/runs"
+# Explorer pages are read from Parquet on demand, never the whole run
+EXPLORER_PAGE_SIZE = 100
+EXPLORER_COLUMNS = [
+    'row_id', 'user_input', 'hit_rate', 'mrr', 'recall', 'precision',
+    'query_style', 'persona_name', 'synthesizer_name',
+]
+# Long text columns: fetched only for the selected row
+DETAIL_COLUMNS = [
+    'reference_contexts', 'retrieved_contexts', 'retrieved_scores', 'match_mask', 'matched_gt_indices',
+]
 
 # ==========================================
 # 1. PAGE CONFIGURATION
@@ -17,43 +32,93 @@ st.set_page_config(
 # ==========================================
 # 2. LOAD & PREPROCESS DATA
 # ==========================================
+@st.cache_data(ttl=30)
+def load_run_list():
+    """Runs registered in the manifest, newest first."""
+    return list(reversed(list_runs(RESULTS_DIR)))
+
 @st.cache_data
-def load_data():
-    try:
-        df = pd.read_parquet(INPUT_PARQUET)
-
-        # --- PREPROCESSING: Map Synthesizer to Complexity ---
-        def get_complexity(name):
-            name = str(name).lower()
-            if 'single' in name:
-                return 'Single Hop'
-            elif 'multi' in name:
-                return 'Multi Hop'
-            return 'Other'
-
-        # Only create complexity if synthesizer_name exists (it should)
-        if 'synthesizer_name' in df.columns:
-            df['complexity'] = df['synthesizer_name'].apply(get_complexity)
-        else:
-            df['complexity'] = 'Unknown'
-            
-        return df
-    except FileNotFoundError:
-        st.error(f"File '{INPUT_PARQUET}' not found. Please run the evaluator script first.")
-        return pd.DataFrame()
+def load_data(run_ids, columns=None):
+    """
+    Reads ONLY the selected runs' partitions (and columns, if given).
+    `run_ids` / `columns` are tuples so Streamlit can cache on them.
+    """
+    df = load_runs(list(run_ids), list(columns) if columns else None, results_dir=RESULTS_DIR)
+
+    # --- PREPROCESSING: Map Synthesizer to Complexity (same dimensions as the cube) ---
+    return add_cube_dimensions(df)
+
+@st.cache_data
+def load_run_cube(run_id):
+    """Precomputed sums/counts per (complexity, style, persona, synthesizer) cell."""
+    return load_cube(run_id, RESULTS_DIR)
+
+@st.cache_data
+def load_intervals(run_id, selections, by=None):
+    """
+    95% bootstrap CIs for the filtered cells, from the run's stored metric value
+    counts (multinomial resampling: no row scan, milliseconds per call).
+    """
+    counts = load_value_counts(run_id, RESULTS_DIR)
+    for dim, values in selections:
+        counts = counts[counts[dim].isin(values)]
+    return bootstrap_table(counts, by=by)
+
+@st.cache_data
+def load_explorer_page(run_id, selections, page):
+    """
+    One page of the filtered run (light columns only). Filters are pushed down
+    into the Parquet scan. `selections` is a tuple of (dimension, values) pairs.
+    """
+    row_filter = dimension_filter(load_run_cube(run_id), dict(selections))
+    columns = [c for c in EXPLORER_COLUMNS if c in run_columns(run_id, RESULTS_DIR)]
+    page_df = load_page(
+        run_id, page * EXPLORER_PAGE_SIZE, EXPLORER_PAGE_SIZE, columns, row_filter, RESULTS_DIR
+    )
+    return add_cube_dimensions(page_df)
+
+@st.cache_data
+def load_row_details(run_id, row_id, selections, position):
+    """Context columns of ONE row: by row_id, or by filtered position for older runs."""
+    stored = run_columns(run_id, RESULTS_DIR)
+    columns = [c for c in DETAIL_COLUMNS if c in stored]
+    if 'row_id' in stored:
+        return load_row(run_id, row_id, columns, RESULTS_DIR).iloc[0]
+    row_filter = dimension_filter(load_run_cube(run_id), dict(selections))
+    return load_page(run_id, position, 1, columns, row_filter, RESULTS_DIR).iloc[0]
+
+runs = load_run_list()
+if not runs:
+    st.error(f"No runs found in '{RESULTS_DIR}'. Please run the evaluator script first.")
+    st.stop()
+
+run_ids = [r['run_id'] for r in runs]
+
+# ==========================================
+# 3. SIDEBAR: RUN SELECTION
+# ==========================================
+st.sidebar.header("Run")
+selected_run = st.sidebar.selectbox("Evaluation run", run_ids, index=0)
+run_info = next(r for r in runs if r['run_id'] == selected_run)
+st.sidebar.caption(
+    f"Retriever: **{run_info.get('retriever') or 'n/a'}** | "
+    f"Top-K: **{run_info.get('top_k') or 'n/a'}** | "
+    f"Created: {run_info.get('created_at', 'n/a')}"
+)
 
-df_original = load_data()
+cube_original = load_run_cube(selected_run)
 
-if df_original.empty:
+if cube_original.empty:
     st.stop()
 
 # ==========================================
-# 3. SIDEBAR FILTERS
+# 4. SIDEBAR FILTERS
 # ==========================================
 st.sidebar.header("Filters")
 
+# Filter options come from the cube, no row scan needed
 # Filter by Complexity (Single vs Multi Hop)
-all_complexities = df_original['complexity'].unique().tolist()
+all_complexities = cube_original['complexity'].unique().tolist()
 selected_complexity = st.sidebar.multiselect(
     "Query Complexity", 
     all_complexities, 
@@ -61,28 +126,44 @@ selected_complexity = st.sidebar.multiselect(
 )
 
 # Filter by Query Style
-all_styles = df_original['query_style'].unique().tolist()
+all_styles = cube_original['query_style'].unique().tolist()
 selected_styles = st.sidebar.multiselect(
     "Query Style", 
     all_styles, 
     default=all_styles
 )
 
-# Apply Filters
-df = df_original[
-    (df_original['complexity'].isin(selected_complexity)) &
-    (df_original['query_style'].isin(selected_styles))
+# Filter by Persona
+all_personas = cube_original['persona_name'].unique().tolist()
+selected_personas = st.sidebar.multiselect(
+    "Persona", 
+    all_personas, 
+    default=all_personas
+)
+
+# Apply Filters (to cube cells; rows are only loaded for the explorer)
+cube = cube_original[
+    (cube_original['complexity'].isin(selected_complexity)) &
+    (cube_original['query_style'].isin(selected_styles)) &
+    (cube_original['persona_name'].isin(selected_personas))
 ]
+n_filtered, n_total = int(cube['count'].sum()), int(cube_original['count'].sum())
+# Hashable form of the filters, for the cached loaders
+selections = (
+    ('complexity', tuple(selected_complexity)),
+    ('query_style', tuple(selected_styles)),
+    ('persona_name', tuple(selected_personas)),
+)
 
 st.sidebar.markdown("---")
-st.sidebar.info(f"Showing **{len(df)}** out of **{len(df_original)}** test cases.")
+st.sidebar.info(f"Showing **{n_filtered}** out of **{n_total}** test cases.")
 
 # ==========================================
-# 4. MAIN LAYOUT
+# 5. MAIN LAYOUT
 # ==========================================
 st.title("RAG Retrieval Evaluation")
 
-tab1, tab2 = st.tabs(["Dashboard Overview", "Test Case Explorer"])
+tab1, tab2, tab3 = st.tabs(["Dashboard Overview", "Test Case Explorer", "Run Comparison"])
 
 # ---------------------------------------------------------------------
 # TAB 1: DASHBOARD OVERVIEW
@@ -92,32 +173,63 @@ with tab1:
     st.subheader("Aggregate Metrics")
     col1, col2, col3, col4 = st.columns(4)
     
-    col1.metric("Hit Rate", f"{df['hit_rate'].mean():.1%}", help="Queries with at least 1 correct context.")
-    col2.metric("MRR", f"{df['mrr'].mean():.3f}", help="Mean Reciprocal Rank (Higher is better).")
-    col3.metric("Recall", f"{df['recall'].mean():.1%}", help="% of expected contexts found.")
-    col4.metric("Precision", f"{df['precision'].mean():.1%}", help="% of retrieved contexts that were relevant.")
+    kpis = cube_means(cube) if n_filtered else pd.Series(0.0, index=['hit_rate', 'mrr', 'recall', 'precision'])
+    col1.metric("Hit Rate", f"{kpis['hit_rate']:.1%}", help="Queries with at least 1 correct context.")
+    col2.metric("MRR", f"{kpis['mrr']:.3f}", help="Mean Reciprocal Rank (Higher is better).")
+    col3.metric("Recall", f"{kpis['recall']:.1%}", help="% of expected contexts found.")
+    col4.metric("Precision", f"{kpis['precision']:.1%}", help="% of retrieved contexts that were relevant.")
+
+    # 95% bootstrap confidence intervals (small testsets swing a lot between runs)
+    if n_filtered:
+        intervals = load_intervals(selected_run, selections).set_index('metric')
+        for col, metric, fmt in [(col1, 'hit_rate', '{:.1%}'), (col2, 'mrr', '{:.3f}'),
+                                 (col3, 'recall', '{:.1%}'), (col4, 'precision', '{:.1%}')]:
+            low, high = intervals.loc[metric, ['ci_low', 'ci_high']]
+            col.caption(f"95% CI: {fmt.format(low)} – {fmt.format(high)}")
 
     st.markdown("---")
 
-    # B. Charts
+    # B. Charts (sums of cube cells per dimension)
     col_chart_1, col_chart_2 = st.columns(2)
 
     with col_chart_1:
         st.subheader("Performance by Complexity")
-        if not df.empty:
-            chart_data = df.groupby("complexity")[["hit_rate", "mrr"]].mean()
+        if n_filtered:
+            chart_data = cube_means(cube, by="complexity")[["hit_rate", "mrr"]]
             st.bar_chart(chart_data)
         else:
             st.info("No data available for this filter.")
 
     with col_chart_2:
         st.subheader("Performance by Query Style")
-        if not df.empty:
-            chart_data_style = df.groupby("query_style")[["hit_rate", "mrr"]].mean()
+        if n_filtered:
+            chart_data_style = cube_means(cube, by="query_style")[["hit_rate", "mrr"]]
             st.bar_chart(chart_data_style)
         else:
             st.info("No data available for this filter.")
 
+    # C. Metrics at every cutoff k (one deep retrieval, evaluated at k = 1, 3, 5, 10...)
+    at_k_columns = [c for c in cube.columns if c.startswith('sum_') and '@' in c]
+    if n_filtered and at_k_columns:
+        st.subheader("Metrics by Cutoff k")
+        at_k = cube_means(cube)[[c[len('sum_'):] for c in at_k_columns]]
+        at_k.index = pd.MultiIndex.from_tuples(
+            [(m, int(k)) for m, k in (c.split('@') for c in at_k.index)], names=['metric', 'k']
+        )
+        st.line_chart(at_k.unstack('metric'))
+
+    # D. Per-group confidence intervals
+    if n_filtered:
+        with st.expander("95% confidence intervals by group"):
+            for dim, label in [('complexity', 'Complexity'), ('query_style', 'Query Style')]:
+                table = load_intervals(selected_run, selections, by=dim)
+                st.markdown(f"**{label}**")
+                st.dataframe(
+                    table.pivot(index=dim, columns='metric', values=['mean', 'ci_low', 'ci_high'])
+                    .swaplevel(axis=1).sort_index(axis=1).round(3),
+                    width=1500
+                )
+
 # ---------------------------------------------------------------------
 # TAB 2: TEST CASE EXPLORER
 # ---------------------------------------------------------------------
@@ -125,7 +237,15 @@ with tab2:
     st.subheader("Deep Dive: Individual Test Cases")
     st.caption("Click on any row to inspect the retrieval details.")
 
-    # 1. THE SELECTOR TABLE
+    # Rows are only needed here (one page at a time); the cube answers everything else
+    n_pages = max(1, -(-n_filtered // EXPLORER_PAGE_SIZE))
+    page = st.number_input(
+        f"Page (of {n_pages}, {EXPLORER_PAGE_SIZE} rows each)",
+        min_value=1, max_value=n_pages, value=1, key=f"explorer_page_{hash(selections)}"
+    ) - 1
+    df = load_explorer_page(selected_run, selections, page)
+
+    # 1. THE SELECTOR TABLE (only the current page is styled/rendered)
     display_cols = ['user_input', 'hit_rate', 'mrr', 'complexity']
     
     event = st.dataframe(
@@ -140,9 +260,15 @@ with tab2:
 
     # 2. THE DETAIL VIEW
     if len(event.selection['rows']) > 0:
-        # Get selected row index relative to the filtered dataframe
+        # Get selected row index relative to the current page
         selected_index = event.selection['rows'][0]
-        selected_row = df.iloc[selected_index]
+        page_row = df.iloc[selected_index]
+        # Long context columns are fetched for this row only
+        details = load_row_details(
+            selected_run, int(page_row.get('row_id', -1)), selections,
+            page * EXPLORER_PAGE_SIZE + selected_index
+        )
+        selected_row = pd.concat([page_row, details])
         
         st.divider()
         st.markdown(f"### Selected Query: _{selected_row['user_input']}_")
@@ -160,22 +286,22 @@ with tab2:
         # Comparison View
         c1, c2 = st.columns(2)
         
-        # --- LOGIC UPDATE: Robust Normalization & Substring Matching ---
-        def normalize_text(text):
-            """Must match the logic in evaluation.py"""
-            if not isinstance(text, str): return ""
-            text = text.lower()
-            text = text.replace('\n', ' ').replace('\r', '')
-            # Collapse multiple spaces
-            return re.sub(r'\s+', ' ', text).strip()
-
-        # Handle Ground Truth
-        gt_list = selected_row['reference_contexts']
-        if isinstance(gt_list, np.ndarray):
-            gt_list = gt_list.tolist()
-        
-        # We pre-calculate normalized GTs for comparison logic
-        gt_normalized_list = [normalize_text(x) for x in gt_list]
+        # --- Match details were stored by evaluation.py (no re-matching here) ---
+        def as_list(value):
+            if isinstance(value, np.ndarray):
+                return value.tolist()
+            return value if isinstance(value, list) else []
+
+        gt_list = as_list(selected_row['reference_contexts'])
+        retrieved_data = as_list(selected_row['retrieved_contexts'])
+        has_matches = 'match_mask' in selected_row.index and isinstance(
+            selected_row['match_mask'], (list, np.ndarray)
+        )
+        match_mask = as_list(selected_row['match_mask']) if has_matches else []
+        matched_gts = set(as_list(selected_row['matched_gt_indices'])) if has_matches else set()
+        scores = as_list(selected_row.get('retrieved_scores'))
+        if not has_matches:
+            st.caption("This run has no stored match details; re-run evaluation.py to see ✅/❌.")
 
         with c1:
             st.info("**Expected Contexts (Ground Truth)**")
@@ -183,35 +309,80 @@ with tab2:
                 st.write("No ground truth available.")
             else:
                 for i, ctx in enumerate(gt_list):
-                    st.markdown(f"**{i+1}.** {ctx}")
+                    badge = ("✅ " if i in matched_gts else "❌ ") if has_matches else ""
+                    st.markdown(f"{badge}**{i+1}.** {ctx}")
                     st.markdown("---")
 
         with c2:
             st.success("**Retrieved Contexts (System Output)**")
             
-            retrieved_data = selected_row['retrieved_contexts']
-            if isinstance(retrieved_data, np.ndarray):
-                retrieved_data = retrieved_data.tolist()
-            
             if len(retrieved_data) == 0:
                 st.warning("No contexts retrieved.")
             else:
                 for i, ctx in enumerate(retrieved_data):
-                    ctx_str = str(ctx)
-                    cleaned_retrieval = normalize_text(ctx_str)
-                    
-                    # --- CRITICAL CHANGE: Check for Substring Containment ---
-                    # We check if this retrieved chunk exists INSIDE any of the GT chunks
-                    is_match = False
-                    for gt_clean in gt_normalized_list:
-                        if cleaned_retrieval in gt_clean:
-                            is_match = True
-                            break
-                    
-                    if is_match:
-                        st.markdown(f"✅ **{i+1}.** {ctx_str}")
+                    if has_matches:
+                        badge = "✅ " if match_mask[i] else "❌ "
                     else:
-                        st.markdown(f"❌ **{i+1}.** {ctx_str}")
+                        badge = ""
+                    score = f" _(score {scores[i]:.3f})_" if i < len(scores) and pd.notna(scores[i]) else ""
+                    st.markdown(f"{badge}**{i+1}.**{score} {ctx}")
                     st.markdown("---")
     else:
-        st.info("Select a row in the table above to view details.")
\ No newline at end of file
+        st.info("Select a row in the table above to view details.")
+
+# ---------------------------------------------------------------------
+# TAB 3: RUN COMPARISON
+# ---------------------------------------------------------------------
+with tab3:
+    st.subheader("Compare Two Runs")
+    st.caption("Per-query rank of the first correct context and metric deltas (B - A).")
+
+    if len(run_ids) < 2:
+        st.info("At least two stored runs are needed for a comparison.")
+    else:
+        cc1, cc2 = st.columns(2)
+        run_a = cc1.selectbox("Run A (baseline)", run_ids, index=1)
+        run_b = cc2.selectbox("Run B (candidate)", run_ids, index=0)
+
+        # Only the columns needed for the comparison are read from the two partitions
+        compare_cols = ('run_id', 'user_input', 'hit_rate', 'mrr', 'precision', 'recall')
+        df_compare = load_data((run_a, run_b), compare_cols)
+
+        def per_query(run):
+            # Same question may appear under several personas: average it
+            return (df_compare[df_compare['run_id'] == run]
+                    .groupby('user_input')[['hit_rate', 'mrr', 'precision', 'recall']].mean())
+
+        merged = per_query(run_a).join(per_query(run_b), how='inner', lsuffix='_a', rsuffix='_b')
+
+        if merged.empty:
+            st.warning("The selected runs have no queries in common.")
+        else:
+            # MRR = 1 / rank of the first correct context, so the rank is recoverable
+            for side in ('a', 'b'):
+                mrr = merged[f'mrr_{side}']
+                merged[f'rank_{side}'] = np.where(mrr > 0, np.round(1 / mrr.where(mrr > 0, 1)), np.nan)
+            for metric in ('hit_rate', 'mrr', 'precision', 'recall'):
+                merged[f'delta_{metric}'] = merged[f'{metric}_b'] - merged[f'{metric}_a']
+
+            k1, k2, k3, k4 = st.columns(4)
+            k1.metric("Δ Hit Rate", f"{merged['delta_hit_rate'].mean():+.1%}")
+            k2.metric("Δ MRR", f"{merged['delta_mrr'].mean():+.3f}")
+            k3.metric("Δ Recall", f"{merged['delta_recall'].mean():+.1%}")
+            k4.metric("Δ Precision", f"{merged['delta_precision'].mean():+.1%}")
+
+            improved = int((merged['delta_mrr'] > 0).sum())
+            regressed = int((merged['delta_mrr'] < 0).sum())
+            st.caption(f"{len(merged)} common queries | ⬆️ {improved} improved | ⬇️ {regressed} regressed (by MRR)")
+
+            table = merged.reset_index()[[
+                'user_input', 'rank_a', 'rank_b', 'delta_mrr', 'delta_recall', 'delta_hit_rate'
+            ]].sort_values('delta_mrr')
+            st.dataframe(
+                table.style.format({
+                    'rank_a': '{:.0f}', 'rank_b': '{:.0f}',
+                    'delta_mrr': '{:+.2f}', 'delta_recall': '{:+.2f}', 'delta_hit_rate': '{:+.0f}'
+                }, na_rep='—'),
+                hide_index=True,
+                height=400
+            )
@@ -0,0 +1,124 @@
+"""
+Paired significance test between two stored evaluation runs.
+
+Queries are aligned by user_input (duplicates, e.g. the same question under
+several personas, are averaged first). For each metric, overall and per
+complexity / query style, it reports the mean difference B - A with a paired
+bootstrap CI, a sign-flip permutation p-value and Cohen's d_z.
+
+    python compare_runs.py                       # latest run (B) vs the one before (A)
+    python compare_runs.py RUN_A RUN_B --metrics mrr recall hit_rate ndcg@5
+    python compare_runs.py RUN_A RUN_B --fail-on-regression   # exit 1 on a significant drop
+"""
+import argparse
+import sys
+
+import pandas as pd
+
+from metric_stats import paired_comparison, N_RESAMPLES
+from results_store import RESULTS_DIR, list_runs, load_runs, run_columns, add_cube_dimensions
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+DEFAULT_METRICS = ['mrr', 'recall']
+GROUP_BY = ['complexity', 'query_style']
+ALPHA = 0.05
+
+
+def load_aligned(run_a, run_b, metrics, results_dir=RESULTS_DIR):
+    """One row per user_input present in BOTH runs: <metric>_a / <metric>_b + group columns."""
+    def per_query(run_id):
+        columns = ['user_input'] + metrics + [
+            c for c in ['synthesizer_name', 'query_style'] if c in run_columns(run_id, results_dir)
+        ]
+        df = add_cube_dimensions(load_runs([run_id], columns, results_dir=results_dir))
+        grouped = df.groupby('user_input', sort=False)
+        return grouped[metrics].mean().join(grouped[GROUP_BY].first())
+
+    a, b = per_query(run_a), per_query(run_b)
+    aligned = a.join(b[metrics], how='inner', lsuffix='_a', rsuffix='_b')
+    return aligned, len(a), len(b)
+
+
+def compare(aligned, metrics, n_resamples=N_RESAMPLES):
+    """Long frame: one row per (group, metric) with the paired_comparison results."""
+    rows = []
+    groups = [('overall', 'all', aligned)] + [
+        (dim, value, part) for dim in GROUP_BY for value, part in aligned.groupby(dim, sort=True)
+    ]
+    for dim, value, part in groups:
+        for metric in metrics:
+            result = paired_comparison(
+                part[f'{metric}_a'].to_numpy(), part[f'{metric}_b'].to_numpy(), n_resamples=n_resamples
+            )
+            rows.append({'group_by': dim, 'group': value, 'metric': metric, **result})
+    return pd.DataFrame(rows)
+
+
+def print_report(results, alpha):
+    print(f"{'group':<28}{'metric':<10}{'n':>7}{'A':>9}{'B':>9}{'B - A':>9}"
+          f"{'95% CI':>20}{'p':>9}{'d_z':>8}")
+    for _, r in results.iterrows():
+        flag = ""
+        if r['p_value'] < alpha:
+            flag = " ⬆️" if r['diff'] > 0 else " ⬇️"
+        label = "overall" if r['group_by'] == 'overall' else f"{r['group_by']}={r['group']}"
+        ci = f"[{r['ci_low']:+.4f}, {r['ci_high']:+.4f}]"
+        print(f"{label[:27]:<28}{r['metric']:<10}{r['n']:>7}{r['mean_a']:>9.4f}{r['mean_b']:>9.4f}"
+              f"{r['diff']:>+9.4f}{ci:>20}{r['p_value']:>9.4f}{r['effect_size']:>+8.3f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paired significance test between two evaluation runs.")
+    parser.add_argument("run_a", nargs="?", help="Baseline run_id (default: second latest run)")
+    parser.add_argument("run_b", nargs="?", help="Candidate run_id (default: latest run)")
+    parser.add_argument("--metrics", nargs="+", default=DEFAULT_METRICS,
+                        help="Metric columns, e.g. mrr recall hit_rate ndcg@5 recall@10")
+    parser.add_argument("--alpha", type=float, default=ALPHA)
+    parser.add_argument("--resamples", type=int, default=N_RESAMPLES,
+                        help="Bootstrap resamples / permutations per test.")
+    parser.add_argument("--results-dir", default=RESULTS_DIR)
+    parser.add_argument("--output", help="Also write the full results table (.csv or .parquet).")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with code 1 if any metric drops significantly overall (regression gate).")
+    args = parser.parse_args()
+
+    run_a, run_b = args.run_a, args.run_b
+    if run_a is None or run_b is None:
+        run_ids = [r['run_id'] for r in list_runs(args.results_dir)]
+        if len(run_ids) < 2:
+            print(f"❌ Need two runs in '{args.results_dir}' (found {len(run_ids)}).")
+            sys.exit(2)
+        run_a, run_b = run_a or run_ids[-2], run_b or run_ids[-1]
+
+    aligned, n_a, n_b = load_aligned(run_a, run_b, args.metrics, args.results_dir)
+    print(f"A (baseline):  {run_a} ({n_a} queries)")
+    print(f"B (candidate): {run_b} ({n_b} queries)")
+    print(f"Aligned by user_input: {len(aligned)} queries\n")
+    if aligned.empty:
+        print("❌ The runs have no queries in common.")
+        sys.exit(2)
+
+    results = compare(aligned, args.metrics, args.resamples)
+    print_report(results, args.alpha)
+
+    if args.output:
+        if args.output.endswith('.parquet'):
+            results.to_parquet(args.output, index=False)
+        else:
+            results.to_csv(args.output, index=False)
+        print(f"\n✅ Results saved to: {args.output}")
+
+    overall = results[results['group_by'] == 'overall']
+    regressions = overall[(overall['diff'] < 0) & (overall['p_value'] < args.alpha)]
+    if len(regressions):
+        print(f"\n⚠️ Significant regression (p < {args.alpha}): {', '.join(regressions['metric'])}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print(f"\n✅ No significant regression (p < {args.alpha}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,42 @@
+import os
 import boto3
-import pandas as pd
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 
+from retrieval_cache import RetrievalCache
+from testset_io import read_testset, write_testset
+from retrievers import BedrockKBRetriever, HashingEmbedder, LocalDenseRetriever, DEFAULT_INDEX_DIR
+from rate_limiter import RATE_LIMITER
+
 # --- CONFIGURATION ---
-PROFILE = 'sandbox'
+PROFILE = os.getenv('BEDROCK_PROFILE', 'sandbox') or None
 REGION = 'us-east-1'
 KB_ID = '3TPM53DPBN' 
-
-INPUT_CSV = 'testsets/ragas_testset_50.csv'
-OUTPUT_CSV = 'testset_with_clean_retrieval.csv'
-TOP_K = 3
+# Optional endpoint override, e.g. http://localhost:8787 for local_bedrock_server.py
+ENDPOINT_URL = os.getenv('BEDROCK_ENDPOINT_URL')
+
+# .parquet keeps list<string> columns; .csv is still accepted / available as export
+INPUT_FILE = 'testsets/ragas_testset_50.parquet'
+OUTPUT_FILE = 'testset_with_clean_retrieval.parquet'
+# Cutoffs studied by evaluation.py (hit@k, recall@k, nDCG@k, ...). Retrieval is
+# done ONCE at the deepest k; ranks and scores are kept, so every smaller k is
+# a prefix of the same result list (no extra API calls per k).
+K_VALUES = [1, 3, 5, 10]
+TOP_K = max(K_VALUES)
+
+# Max number of retrieve calls in flight at once (1 = serial, like before)
+MAX_CONCURRENCY = 8
+
+# Persistent cache of raw retrieve() responses (re-runs cost zero API calls)
+USE_RETRIEVAL_CACHE = True
+RETRIEVAL_CACHE_TTL = 7 * 24 * 3600  # seconds; None = never expire
+
+# Which retriever to evaluate: 'bedrock' (remote KB_ID) or 'local' (dense index,
+# build it first with: python retrievers.py build)
+RETRIEVER = 'bedrock'
+LOCAL_INDEX_DIR = DEFAULT_INDEX_DIR  # where 'python retrievers.py build' writes it (repo root)
+LOCAL_N_PROBE = 4  # IVF lists scanned per query (only if the index has IVF)
 # ---------------------
 
 def clean_chunk_text(full_content):
@@ -51,72 +77,129 @@ def clean_chunk_text(full_content):
         # If parsing fails fantastically, return original so we don't lose data
         return full_content
 
-def get_retrieved_contexts(client, query):
+def clean_results(results):
     """
-    Queries Bedrock KB, cleans the results, and returns a list of strings.
+    Applies clean_chunk_text to raw retrievalResults.
+    Returns (list of strings, list of scores), both in rank order.
     """
-    try:
-        response = client.retrieve(
-            knowledgeBaseId=KB_ID,
-            retrievalQuery={'text': query},
-            retrievalConfiguration={
-                'vectorSearchConfiguration': {'numberOfResults': TOP_K}
-            }
+    clean_chunks, scores = [], []
+    for item in results:
+        raw_text = item['content']['text']
+        # Apply the cleaning logic
+        cleaned_text = clean_chunk_text(raw_text)
+        clean_chunks.append(cleaned_text)
+        scores.append(item.get('score'))
+
+    return clean_chunks, scores
+
+def get_retrieved_contexts(retriever, query):
+    """
+    Queries the retriever (Bedrock KB or local index) at depth TOP_K, cleans
+    the results, and returns (contexts, scores) in rank order.
+    Errors are NOT swallowed here: the caller decides how to record them.
+    """
+    return clean_results(retriever.retrieve(query, TOP_K))
+
+def retrieve_all(retriever, queries, max_concurrency=MAX_CONCURRENCY):
+    """
+    Runs get_retrieved_contexts for every query using a thread pool
+    (boto3 clients are thread-safe) with at most `max_concurrency` calls in flight.
+    The local retriever answers all queries in batched matrix products instead.
+    Repeated queries (e.g. same user_input under different personas) are
+    retrieved only once.
+
+    Returns three lists aligned with `queries` (same order as the input):
+      - contexts: list of cleaned chunks per query ([] when the query failed)
+      - scores:   retriever score of each chunk (same order as contexts)
+      - errors:   None on success, or the error message for that query
+    """
+    unique_queries = list(dict.fromkeys(queries))
+    unique_contexts = {}
+    unique_errors = {}
+
+    if isinstance(retriever, LocalDenseRetriever):
+        batch_results = retriever.retrieve_batch(unique_queries, TOP_K)
+        unique_contexts = {q: clean_results(r) for q, r in zip(unique_queries, batch_results)}
+        return (
+            [unique_contexts[query][0] for query in queries],
+            [unique_contexts[query][1] for query in queries],
+            [None] * len(queries),
         )
-        
-        clean_chunks = []
-        if 'retrievalResults' in response:
-            for item in response['retrievalResults']:
-                raw_text = item['content']['text']
-                # Apply the cleaning logic
-                cleaned_text = clean_chunk_text(raw_text)
-                clean_chunks.append(cleaned_text)
-        
-        return clean_chunks
 
-    except Exception as e:
-        print(f"Error retrieving for query: {e}")
-        return []
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = {
+            executor.submit(get_retrieved_contexts, retriever, query): query
+            for query in unique_queries
+        }
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            query = futures[future]
+            try:
+                unique_contexts[query] = future.result()
+            except Exception as e:
+                unique_errors[query] = f"{type(e).__name__}: {e}"
+
+    contexts = [unique_contexts.get(query, ([], []))[0] for query in queries]
+    scores = [unique_contexts.get(query, ([], []))[1] for query in queries]
+    errors = [unique_errors.get(query) for query in queries]
+    return contexts, scores, errors
 
 def main():
-    # 1. Setup Session
-    session = boto3.Session(profile_name=PROFILE, region_name=REGION)
-    client = session.client('bedrock-agent-runtime')
-    
-    print(f"--- Loading dataset: {INPUT_CSV} ---")
+    print(f"--- Loading dataset: {INPUT_FILE} ---")
     
-    # 2. Read CSV
+    # 1. Read testset
     try:
-        df = pd.read_csv(INPUT_CSV)
+        df = read_testset(INPUT_FILE)
     except FileNotFoundError:
-        print("❌ Error: Input CSV file not found.")
+        print("❌ Error: Input testset file not found.")
         return
 
-    print(f"Loaded {len(df)} rows. Starting retrieval...")
-
-    # 3. Iterate and Retrieve
-    retrieved_contexts_column = []
-
-    for index, row in tqdm(df.iterrows(), total=df.shape[0]):
-        query = row['user_input']
-        
-        # Get the list of CLEANED strings
-        chunks_list = get_retrieved_contexts(client, query)
-        
-        retrieved_contexts_column.append(chunks_list)
-
-    # 4. Add new column
+    # 2. Setup Retriever
+    cache = None
+    if RETRIEVER == 'local':
+        retriever = LocalDenseRetriever(LOCAL_INDEX_DIR, HashingEmbedder(), n_probe=LOCAL_N_PROBE)
+    else:
+        session = boto3.Session(profile_name=PROFILE, region_name=REGION)
+        client = session.client('bedrock-agent-runtime', endpoint_url=ENDPOINT_URL)
+        RATE_LIMITER.instrument_client(client)  # Retrieve quota + throttle backoff (rate_limiter.py)
+        cache = RetrievalCache(ttl_seconds=RETRIEVAL_CACHE_TTL) if USE_RETRIEVAL_CACHE else None
+        retriever = BedrockKBRetriever(client, KB_ID, cache)
+
+    print(f"Loaded {len(df)} rows. Starting retrieval with '{retriever.name}' "
+          f"at k={TOP_K} (max {MAX_CONCURRENCY} in flight)...")
+
+    # 3. Retrieve concurrently (output order matches the input CSV)
+    queries = df['user_input'].tolist()
+    retrieved_contexts_column, scores_column, errors = retrieve_all(retriever, queries, MAX_CONCURRENCY)
+    if cache is not None:
+        print(f"Retrieval cache: {cache.hits} hits, {cache.misses} misses.")
+        cache.close()
+    RATE_LIMITER.print_report()
+
+    # 4. Add new columns (failures are recorded, not hidden as empty lists)
     df['retrieved_contexts'] = retrieved_contexts_column
-
-    # 5. Save to new CSV
-    df.to_csv(OUTPUT_CSV, index=False, encoding='utf-8')
+    df['retrieved_scores'] = scores_column
+    df['retrieval_error'] = errors
+
+    failed = sum(e is not None for e in errors)
+    if failed:
+        print(f"⚠️ {failed} of {len(df)} queries failed. See the 'retrieval_error' column.")
+
+    # 5. Save (list columns stay lists in parquet; retrieval settings go in the
+    #    file metadata so evaluation.py can label the run)
+    write_testset(df, OUTPUT_FILE, metadata={
+        'retriever': retriever.name,
+        'kb_id': KB_ID if RETRIEVER == 'bedrock' else None,
+        'top_k': TOP_K,
+        'k_values': K_VALUES,
+        'input_file': INPUT_FILE,
+    })
     
-    print(f"\n✅ Success! Saved to: {OUTPUT_CSV}")
+    print(f"\n✅ Success! Saved to: {OUTPUT_FILE}")
     
     # 6. Preview to verify formatting
     print("\n--- Formatting Check (First Item) ---")
     first_list = df['retrieved_contexts'].iloc[0]
-    if first_list:
+    if len(first_list) > 0:
         print(first_list[0])
     else:
         print("No results found for first item.")
@@ -1,18 +1,63 @@
 import pandas as pd
-import ast
+import numpy as np
 import re
 import os
+import json
+import hashlib
+from datetime import datetime
+import pyarrow.parquet as pq
+
+from testset_io import (
+    read_testset, write_testset, read_testset_metadata,
+    iter_testset_batches, to_arrow_table, stable_schema
+)
+from results_store import (
+    make_run_id, partition_file, register_run, list_runs, build_cube, merge_cubes, write_cube,
+    build_value_counts, merge_run_value_counts, write_value_counts, cube_means, load_runs
+)
+from metric_stats import bootstrap_table
+
+# Optional: Aho-Corasick automaton (pip install pyahocorasick).
+# Without it, containment_matrix falls back to plain substring checks.
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 # ==========================================
 # 1. CONFIGURATION
 # ==========================================
 CONFIG = {
-    "INPUT_FILENAME": "testset.csv",
-    "OUTPUT_FILENAME": "evaluations/testset_results.parquet",
+    # .parquet (list<string> columns) or legacy .csv
+    "INPUT_FILENAME": "testset.parquet",
+    # Append-only results store: one run_id=<id>/ partition per evaluation run
+    "RESULTS_DIR": "evaluations/runs",
     # Normalization helps ignore extra spaces or newlines when comparing substring
     "TEXT_NORMALIZATION": True, 
+    # Streaming mode: read/evaluate/write in batches (constant memory for huge files)
+    "STREAMING": False,
+    # (also the Parquet row group size, so the dashboard can skip row groups)
+    "STREAM_BATCH_ROWS": 50_000,
+    # Incremental mode: reuse metrics of unchanged rows from the latest stored run
+    # (in streaming mode only each batch's rows are looked up, memory stays bounded)
+    "INCREMENTAL": True,
+    # Cutoffs for hit@k / recall@k / precision@k / MRR@k / nDCG@k, all computed
+    # from one deep retrieval (eval_set_generator retrieves max(K_VALUES) once)
+    "K_VALUES": [1, 3, 5, 10],
+    # Rows whose retrieval failed (eval_set_generator's retrieval_error column) have no
+    # contexts to score: they are left out of the metrics and counted in the manifest.
+    # Above this share of failed rows the run is not saved at all
+    "MAX_RETRIEVAL_ERROR_RATE": 0.05,
 }
 
+# Bump when the metric logic changes, so previously stored row hashes stop matching
+METRICS_VERSION = 3
+AT_K_METRICS = ['hit_rate', 'mrr', 'precision', 'recall', 'ndcg']
+METRIC_COLUMNS = [
+    'hit_rate', 'mrr', 'precision', 'recall', 'retrieved_count', 'gt_count',
+    'match_mask', 'matched_gt_indices',
+] + [f'{m}@{k}' for k in CONFIG["K_VALUES"] for m in AT_K_METRICS]
+
 # ==========================================
 # 2. HELPER FUNCTIONS
 # ==========================================
@@ -34,17 +79,6 @@ def clean_text(text):
         
     return text
 
-def parse_list_column(data):
-    """
-    Safely parses a stringified list (e.g., "['a', 'b']") into a Python list.
-    """
-    try:
-        if isinstance(data, list):
-            return data
-        return ast.literal_eval(data)
-    except (ValueError, SyntaxError):
-        return []
-
 def is_match(retrieved_item, ground_truths):
     """
     CRITICAL LOGIC CHANGE:
@@ -57,111 +91,516 @@ def is_match(retrieved_item, ground_truths):
             return True
     return False
 
-def compute_metrics(row):
+def containment_matrix(retrieved_items, ground_truths):
     """
-    Calculates retrieval metrics for a single row using Substring Matching.
+    Builds the full R x G containment matrix in a single pass:
+    matrix[i, j] is True if retrieved_items[i] is found INSIDE ground_truths[j]
+    (same rule as is_match).
+
+    With pyahocorasick, one automaton is built over the retrieved items and each
+    ground truth is scanned once, instead of R x G separate substring searches.
+    Duplicate retrieved items are only searched once.
     """
-    # 1. Parse and Normalize Ground Truths
-    gt_raw = row.get('reference_contexts', [])
-    gt_normalized = [clean_text(txt) for txt in gt_raw]
-    
-    # 2. Parse and Normalize Retrieved Contexts
-    ret_raw = row.get('retrieved_contexts', [])
-    ret_normalized = [clean_text(txt) for txt in ret_raw]
-    
-    # If no retrieval or no GT, return zeros (avoid division by zero)
-    if not ret_normalized or not gt_normalized:
-        return pd.Series({
-            'hit_rate': 0, 'mrr': 0.0, 'precision': 0.0, 'recall': 0.0,
-            'retrieved_count': len(ret_normalized), 'gt_count': len(gt_normalized)
-        })
-
-    # --- METRIC CALCULATIONS ---
-    
-    # Identify which retrieved items are "relevant" (matches)
-    # Result is a list of Booleans: [True, False, True]
-    matches_mask = [is_match(ctx, gt_normalized) for ctx in ret_normalized]
-    
-    total_matches = sum(matches_mask)
+    matrix = np.zeros((len(retrieved_items), len(ground_truths)), dtype=bool)
+    if matrix.size == 0:
+        return matrix
+
+    # Map each distinct retrieved text to the rows where it appears
+    rows_by_text = {}
+    for i, item in enumerate(retrieved_items):
+        rows_by_text.setdefault(item, []).append(i)
+
+    # An empty string is "inside" every ground truth (Python `in` semantics)
+    if "" in rows_by_text:
+        matrix[rows_by_text.pop(""), :] = True
+
+    if ahocorasick is not None and rows_by_text:
+        automaton = ahocorasick.Automaton()
+        for text, rows in rows_by_text.items():
+            automaton.add_word(text, rows)
+        automaton.make_automaton()
+        for j, gt in enumerate(ground_truths):
+            for _, rows in automaton.iter(gt):
+                matrix[rows, j] = True
+    else:
+        for text, rows in rows_by_text.items():
+            for j, gt in enumerate(ground_truths):
+                if text in gt:
+                    matrix[rows, j] = True
+
+    return matrix
+
+def build_match_arrays(reference_lists, retrieved_lists):
+    """
+    Normalizes every row and flattens the per-row containment matrices into
+    ragged NumPy arrays (values + offsets), one entry per retrieved item / GT:
+
+      ret_match    bool [total_retrieved]  retrieved item is inside ANY GT
+      ret_offsets  int  [n_rows + 1]       row i owns ret_match[ret_offsets[i]:ret_offsets[i+1]]
+      gt_covered   bool [total_gt]         GT contains ANY retrieved item
+      gt_first_rank float [total_gt]       rank of the best retrieved item inside the GT (inf = none)
+      gt_offsets   int  [n_rows + 1]
+
+    This is the only per-row (string) work; all metrics are reductions over these arrays.
+    """
+    ret_match, gt_first_rank = [], []
+    ret_counts = np.zeros(len(retrieved_lists), dtype=np.int64)
+    gt_counts = np.zeros(len(reference_lists), dtype=np.int64)
+
+    for i, (gt_raw, ret_raw) in enumerate(zip(reference_lists, retrieved_lists)):
+        gt_normalized = [clean_text(txt) for txt in gt_raw]
+        ret_normalized = [clean_text(txt) for txt in ret_raw]
+        matrix = containment_matrix(ret_normalized, gt_normalized)
+        ret_match.append(matrix.any(axis=1))
+        first_rank = np.full(matrix.shape[1], np.inf)
+        if matrix.shape[0]:
+            first_rank[matrix.any(axis=0)] = matrix.argmax(axis=0)[matrix.any(axis=0)] + 1.0
+        gt_first_rank.append(first_rank)
+        ret_counts[i] = len(ret_normalized)
+        gt_counts[i] = len(gt_normalized)
+
+    gt_first_rank = np.concatenate(gt_first_rank) if gt_first_rank else np.zeros(0)
+    return {
+        'ret_match': np.concatenate(ret_match) if ret_match else np.zeros(0, dtype=bool),
+        'ret_offsets': np.concatenate([[0], np.cumsum(ret_counts)]),
+        'gt_covered': np.isfinite(gt_first_rank),
+        'gt_first_rank': gt_first_rank,
+        'gt_offsets': np.concatenate([[0], np.cumsum(gt_counts)]),
+    }
+
+def segment_sum(values, offsets):
+    """Sum of values[offsets[i]:offsets[i+1]] for every row (empty rows -> 0)."""
+    dtype = np.float64 if np.asarray(values).dtype.kind == 'f' else np.int64
+    cumulative = np.concatenate([[0], np.cumsum(values, dtype=dtype)])
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+def metrics_from_arrays(arrays):
+    """
+    Vectorized Hit Rate / MRR / Precision / Recall from the ragged match arrays.
+    Pure NumPy reductions: ~1M rows (k=3) take well under a second here; the
+    end-to-end cost is dominated by text normalization in build_match_arrays.
+    """
+    ret_match, ret_offsets = arrays['ret_match'], arrays['ret_offsets']
+    gt_covered, gt_offsets = arrays['gt_covered'], arrays['gt_offsets']
+
+    ret_counts = np.diff(ret_offsets)
+    gt_counts = np.diff(gt_offsets)
+    # Rows without retrieval or without GT score zero (avoid division by zero)
+    valid = (ret_counts > 0) & (gt_counts > 0)
+
+    total_matches = segment_sum(ret_match, ret_offsets)
+    covered_gts = segment_sum(gt_covered, gt_offsets)
 
     # A. HIT RATE (Did we find at least one correct answer?)
-    hit_rate = 1 if total_matches > 0 else 0
-    
+    hit_rate = ((total_matches > 0) & valid).astype(np.int64)
+
     # B. PRECISION (% of retrieved items that are correct)
-    precision = total_matches / len(ret_normalized)
+    precision = np.where(valid, total_matches / np.maximum(ret_counts, 1), 0.0)
 
     # C. RECALL (How many of the GTs did we find?)
-    # Note: Logic assumes if we matched a GT, we found it. 
-    # Since we use substring, we check how many unique GTs were covered by our retrievals.
-    covered_gts = 0
-    for gt in gt_normalized:
-        # Check if this specific GT was covered by ANY retrieval
-        found = False
-        for ret in ret_normalized:
-            if ret in gt:
-                found = True
-                break
-        if found:
-            covered_gts += 1
-            
-    recall = covered_gts / len(gt_normalized)
+    recall = np.where(valid, covered_gts / np.maximum(gt_counts, 1), 0.0)
 
     # D. MEAN RECIPROCAL RANK (MRR)
-    # Score based on the rank of the *first* correct match.
-    mrr = 0.0
-    for i, is_correct in enumerate(matches_mask):
-        if is_correct:
-            mrr = 1 / (i + 1)
-            break 
-
-    return pd.Series({
+    # Rank of each retrieved item inside its row; the max of match/rank per row
+    # is exactly 1/rank of the *first* correct match.
+    ranks = np.arange(len(ret_match)) - np.repeat(ret_offsets[:-1], ret_counts) + 1
+    reciprocal = np.where(ret_match, 1.0 / ranks, 0.0)
+    mrr = np.zeros(len(ret_counts))
+    non_empty = ret_counts > 0
+    if non_empty.any():
+        mrr[non_empty] = np.maximum.reduceat(reciprocal, ret_offsets[:-1][non_empty])
+    mrr = np.where(valid, mrr, 0.0)
+
+    return pd.DataFrame({
         'hit_rate': hit_rate,
         'mrr': mrr,
         'precision': precision,
         'recall': recall,
-        'retrieved_count': len(ret_normalized),
-        'gt_count': len(gt_normalized)
+        'retrieved_count': ret_counts,
+        'gt_count': gt_counts,
+    })
+
+def metrics_at_k(arrays, k_values):
+    """
+    hit@k, MRR@k, precision@k, recall@k and nDCG@k for every cutoff in one pass
+    over the rank arrays (retrieved items keep their retrieval order):
+      - precision@k divides by min(k, retrieved), so shallow result lists are not penalised
+      - recall@k counts the GTs whose best containing item is ranked <= k
+      - nDCG@k uses binary gains discounted by 1/log2(rank + 1); the ideal list
+        holds min(k, max(#GT, matches@k)) relevant items, so nDCG stays <= 1
+        when several chunks fall inside the same GT
+    """
+    ret_match, ret_offsets = arrays['ret_match'], arrays['ret_offsets']
+    gt_first_rank, gt_offsets = arrays['gt_first_rank'], arrays['gt_offsets']
+
+    ret_counts = np.diff(ret_offsets)
+    gt_counts = np.diff(gt_offsets)
+    valid = (ret_counts > 0) & (gt_counts > 0)
+
+    ranks = np.arange(len(ret_match)) - np.repeat(ret_offsets[:-1], ret_counts) + 1
+    first_match = np.full(len(ret_counts), np.inf)
+    non_empty = ret_counts > 0
+    if non_empty.any():
+        first_match[non_empty] = np.minimum.reduceat(
+            np.where(ret_match, ranks, np.inf), ret_offsets[:-1][non_empty]
+        )
+    discount = 1.0 / np.log2(ranks + 1.0)
+    # ideal_dcg[n] = DCG of n relevant items at ranks 1..n
+    ideal_dcg = np.concatenate([[0.0], np.cumsum(1.0 / np.log2(np.arange(2, max(k_values) + 2)))])
+
+    columns = {}
+    for k in k_values:
+        in_top = ret_match & (ranks <= k)
+        matches = segment_sum(in_top, ret_offsets)
+        dcg = segment_sum(np.where(in_top, discount, 0.0), ret_offsets)
+        n_ideal = np.minimum(k, np.maximum(gt_counts, matches))
+
+        columns[f'hit_rate@{k}'] = ((matches > 0) & valid).astype(np.int64)
+        columns[f'mrr@{k}'] = np.where(valid & (first_match <= k), 1.0 / first_match, 0.0)
+        columns[f'precision@{k}'] = np.where(valid, matches / np.maximum(np.minimum(ret_counts, k), 1), 0.0)
+        columns[f'recall@{k}'] = np.where(
+            valid, segment_sum(gt_first_rank <= k, gt_offsets) / np.maximum(gt_counts, 1), 0.0
+        )
+        columns[f'ndcg@{k}'] = np.where(
+            valid & (n_ideal > 0), dcg / np.maximum(ideal_dcg[n_ideal], 1e-12), 0.0
+        )
+    return pd.DataFrame(columns)
+
+def match_columns(arrays):
+    """
+    Per-row match details stored next to the metrics, so the dashboard can show
+    ✅/❌ without re-running the matching:
+      match_mask          list<bool> aligned with retrieved_contexts
+      matched_gt_indices  list<int>  positions in reference_contexts that were found
+    """
+    gt_covered, gt_offsets = arrays['gt_covered'], arrays['gt_offsets']
+    n_rows = len(gt_offsets) - 1  # np.split always returns >= 1 piece; trim for 0 rows
+    gt_positions = np.arange(len(gt_covered)) - np.repeat(gt_offsets[:-1], np.diff(gt_offsets))
+    covered_positions = np.where(gt_covered, gt_positions, -1)
+    return pd.DataFrame({
+        'match_mask': [
+            m.tolist() for m in np.split(arrays['ret_match'], arrays['ret_offsets'][1:-1])[:n_rows]
+        ],
+        'matched_gt_indices': [
+            p[p >= 0].tolist() for p in np.split(covered_positions, gt_offsets[1:-1])[:n_rows]
+        ],
     })
 
+def compute_metrics_batch(df):
+    """
+    Calculates retrieval metrics for the whole dataset using Substring Matching.
+    Returns a columnar frame aligned with df's index.
+    """
+    arrays = build_match_arrays(df['reference_contexts'], df['retrieved_contexts'])
+    metrics_df = pd.concat([
+        metrics_from_arrays(arrays),
+        metrics_at_k(arrays, CONFIG["K_VALUES"]),
+        match_columns(arrays),
+    ], axis=1)
+    metrics_df.index = df.index
+    return metrics_df
+
+def compute_metrics(row):
+    """
+    Calculates retrieval metrics for a single row (thin wrapper over the batch engine).
+    """
+    arrays = build_match_arrays(
+        [row.get('reference_contexts', [])], [row.get('retrieved_contexts', [])]
+    )
+    return metrics_from_arrays(arrays).iloc[0]
+
+def row_hashes(df):
+    """
+    One content hash per row over (normalized reference contexts, normalized
+    retrieved contexts, normalization + K_VALUES config, METRICS_VERSION).
+    Equal hash => the stored metrics for that row are still valid.
+    """
+    config = {
+        "TEXT_NORMALIZATION": CONFIG["TEXT_NORMALIZATION"],
+        "K_VALUES": CONFIG["K_VALUES"],
+        "METRICS_VERSION": METRICS_VERSION,
+    }
+    hashes = []
+    for gt_raw, ret_raw in zip(df['reference_contexts'], df['retrieved_contexts']):
+        payload = json.dumps(
+            [config, [clean_text(t) for t in gt_raw], [clean_text(t) for t in ret_raw]],
+            ensure_ascii=False
+        )
+        hashes.append(hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest())
+    return pd.Series(hashes, index=df.index, dtype=object)
+
+def previous_run(results_dir):
+    """run_id of the latest stored run if its metrics can be reused, else None."""
+    runs = list_runs(results_dir)
+    if not CONFIG["INCREMENTAL"] or not runs:
+        return None
+    run_id = runs[-1]['run_id']
+    columns = ['row_hash'] + METRIC_COLUMNS
+    if not set(columns).issubset(pq.read_schema(partition_file(run_id, results_dir)).names):
+        return None
+    return run_id
+
+def load_previous_index(run_id, results_dir):
+    """
+    row_hash -> row position in a stored run. Only the row_hash column is read,
+    once, so streaming batches can find their rows without rescanning the run.
+    """
+    if run_id is None:
+        return None
+    hashes = pq.read_table(partition_file(run_id, results_dir), columns=['row_hash']).column('row_hash')
+    positions = pd.Series(np.arange(len(hashes)), index=hashes.to_numpy(zero_copy_only=False))
+    return positions[~positions.index.duplicated()]
+
+def load_previous_metrics(run_id, results_dir, hashes=None, index=None):
+    """
+    Reads only the row_hash + metric columns of a stored run, indexed by row_hash.
+    With `hashes` and the run's `index` (load_previous_index), only the row groups
+    holding those rows are read: one batch's worth in memory.
+    """
+    if run_id is None:
+        return None
+    columns = ['row_hash'] + METRIC_COLUMNS
+    if hashes is None:
+        previous = load_runs([run_id], columns=columns, results_dir=results_dir)
+        return previous.drop_duplicates('row_hash').set_index('row_hash')
+
+    positions = np.sort(index.reindex(hashes).dropna().to_numpy(dtype=np.int64))
+    if not len(positions):
+        return None
+    parquet = pq.ParquetFile(partition_file(run_id, results_dir))
+    group_rows = [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)]
+    starts = np.concatenate([[0], np.cumsum(group_rows)])
+    row_group = np.searchsorted(starts, positions, side='right') - 1
+    groups, slot = np.unique(row_group, return_inverse=True)
+    # Position of each row inside the concatenation of the row groups read
+    offsets = np.concatenate([[0], np.cumsum(np.diff(starts)[groups])[:-1]])
+    table = parquet.read_row_groups(groups.tolist(), columns=columns)
+    previous = table.take(positions - starts[row_group] + offsets[slot]).to_pandas()
+    return previous.set_index('row_hash')
+
+def compute_metrics_incremental(df, previous, hashes=None):
+    """
+    Like compute_metrics_batch, but rows whose hash is in `previous` reuse the
+    stored metrics; only new/changed rows are evaluated.
+    Returns (metrics_df with a row_hash column, number of reused rows).
+    """
+    if hashes is None:
+        hashes = row_hashes(df)
+    if previous is None:
+        metrics_df = compute_metrics_batch(df)
+        reused = 0
+    else:
+        known = hashes.isin(previous.index).to_numpy()
+        reused_df = previous.loc[hashes[known]].set_axis(df.index[known])
+        fresh_df = compute_metrics_batch(df[~known])
+        metrics_df = pd.concat([reused_df, fresh_df]).loc[df.index]
+        reused = int(known.sum())
+
+    metrics_df['row_hash'] = hashes
+    return metrics_df, reused
+
+def drop_failed_retrievals(df):
+    """(rows whose retrieval succeeded, without the retrieval_error column, number of failed rows)."""
+    if 'retrieval_error' not in df.columns:
+        return df, 0
+    failed = df['retrieval_error'].notna().to_numpy()
+    return df[~failed].drop(columns='retrieval_error').reset_index(drop=True), int(failed.sum())
+
+def too_many_retrieval_errors(failed, total):
+    """Prints the failed-retrieval count; True if it is above MAX_RETRIEVAL_ERROR_RATE."""
+    if not failed:
+        return False
+    rate = failed / max(total, 1)
+    if rate > CONFIG['MAX_RETRIEVAL_ERROR_RATE']:
+        print(f"❌ Error: {failed} of {total} retrievals failed ({rate:.1%} > "
+              f"{CONFIG['MAX_RETRIEVAL_ERROR_RATE']:.0%}). Re-run eval_set_generator.py; no run saved.")
+        return True
+    print(f"⚠️ {failed} of {total} retrievals failed; those rows are left out of the metrics.")
+    return False
+
 # ==========================================
 # 3. MAIN EXECUTION FLOW
 # ==========================================
 
-def main():
-    # Ensure output directory exists
-    os.makedirs(os.path.dirname(CONFIG['OUTPUT_FILENAME']), exist_ok=True)
+def print_summary(counts):
+    """
+    Means with 95% bootstrap CIs (from the metric value counts), overall and
+    per complexity / query style. Returns the overall means.
+    """
+    if counts.empty:
+        print("\n--- Evaluation Summary ---\nNo rows evaluated.")
+        return {}
+    overall = bootstrap_table(counts).set_index('metric')
+    formats = {'hit_rate': '{:.2%}', 'mrr': '{:.4f}', 'precision': '{:.2%}', 'recall': '{:.2%}'}
+    labels = {'hit_rate': 'Hit Rate:', 'mrr': 'MRR:', 'precision': 'Precision:', 'recall': 'Recall:'}
+
+    def fmt(metric, r):
+        f = formats[metric]
+        return f"{f.format(r['mean'])} [{f.format(r['ci_low'])}, {f.format(r['ci_high'])}]"
 
+    print("\n--- Evaluation Summary (95% bootstrap CI) ---")
+    for metric in formats:
+        print(f"Average {labels[metric]:<11}{fmt(metric, overall.loc[metric])}")
+
+    for dim in ['complexity', 'query_style']:
+        print(f"\nBy {dim}:")
+        table = bootstrap_table(counts, by=dim)
+        for group, rows in table.groupby(dim, sort=True):
+            rows = rows.set_index('metric')
+            print(f"  {group} (n={rows['n'].iloc[0]}): "
+                  f"Hit Rate {fmt('hit_rate', rows.loc['hit_rate'])} | MRR {fmt('mrr', rows.loc['mrr'])}")
+
+    return overall['mean'].to_dict()
+
+def print_metrics_at_k(cube):
+    """One line per cutoff k (means from the cube, so it works in streaming mode too)."""
+    means = cube_means(cube) if int(cube['count'].sum()) else None
+    if means is None or not any('@' in m for m in means.index):
+        return
+    print("\n--- Metrics by cutoff k ---")
+    print(f"{'k':>4}{'Hit Rate':>11}{'MRR':>9}{'Precision':>11}{'Recall':>9}{'nDCG':>9}")
+    for k in CONFIG["K_VALUES"]:
+        if f'hit_rate@{k}' in means.index:
+            print(f"{k:>4}{means[f'hit_rate@{k}']:>11.2%}{means[f'mrr@{k}']:>9.4f}"
+                  f"{means[f'precision@{k}']:>11.2%}{means[f'recall@{k}']:>9.2%}{means[f'ndcg@{k}']:>9.4f}")
+
+def evaluate_streaming(input_path, output_path, batch_rows, previous_run_id=None):
+    """
+    Bounded-memory evaluation: reads the input in record batches, computes the
+    metrics per batch and appends each batch as a row group with a ParquetWriter
+    (row_id keeps counting across batches).
+    Rows with a retrieval_error are skipped (counted, not scored).
+    Only the small per-batch cubes / metric value counts are kept for the summary;
+    reusable metrics of `previous_run_id` are looked up per batch in its row hash
+    index (read once) and only the row groups holding them are read.
+    """
+    rows = reused = failed = 0
+    cubes, counts = [], []
+    writer = None
+    previous_index = load_previous_index(previous_run_id, CONFIG['RESULTS_DIR'])
+
+    try:
+        for df in iter_testset_batches(input_path, batch_rows):
+            df, batch_failed = drop_failed_retrievals(df)
+            failed += batch_failed
+            if df.empty:
+                continue
+            hashes = row_hashes(df)
+            previous = load_previous_metrics(previous_run_id, CONFIG['RESULTS_DIR'],
+                                             hashes.unique(), previous_index)
+            metrics_df, batch_reused = compute_metrics_incremental(df, previous, hashes)
+            reused += batch_reused
+            batch_df = pd.concat([df, metrics_df], axis=1)
+            batch_df.insert(0, 'row_id', np.arange(rows, rows + len(df)))
+            table = to_arrow_table(batch_df)
+            cubes.append(build_cube(batch_df))
+            counts.append(build_value_counts(batch_df))
+
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, stable_schema(table.schema))
+            writer.write_table(table.cast(writer.schema))
+
+            rows += len(df)
+            print(f"  ...{rows} rows evaluated")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if previous_run_id is not None:
+        print(f"Incremental: reused {reused} rows, evaluated {rows - reused}.")
+    return rows, failed, merge_cubes(cubes), merge_run_value_counts(counts)
+
+def save_run(run_id, run_config, tmp_path, rows, means, cube, counts, retrieval_errors=0):
+    """Publishes a finished run: aggregates + atomic rename into its partition + manifest entry."""
+    write_cube(cube, run_id, CONFIG['RESULTS_DIR'])
+    write_value_counts(counts, run_id, CONFIG['RESULTS_DIR'])
+    output_path = partition_file(run_id, CONFIG['RESULTS_DIR'])
+    os.replace(tmp_path, output_path)
+    register_run({
+        'run_id': run_id,
+        **run_config,
+        'rows': rows,
+        'retrieval_errors': retrieval_errors,
+        **{f'avg_{k}': v for k, v in means.items()},
+    }, CONFIG['RESULTS_DIR'])
+    print(f"\n✅ {rows} results saved to: {output_path}")
+    print(f"   run_id: {run_id}")
+    print("Ready for Streamlit.")
+
+def discard_run(run_dir, tmp_path):
+    """Removes an unfinished run's temp file and (now empty) partition directory."""
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    if not os.listdir(run_dir):
+        os.rmdir(run_dir)
+
+def main():
     print(f"Loading data from: {CONFIG['INPUT_FILENAME']}...")
     
     if not os.path.exists(CONFIG['INPUT_FILENAME']):
         print(f"❌ Error: File {CONFIG['INPUT_FILENAME']} not found.")
         return
 
-    # Load Data
-    df = pd.read_csv(CONFIG['INPUT_FILENAME'])
-    print(f"Processing {len(df)} rows...")
+    # Describe the run (retriever / KB / top-k come from eval_set_generator's metadata)
+    created_at = datetime.now()
+    run_config = {
+        'kb_id': None, 'top_k': None, 'retriever': None,
+        **read_testset_metadata(CONFIG['INPUT_FILENAME']),
+        'input_file': CONFIG['INPUT_FILENAME'],
+        'text_normalization': CONFIG['TEXT_NORMALIZATION'],
+        'created_at': created_at.isoformat(timespec='seconds'),
+    }
+    run_id = make_run_id(run_config, created_at)
+    while os.path.exists(partition_file(run_id, CONFIG['RESULTS_DIR'])):
+        run_id += '-x'
+    # Written under a hidden name first, renamed once complete
+    run_dir = os.path.dirname(partition_file(run_id, CONFIG['RESULTS_DIR']))
+    os.makedirs(run_dir, exist_ok=True)
+    tmp_path = os.path.join(run_dir, '.tmp-part.parquet')
 
-    # Step 1: Ensure columns are Lists (not strings)
-    df['reference_contexts'] = df['reference_contexts'].apply(parse_list_column)
-    df['retrieved_contexts'] = df['retrieved_contexts'].apply(parse_list_column)
+    previous_run_id = previous_run(CONFIG['RESULTS_DIR'])
 
-    # Step 2: Calculate Metrics
-    metrics_df = df.apply(compute_metrics, axis=1)
+    if CONFIG["STREAMING"]:
+        print(f"Streaming in batches of {CONFIG['STREAM_BATCH_ROWS']} rows...")
+        rows, failed, cube, counts = evaluate_streaming(
+            CONFIG['INPUT_FILENAME'], tmp_path, CONFIG['STREAM_BATCH_ROWS'], previous_run_id
+        )
+        if too_many_retrieval_errors(failed, rows + failed):
+            discard_run(run_dir, tmp_path)
+            return
+        means = print_summary(counts)
+        print_metrics_at_k(cube)
+        save_run(run_id, run_config, tmp_path, rows, means, cube, counts, failed)
+        return
+
+    # Load Data (list columns come back as lists, no string parsing for parquet)
+    df = read_testset(CONFIG['INPUT_FILENAME'])
+    df, failed = drop_failed_retrievals(df)
+    if too_many_retrieval_errors(failed, len(df) + failed):
+        discard_run(run_dir, tmp_path)
+        return
+    print(f"Processing {len(df)} rows...")
+
+    # Step 1: Calculate Metrics (only for new/changed rows in incremental mode)
+    previous = load_previous_metrics(previous_run_id, CONFIG['RESULTS_DIR'])
+    metrics_df, reused = compute_metrics_incremental(df, previous)
+    if previous is not None:
+        print(f"Incremental: reused {reused} rows, evaluated {len(df) - reused}.")
     
-    # Step 3: Combine Original Data with Metrics
+    # Step 2: Combine Original Data with Metrics
     final_df = pd.concat([df, metrics_df], axis=1)
+    # Stable key so the dashboard can fetch one row's contexts with a pushed-down filter
+    final_df.insert(0, 'row_id', np.arange(len(final_df)))
     
-    # Step 4: Summary Statistics
-    print("\n--- Evaluation Summary ---")
-    print(f"Average Hit Rate:  {final_df['hit_rate'].mean():.2%}")
-    print(f"Average MRR:       {final_df['mrr'].mean():.4f}")
-    print(f"Average Precision: {final_df['precision'].mean():.2%}")
-    print(f"Average Recall:    {final_df['recall'].mean():.2%}")
+    # Step 3: Summary Statistics (with bootstrap confidence intervals)
+    counts = build_value_counts(final_df)
+    cube = build_cube(final_df)
+    means = print_summary(counts)
+    print_metrics_at_k(cube)
     
-    # Step 5: Save Output
-    final_df.to_parquet(CONFIG['OUTPUT_FILENAME'])
-    print(f"\n✅ Results saved to: {CONFIG['OUTPUT_FILENAME']}")
-    print("Ready for Streamlit.")
+    # Step 4: Save Output (new partition in the append-only results store)
+    write_testset(final_df, tmp_path, row_group_size=CONFIG['STREAM_BATCH_ROWS'])
+    save_run(run_id, run_config, tmp_path, len(final_df), means, cube, counts, failed)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,22 +1,24 @@
-import pandas as pd
-import ast
+import os
+import sys
 import random
-import io
+
+# Shared modules live at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from testset_io import read_testset, write_testset, parse_list_column
 
 # ==========================================
 # 1. SETUP & DATA LOADING
 # ==========================================
 
-# I will assume the CSV text you pasted is saved as 'ragas_testset_50.csv'
-# If you don't have the file yet, simply paste your CSV content into a file named 'ragas_testset_50.csv'
-INPUT_FILE = "testsets/ragas_testset_50.csv"
-OUTPUT_FILE = "testsets/ragas_testset_simulated.csv"
+# Parquet testsets keep list<string> columns (convert old CSVs with: python testset_io.py testsets/*.csv)
+INPUT_FILE = "testsets/ragas_testset_50.parquet"
+OUTPUT_FILE = "testsets/ragas_testset_simulated.parquet"
 
 # Set a seed so the "randomness" is the same every time we run this (for consistency)
 random.seed(42)
 
 print("Loading data...")
-df = pd.read_csv(INPUT_FILE)
+df = read_testset(INPUT_FILE)
 
 # ==========================================
 # 2. CREATE THE "DISTRACTOR BANK"
@@ -27,11 +29,8 @@ df = pd.read_csv(INPUT_FILE)
 all_contexts_pool = []
 
 def collect_contexts(x):
-    try:
-        # Convert string "['abc']" to list ['abc']
-        return ast.literal_eval(x)
-    except:
-        return []
+    # Already a list when read from parquet (legacy CSV strings are parsed too)
+    return parse_list_column(x)
 
 # Parse the reference column and build the pool
 parsed_references = df['reference_contexts'].apply(collect_contexts)
@@ -95,5 +94,5 @@ print("Simulating retrieval results (K=3)...")
 df['retrieved_contexts'] = df.apply(simulate_retrieval, axis=1)
 
 print(f"Saving to {OUTPUT_FILE}...")
-df.to_csv(OUTPUT_FILE, index=False)
+write_testset(df, OUTPUT_FILE)
 print("Done! You can now run 'evaluate_rag.py' using this new file.")
\ No newline at end of file
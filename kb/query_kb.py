@@ -1,15 +1,24 @@
 import boto3
 import json
+import os
 import re
+import sys
+
+# Shared modules live at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrieval_cache import RetrievalCache, cached_retrieve
 
 # --- CONFIGURATION ---
-PROFILE = 'sandbox'
+PROFILE = os.getenv('BEDROCK_PROFILE', 'sandbox') or None
 REGION = 'us-east-1'
 KB_ID = '3TPM53DPBN' 
+# Optional endpoint override, e.g. http://localhost:8787 for local_bedrock_server.py
+ENDPOINT_URL = os.getenv('BEDROCK_ENDPOINT_URL')
 OUTPUT_FILE = 'extracted_answers_complete.json'
 
 QUERY_TEXT = "Cuales son los beneficios de fogaes?"
 NUMBER_OF_RESULTS = 3
+USE_RETRIEVAL_CACHE = True
 # ---------------------
 
 def clean_extracted_text(full_content):
@@ -52,21 +61,22 @@ def clean_extracted_text(full_content):
 
 def run_extraction():
     session = boto3.Session(profile_name=PROFILE, region_name=REGION)
-    client = session.client('bedrock-agent-runtime')
+    client = session.client('bedrock-agent-runtime', endpoint_url=ENDPOINT_URL)
 
     print(f"--- Querying KB: {KB_ID} ---")
     
-    response = client.retrieve(
-        knowledgeBaseId=KB_ID,
-        retrievalQuery={'text': QUERY_TEXT},
-        retrievalConfiguration={
-            'vectorSearchConfiguration': {'numberOfResults': NUMBER_OF_RESULTS}
-        }
+    cache = RetrievalCache() if USE_RETRIEVAL_CACHE else None
+    retrieval_results = cached_retrieve(
+        client, cache, KB_ID, QUERY_TEXT,
+        {'vectorSearchConfiguration': {'numberOfResults': NUMBER_OF_RESULTS}}
     )
+    if cache is not None:
+        print(f"(retrieval cache: {'hit' if cache.hits else 'miss'})")
+        cache.close()
 
     results = []
     
-    for item in response.get('retrievalResults', []):
+    for item in retrieval_results:
         raw_text = item['content']['text']
         
         # Run the extraction logic
@@ -0,0 +1,304 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# LangChain adapter (pipeline + RAGAS). Without langchain_core the plain cache
+# still works (e.g. deepeval / litellm environments).
+try:
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+except ImportError:
+    BaseCache = object
+    dumps = loads = None
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Shared by every generator in the repo (absolute path, so it works from any cwd)
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite"
+)
+# LRU eviction: least recently used responses are dropped once EITHER limit is exceeded
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Eviction trims down to this fraction of the limits, so it does not run on every put
+EVICTION_TARGET = 0.9
+# Entry count / total size are tracked in memory; they are re-read from the table
+# every N puts to pick up writes of other processes sharing the file
+TOTALS_REFRESH_EVERY = 1000
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache of LLM responses, shared by all generators.
+
+    Key = sha256(model id + full prompt/messages + temperature + max_tokens
+    [+ variant]). `variant` separates calls that must NOT share an answer even
+    with an identical prompt (e.g. repeated samples at temperature > 0).
+    Several processes can use the same file (WAL mode); eviction is LRU by
+    last use, bounded by entry count and total response size (kept in memory,
+    so a put does not scan the table).
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared across threads, serialized by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                model_id TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        # Covering index: totals and the LRU eviction never read the stored payloads
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_last_used_size ON llm_responses (last_used, size)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_model ON llm_responses (model_id)")
+        self._conn.commit()
+        self._refresh_totals()
+
+    def _refresh_totals(self):
+        """Re-reads entry count and total size (caller holds the lock, or __init__)."""
+        self._count, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_responses INDEXED BY idx_llm_last_used_size"
+        ).fetchone()
+        self._puts_since_refresh = 0
+
+    @staticmethod
+    def make_key(model_id, prompt, temperature=None, max_tokens=None, variant=None):
+        """Stable hash of everything that can change the response. `prompt` may be a string or a messages list."""
+        payload = json.dumps(
+            {"model_id": model_id, "prompt": prompt, "temperature": temperature,
+             "max_tokens": max_tokens, "variant": variant},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model_id, prompt, temperature=None, max_tokens=None, variant=None):
+        """Returns the cached response (any JSON value), or None on miss."""
+        key = self.make_key(model_id, prompt, temperature, max_tokens, variant)
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE llm_responses SET last_used = ?, hit_count = hit_count + 1 WHERE key = ?",
+                    (time.time(), key)
+                )
+                self._conn.commit()
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, model_id, prompt, response, temperature=None, max_tokens=None, variant=None):
+        key = self.make_key(model_id, prompt, temperature, max_tokens, variant)
+        payload = json.dumps(response, ensure_ascii=False, default=str)
+        size = len(payload.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM llm_responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, model_id, size, response, created_at, last_used, hit_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, model_id, size, payload, now, now)
+            )
+            if replaced is None:
+                self._count += 1
+            self._bytes += size - (replaced[0] if replaced else 0)
+            self._puts_since_refresh += 1
+            if self._puts_since_refresh >= TOTALS_REFRESH_EVERY:
+                self._refresh_totals()
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drops least recently used rows once a limit is exceeded (caller holds the lock)."""
+        if self._count <= self.max_entries and self._bytes <= self.max_bytes:
+            return 0
+        # Keep the most recently used rows while they fit in EVICTION_TARGET of both limits
+        deleted = self._conn.execute(
+            """
+            DELETE FROM llm_responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key,
+                           ROW_NUMBER() OVER (ORDER BY last_used DESC) AS kept_rows,
+                           SUM(size) OVER (ORDER BY last_used DESC) AS kept_bytes
+                    FROM llm_responses
+                ) WHERE kept_rows > ? OR kept_bytes > ?
+            )
+            """,
+            (int(self.max_entries * EVICTION_TARGET), int(self.max_bytes * EVICTION_TARGET))
+        ).rowcount
+        self._refresh_totals()
+        return deleted
+
+    def invalidate(self, model_id=None):
+        """Deletes all entries (or only one model's). Returns the number of deleted entries."""
+        sql, params = "DELETE FROM llm_responses", []
+        if model_id is not None:
+            sql += " WHERE model_id = ?"
+            params.append(model_id)
+        with self._lock:
+            deleted = self._conn.execute(sql, params).rowcount
+            self._refresh_totals()
+            self._conn.commit()
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT model_id, COUNT(*), SUM(size), SUM(hit_count) FROM llm_responses GROUP BY model_id"
+            ).fetchall()
+        return {
+            "per_model": {m: {"entries": n, "bytes": b, "stored_hits": h} for m, n, b, h in rows},
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def hit_rate(self):
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_completion(cache, call, model_id, prompt, temperature=None, max_tokens=None, variant=None):
+    """
+    Returns call() (a JSON-able result) through the cache: on a hit the API is not called.
+    If `cache` is None it simply calls the API.
+    """
+    if cache is not None:
+        cached = cache.get(model_id, prompt, temperature, max_tokens, variant)
+        if cached is not None:
+            return cached
+
+    result = call()
+
+    if cache is not None:
+        cache.put(model_id, prompt, result, temperature, max_tokens, variant)
+    return result
+
+
+# ==========================================
+# WRAPPERS (LangChain chat models, LangChain/RAGAS global cache)
+# ==========================================
+
+class CachedResponse:
+    """What CachedChatModel.invoke returns on a hit: the fields callers read from an AIMessage."""
+
+    def __init__(self, content, usage_metadata):
+        self.content = content
+        self.usage_metadata = usage_metadata
+        self.cached = True
+
+
+class CachedChatModel:
+    """
+    Wraps a LangChain chat model: invoke(prompt, cache_variant=None) goes through
+    `cache` (None = plain passthrough). Only the text and token usage are stored.
+    """
+
+    def __init__(self, llm, cache=None):
+        self.llm = llm
+        self.cache = cache
+        self.model_id = getattr(llm, "model_id", None) or getattr(llm, "model", None) or type(llm).__name__
+        self.temperature = getattr(llm, "temperature", None)
+        self.max_tokens = getattr(llm, "max_tokens", None)
+
+    def invoke(self, prompt, cache_variant=None):
+        if self.cache is None:
+            return self.llm.invoke(prompt)
+        key = (self.model_id, prompt, self.temperature, self.max_tokens, cache_variant)
+        cached = self.cache.get(*key)
+        if cached is not None:
+            return CachedResponse(cached["content"], cached["usage_metadata"])
+
+        response = self.llm.invoke(prompt)
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.cache.put(
+            self.model_id, prompt,
+            {"content": response.content, "usage_metadata": {k: usage.get(k) for k in ("input_tokens", "output_tokens")}},
+            self.temperature, self.max_tokens, cache_variant
+        )
+        return response
+
+
+def model_id_from_llm_string(llm_string):
+    """Best-effort model id from LangChain's serialized model params (falls back to 'langchain')."""
+    match = re.search(r"""['"]model(?:_id|_name)?['"]\s*[:,]\s*['"]([^'"]+)['"]""", llm_string)
+    return match.group(1) if match else "langchain"
+
+
+class LangChainLLMCache(BaseCache):
+    """
+    LangChain BaseCache backed by an LLMCache, for `ChatBedrockConverse(cache=...)`
+    or `set_llm_cache(...)`; RAGAS' LangchainLLMWrapper goes through it too.
+    LangChain's `llm_string` already contains model id, temperature and max_tokens.
+    """
+
+    def __init__(self, cache=None):
+        if loads is None:
+            raise ImportError("LangChainLLMCache needs langchain_core")
+        self.cache = cache or LLMCache()
+
+    def lookup(self, prompt, llm_string):
+        cached = self.cache.get(model_id_from_llm_string(llm_string), prompt, variant=llm_string)
+        return [loads(generation) for generation in cached] if cached is not None else None
+
+    def update(self, prompt, llm_string, return_val):
+        self.cache.put(
+            model_id_from_llm_string(llm_string), prompt,
+            [dumps(generation) for generation in return_val], variant=llm_string
+        )
+
+    def clear(self, **kwargs):
+        self.cache.invalidate()
+
+
+# ==========================================
+# CLI: inspect / invalidate the cache
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the shared LLM response cache.")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--invalidate", metavar="MODEL_ID",
+                        help="Drop all entries for this model id. Use 'ALL' for every model.")
+    args = parser.parse_args()
+
+    cache = LLMCache(args.path)
+
+    if args.invalidate:
+        model_id = None if args.invalidate == "ALL" else args.invalidate
+        print(f"🗑️ Deleted {cache.invalidate(model_id=model_id)} cached responses.")
+
+    print(f"Cache: {args.path}")
+    for model_id, info in cache.stats()["per_model"].items():
+        print(f"  {model_id}: {info['entries']} entries, {info['bytes'] / 1e6:.1f} MB, "
+              f"{info['stored_hits']} hits")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Per-call LLM telemetry: model id, stage, tokens, latency, retries, outcome, cost.
+
+boto3 clients are instrumented through botocore's event hooks, so EVERY
+Bedrock call made through them is recorded (LangChain, RAGAS, direct calls):
+
+    telemetry = LLMTelemetry("testsets/run.telemetry.jsonl")
+    telemetry.instrument_client(boto3_client, default_stage="synthesizer")
+
+The stage comes from the `stage()` context (a contextvar, so it follows each
+thread / task), else the client's default stage; embedding models are always
+"embedding". Calls that do not go through boto3 (litellm in the deepeval
+BedrockWrapper) are wrapped by hand with `telemetry.track(stage, model_id)`.
+
+Each call is appended to a JSONL log as it finishes; the end-of-run report has
+p50/p95 latency, tokens, retries and cost per stage / model and the cost per
+accepted sample. Time spent queued in rate_limiter's buckets is recorded as
+`queue_wait_s` and NOT counted in `latency` (which measures Bedrock only).
+Report over an existing log (and export it to Parquet):
+    python llm_telemetry.py testsets/run.telemetry.jsonl --accepted 30 --parquet
+"""
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# USD per 1M tokens (input, output). Check current Bedrock pricing for your region.
+PRICES = {
+    "openai.gpt-oss-120b-1:0": (0.15, 0.60),
+    "openai.gpt-oss-20b-1:0": (0.07, 0.30),
+    "meta.llama4-maverick-17b-instruct-v1:0": (0.24, 0.97),
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (3.00, 15.00),
+    "amazon.titan-embed-text-v2:0": (0.02, 0.0),
+}
+# Cross-region inference profiles ("us.meta...") are priced as the base model
+REGION_PREFIXES = ("us.", "eu.", "apac.", "global.")
+
+STAGE = contextvars.ContextVar("llm_stage", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Tags every LLM call made inside the block (same thread / task) with `name`."""
+    token = STAGE.set(name)
+    try:
+        yield
+    finally:
+        STAGE.reset(token)
+
+
+def in_stage(name, fn, *args, **kwargs):
+    """fn(*args, **kwargs) under `stage(name)`, e.g. as a thread pool job (executors do not copy contextvars)."""
+    with stage(name):
+        return fn(*args, **kwargs)
+
+
+def base_model_id(model_id):
+    """'bedrock/us.meta.llama4...' -> 'meta.llama4...' (litellm prefix / inference profile removed)."""
+    model_id = str(model_id or "").split("/")[-1]
+    for prefix in REGION_PREFIXES:
+        if model_id.startswith(prefix):
+            return model_id[len(prefix):]
+    return model_id
+
+
+def call_cost(model_id, input_tokens, output_tokens, prices=PRICES):
+    """USD cost of one call (None if the model has no price)."""
+    price = prices.get(model_id) or prices.get(base_model_id(model_id))
+    if price is None:
+        return None
+    return ((input_tokens or 0) * price[0] + (output_tokens or 0) * price[1]) / 1e6
+
+
+class TrackedCall:
+    """Handle yielded by LLMTelemetry.track(): set the usage / retries once known."""
+
+    def __init__(self):
+        self.input_tokens = None
+        self.output_tokens = None
+        self.retries = 0
+        self.queue_wait_s = 0.0
+
+    def set_usage(self, input_tokens, output_tokens):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+
+    def add_queue_wait(self, seconds):
+        self.queue_wait_s += seconds
+
+
+class LLMTelemetry:
+    """Collects one record per LLM call (in memory + appended to `log_path`)."""
+
+    def __init__(self, log_path=None, prices=PRICES):
+        self.log_path = log_path
+        self.prices = prices
+        self.session = datetime.now().strftime("%Y%m%dT%H%M%S")
+        self.records = []
+        self._lock = threading.Lock()
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+
+    def record(self, model_id, stage_name, latency, input_tokens=None, output_tokens=None,
+               retries=0, outcome="ok", error=None, queue_wait_s=0.0):
+        record = {
+            "session": self.session,
+            "timestamp": time.time(),
+            "model_id": model_id,
+            "stage": stage_name,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "latency": latency,
+            "queue_wait_s": queue_wait_s,
+            "retries": retries,
+            "outcome": outcome,
+            "error": error,
+            "cost": call_cost(model_id, input_tokens, output_tokens, self.prices),
+        }
+        with self._lock:
+            self.records.append(record)
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    @staticmethod
+    def resolve_stage(model_id, default_stage=None):
+        if "embed" in str(model_id).lower():
+            return "embedding"
+        return STAGE.get() or default_stage or "llm"
+
+    # ==========================================
+    # boto3 / botocore hooks
+    # ==========================================
+
+    def instrument_client(self, client, default_stage=None):
+        """Records every call of a boto3 bedrock-runtime client (retries included in the latency)."""
+        events = client.meta.events
+
+        def on_params(params, context, **kwargs):
+            context["telemetry_start"] = time.perf_counter()
+            context["telemetry_model_id"] = params.get("modelId")
+            context["telemetry_stage"] = self.resolve_stage(params.get("modelId"), default_stage)
+
+        def on_response(http_response, parsed, context, **kwargs):
+            if "telemetry_start" not in context:
+                return
+            usage = parsed.get("usage") or {}
+            headers = getattr(http_response, "headers", {}) or {}
+            input_tokens = usage.get("inputTokens", headers.get("x-amzn-bedrock-input-token-count"))
+            output_tokens = usage.get("outputTokens", headers.get("x-amzn-bedrock-output-token-count"))
+            error = (parsed.get("Error") or {}).get("Code")
+            queue_wait = context.get("queue_wait_s", 0.0)
+            self.record(
+                context["telemetry_model_id"], context["telemetry_stage"],
+                time.perf_counter() - context.pop("telemetry_start") - queue_wait,
+                int(input_tokens) if input_tokens is not None else None,
+                int(output_tokens) if output_tokens is not None else None,
+                retries=parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0),
+                outcome="error" if error or http_response.status_code >= 300 else "ok",
+                error=error, queue_wait_s=queue_wait,
+            )
+
+        def on_error(exception, context, **kwargs):
+            if "telemetry_start" not in context:
+                return
+            queue_wait = context.get("queue_wait_s", 0.0)
+            self.record(
+                context["telemetry_model_id"], context["telemetry_stage"],
+                time.perf_counter() - context.pop("telemetry_start") - queue_wait,
+                outcome="error", error=type(exception).__name__, queue_wait_s=queue_wait,
+            )
+
+        events.register("provide-client-params.bedrock-runtime.*", on_params)
+        events.register("after-call.bedrock-runtime.*", on_response)
+        events.register("after-call-error.bedrock-runtime.*", on_error)
+        return client
+
+    # ==========================================
+    # Manual wrapping (litellm / anything not going through boto3 hooks)
+    # ==========================================
+
+    @contextmanager
+    def track(self, stage_name, model_id):
+        call = TrackedCall()
+        start = time.perf_counter()
+        try:
+            yield call
+        except Exception as e:
+            self.record(model_id, stage_name, time.perf_counter() - start - call.queue_wait_s,
+                        call.input_tokens, call.output_tokens, call.retries, outcome="error",
+                        error=type(e).__name__, queue_wait_s=call.queue_wait_s)
+            raise
+        self.record(model_id, stage_name, time.perf_counter() - start - call.queue_wait_s,
+                    call.input_tokens, call.output_tokens, call.retries, queue_wait_s=call.queue_wait_s)
+
+    # ==========================================
+    # Report
+    # ==========================================
+
+    def frame(self):
+        return numeric_columns(pd.DataFrame(self.records, columns=[
+            "session", "timestamp", "model_id", "stage", "input_tokens", "output_tokens",
+            "latency", "queue_wait_s", "retries", "outcome", "error", "cost",
+        ]))
+
+    def print_report(self, accepted=None):
+        return print_report(self.frame(), accepted)
+
+    def write_parquet(self, path=None):
+        path = path or os.path.splitext(self.log_path)[0] + ".parquet"
+        self.frame().to_parquet(path, index=False)
+        return path
+
+
+def numeric_columns(calls):
+    """Token / cost columns as floats (missing usage -> NaN, not None)."""
+    for col in ["input_tokens", "output_tokens", "latency", "queue_wait_s", "retries", "cost"]:
+        if col in calls.columns:
+            calls[col] = pd.to_numeric(calls[col], errors="coerce")
+    return calls
+
+
+def summarize(calls):
+    """One row per (stage, model_id): calls, errors, retries, tokens, p50/p95 latency, queue wait, cost."""
+    if calls.empty:
+        return pd.DataFrame()
+    grouped = calls.groupby(["stage", "model_id"], dropna=False)
+    summary = grouped.agg(
+        calls=("latency", "size"),
+        errors=("outcome", lambda o: int((o != "ok").sum())),
+        retries=("retries", "sum"),
+        input_tokens=("input_tokens", "sum"),
+        output_tokens=("output_tokens", "sum"),
+        p50_latency=("latency", lambda l: l.quantile(0.5)),
+        p95_latency=("latency", lambda l: l.quantile(0.95)),
+        queue_wait=("queue_wait_s", "sum"),
+        cost=("cost", lambda c: c.sum(min_count=1)),
+    )
+    for col in ["retries", "input_tokens", "output_tokens"]:
+        summary[col] = summary[col].fillna(0).astype(int)
+    return summary.reset_index()
+
+
+def print_report(calls, accepted=None):
+    summary = summarize(calls)
+    if summary.empty:
+        print("LLM telemetry: no calls recorded.")
+        return summary
+    print("\nLLM calls per stage (Bedrock latency and total rate-limiter queue wait in seconds, cost in USD):")
+    print(summary.to_string(index=False, formatters={
+        "p50_latency": "{:.2f}".format, "p95_latency": "{:.2f}".format, "queue_wait": "{:.1f}".format,
+        "cost": "{:,.5f}".format,
+    }))
+
+    total_cost = calls["cost"].sum(min_count=1)
+    unpriced = sorted(calls.loc[calls["cost"].isna() & (calls["outcome"] == "ok"), "model_id"].dropna().unique())
+    print(f"Total: {len(calls)} calls, {int(calls['input_tokens'].sum())} input / "
+          f"{int(calls['output_tokens'].sum())} output tokens, "
+          f"p50 {calls['latency'].quantile(0.5):.2f}s / p95 {calls['latency'].quantile(0.95):.2f}s, "
+          f"${0 if pd.isna(total_cost) else total_cost:,.4f}")
+    if unpriced:
+        print(f"⚠️ No price for: {', '.join(unpriced)} (add them to llm_telemetry.PRICES)")
+    if accepted:
+        per_sample = summary.set_index("stage")[["calls", "input_tokens", "output_tokens", "cost"]].sum() / accepted
+        print(f"Per accepted sample ({accepted}): {per_sample['calls']:.2f} calls, "
+              f"{per_sample['input_tokens'] + per_sample['output_tokens']:,.0f} tokens, "
+              f"${per_sample['cost']:,.5f}, {calls['latency'].sum() / accepted:.1f}s of LLM time")
+    return summary
+
+
+def load_log(path, session=None):
+    with open(path, "r", encoding="utf-8") as f:
+        calls = numeric_columns(pd.DataFrame([json.loads(line) for line in f if line.strip()]))
+    if "queue_wait_s" not in calls.columns:
+        calls["queue_wait_s"] = 0.0   # logs written before the rate limiter existed
+    if session and not calls.empty:
+        calls = calls[calls["session"] == session]
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report / export an LLM telemetry log.")
+    parser.add_argument("path", help="JSONL log written by LLMTelemetry")
+    parser.add_argument("--accepted", type=int, help="Accepted samples, for the cost per sample")
+    parser.add_argument("--session", help="Only this session (default: every session in the log)")
+    parser.add_argument("--parquet", action="store_true", help="Also write <log>.parquet")
+    args = parser.parse_args()
+
+    calls = load_log(args.path, args.session)
+    print_report(calls, args.accepted)
+    if args.parquet:
+        output = os.path.splitext(args.path)[0] + ".parquet"
+        calls.to_parquet(output, index=False)
+        print(f"\n✅ Saved to: {output}")
+
+if __name__ == "__main__":
+    main()
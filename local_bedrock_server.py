@@ -0,0 +1,432 @@
+"""
+Local stand-in for the Bedrock APIs used in this repo, for offline load tests.
+
+Speaks the same wire format as:
+  - bedrock-agent-runtime: Retrieve, InvokeAgent (binary event stream)
+  - bedrock-runtime:       Converse, InvokeModel (Titan-style embeddings)
+
+Backed by the markdown files in kb/kb_nuevo_pipeline, with configurable latency
+distributions, ThrottlingException rate, a max-TPS throttle and 5xx injection.
+
+Usage:
+    python local_bedrock_server.py --port 8787 --retrieve-latency lognormal:-2.3,0.5 --throttle-rate 0.05
+
+Then point any script at it (no AWS profile needed):
+    BEDROCK_ENDPOINT_URL=http://localhost:8787 BEDROCK_PROFILE= \\
+    AWS_ACCESS_KEY_ID=local AWS_SECRET_ACCESS_KEY=local python eval_set_generator.py
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import unicodedata
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+# ==========================================
+# 1. CONFIGURATION (defaults, overridable from the CLI)
+# ==========================================
+CONFIG = {
+    "HOST": "127.0.0.1",
+    "PORT": 8787,
+    "KB_FOLDER": os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb", "kb_nuevo_pipeline"),
+    "SEED": 42,
+    # Latency specs: "fixed:S", "uniform:A,B", "normal:MEAN,SD", "lognormal:MU,SIGMA" (seconds)
+    "LATENCY": {
+        "retrieve": "lognormal:-2.3,0.5",   # median ~0.1s
+        "invoke_agent": "lognormal:0.0,0.4", # median ~1s
+        "converse": "lognormal:0.3,0.5",     # median ~1.3s
+        "invoke_model": "fixed:0.02",
+    },
+    "THROTTLE_RATE": 0.0,   # probability of a random ThrottlingException (HTTP 429)
+    "ERROR_RATE": 0.0,      # probability of a 500/503 server error
+    "MAX_TPS": None,        # throttle deterministically above this many requests/second
+    "CRITIC_APPROVAL_RATE": 0.8,
+    "EMBEDDING_DIMENSIONS": 1024,
+}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# ==========================================
+# 2. HELPERS
+# ==========================================
+
+def fold_text(text):
+    """Lowercase and strip accents (so 'Qué' and 'que' match)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold_text(text))
+
+def estimate_tokens(text):
+    """Rough token count (~4 chars per token), good enough for usage numbers."""
+    return max(1, len(text) // 4)
+
+def parse_latency(spec):
+    """Parses a latency spec string into a sampler: rng -> seconds."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",")] if params else []
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+def encode_event(event_type, payload, message_type="event"):
+    """
+    Encodes one message of the AWS binary event stream format
+    (prelude + prelude CRC + headers + payload + message CRC).
+    """
+    headers = b""
+    for name, value in ((":event-type", event_type),
+                        (":content-type", "application/json"),
+                        (":message-type", message_type)):
+        name_b, value_b = name.encode(), value.encode()
+        headers += struct.pack(">B", len(name_b)) + name_b
+        headers += struct.pack(">BH", 7, len(value_b)) + value_b  # 7 = string
+
+    body = json.dumps(payload).encode("utf-8")
+    total_length = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    prelude += struct.pack(">I", binascii.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + headers + body
+    return message + struct.pack(">I", binascii.crc32(message) & 0xFFFFFFFF)
+
+
+class LocalKnowledgeBase:
+    """BM25 search over the markdown files of a local KB folder (one chunk per file)."""
+
+    def __init__(self, folder):
+        self.docs = []
+        for root, _, files in os.walk(folder):
+            for name in sorted(files):
+                if not name.endswith(".md"):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                metadata = {}
+                sidecar = path[:-3] + ".docx.metadata.json"
+                if os.path.exists(sidecar):
+                    with open(sidecar, "r", encoding="utf-8") as f:
+                        metadata = json.load(f).get("metadataAttributes", {})
+                rel_path = os.path.relpath(path, folder).replace(os.sep, "/")
+                self.docs.append({
+                    "text": text,
+                    "uri": f"s3://local-bedrock-kb/{rel_path}",
+                    "metadata": metadata,
+                    "tf": Counter(tokenize(text)),
+                })
+
+        self.avg_len = sum(sum(d["tf"].values()) for d in self.docs) / max(1, len(self.docs))
+        df = Counter(t for d in self.docs for t in d["tf"])
+        n = len(self.docs)
+        self.idf = {t: math.log(1 + (n - c + 0.5) / (c + 0.5)) for t, c in df.items()}
+
+    def search(self, query, top_k, k1=1.5, b=0.75):
+        terms = tokenize(query)
+        scored = []
+        for doc in self.docs:
+            doc_len = sum(doc["tf"].values())
+            score = 0.0
+            for t in terms:
+                tf = doc["tf"].get(t, 0)
+                if tf:
+                    score += self.idf[t] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / self.avg_len))
+            scored.append((score, doc))
+        scored.sort(key=lambda x: x[0], reverse=True)
+
+        # Normalize into (0, 1] like Bedrock relevance scores
+        top_score = scored[0][0] if scored and scored[0][0] > 0 else 1.0
+        return [
+            {
+                "content": {"text": doc["text"], "type": "TEXT"},
+                "location": {"type": "S3", "s3Location": {"uri": doc["uri"]}},
+                "metadata": {**doc["metadata"], "x-amz-bedrock-kb-source-uri": doc["uri"]},
+                "score": round(score / top_score, 6),
+            }
+            for score, doc in scored[:top_k]
+        ]
+
+# ==========================================
+# 3. FAKE MODEL RESPONSES
+# ==========================================
+
+def hashed_embedding(text, dimensions):
+    """Deterministic bag-of-words embedding (feature hashing), L2-normalized."""
+    vec = [0.0] * dimensions
+    for tok in tokenize(text):
+        h = int.from_bytes(hashlib.blake2b(tok.encode(), digest_size=8).digest(), "little")
+        vec[h % dimensions] += 1.0 if (h >> 63) else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+def fake_completion(prompt, rng):
+    """
+    Mimics the JSON contracts of the prompts in new pipeline/main.py
+    (generator -> question/ground_truth, critic -> approved/reason,
+    batched critic -> one verdict per "### Par <id>").
+    Anything else gets a plain-text answer.
+    """
+    if '"verdicts"' in prompt:
+        verdicts = []
+        for item_id in re.findall(r"^### Par (\d+)", prompt, re.MULTILINE):
+            approved = rng.random() < CONFIG["CRITIC_APPROVAL_RATE"]
+            verdicts.append({
+                "id": int(item_id),
+                "approved": approved,
+                "reason": "Cumple los criterios." if approved else "La pregunta depende del contexto.",
+            })
+        return json.dumps({"verdicts": verdicts}, ensure_ascii=False)
+
+    if '"approved"' in prompt:
+        approved = rng.random() < CONFIG["CRITIC_APPROVAL_RATE"]
+        return json.dumps({
+            "approved": approved,
+            "reason": "Cumple los criterios." if approved else "La pregunta depende del contexto.",
+        }, ensure_ascii=False)
+
+    if '"question"' in prompt and '"ground_truth"' in prompt:
+        match = re.search(r'Fragmento:\s*"(.*?)"\s*\n', prompt, re.DOTALL)
+        fragment = match.group(1).strip() if match else prompt[-500:]
+        lines = [l.strip("# ").strip() for l in fragment.splitlines() if l.strip()]
+        title = lines[0] if lines else "el crédito hipotecario"
+        answer = lines[1] if len(lines) > 1 else title
+        return json.dumps({
+            "question": f"{title.rstrip('?¿')}?",
+            "ground_truth": answer,
+        }, ensure_ascii=False)
+
+    return "Respuesta simulada por el servidor local de Bedrock."
+
+# ==========================================
+# 4. HTTP HANDLER
+# ==========================================
+
+class BedrockHandler(BaseHTTPRequestHandler):
+    server_version = "LocalBedrock/1.0"
+
+    ROUTES = [
+        (re.compile(r"^/knowledgebases/(?P<kb_id>[^/]+)/retrieve$"), "retrieve"),
+        (re.compile(r"^/agents/(?P<agent_id>[^/]+)/agentAliases/(?P<alias_id>[^/]+)/sessions/(?P<session_id>[^/]+)/text$"), "invoke_agent"),
+        (re.compile(r"^/model/(?P<model_id>.+)/converse$"), "converse"),
+        (re.compile(r"^/model/(?P<model_id>.+)/invoke$"), "invoke_model"),
+    ]
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    # --- Plumbing ---
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-amzn-RequestId", self.request_id)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message):
+        self.server.stats[error_type] += 1
+        self._send_json(status, {"message": message}, {"x-amzn-ErrorType": error_type})
+
+    def do_POST(self):
+        self.request_id = hashlib.md5(f"{time.time()}{id(self)}".encode()).hexdigest()
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = unquote(self.path.split("?")[0])
+
+        for pattern, operation in self.ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return self._send_error(404, "ResourceNotFoundException", f"Unknown path {path}")
+
+        self.server.stats[operation] += 1
+        self.rng = self.server.request_rng(operation, body)
+
+        # Fault injection happens before the simulated work, like a real front door
+        fault = self.server.draw_fault(self.rng)
+        if fault == "throttle":
+            return self._send_error(429, "ThrottlingException", "Rate exceeded")
+        if fault == "error":
+            if self.rng.random() < 0.5:
+                return self._send_error(500, "InternalServerException", "Injected internal error")
+            return self._send_error(503, "ServiceUnavailableException", "Injected unavailability")
+
+        time.sleep(self.server.latency[operation](self.rng))
+        getattr(self, f"_handle_{operation}")(body, **match.groupdict())
+
+    # --- Operations ---
+
+    def _handle_retrieve(self, body, kb_id):
+        top_k = body.get("retrievalConfiguration", {}) \
+                    .get("vectorSearchConfiguration", {}) \
+                    .get("numberOfResults", 5)
+        query = body.get("retrievalQuery", {}).get("text", "")
+        self._send_json(200, {"retrievalResults": self.server.kb.search(query, top_k)})
+
+    def _handle_converse(self, body, model_id):
+        prompt = "\n".join(
+            block.get("text", "")
+            for message in body.get("messages", [])
+            for block in message.get("content", [])
+        )
+        text = fake_completion(prompt, self.rng)
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        self._send_json(200, {
+            "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+            "stopReason": "end_turn",
+            "usage": {
+                "inputTokens": input_tokens,
+                "outputTokens": output_tokens,
+                "totalTokens": input_tokens + output_tokens,
+            },
+            "metrics": {"latencyMs": 0},
+        })
+
+    def _handle_invoke_model(self, body, model_id):
+        text = body.get("inputText", "")
+        dimensions = body.get("dimensions", CONFIG["EMBEDDING_DIMENSIONS"])
+        self._send_json(200, {
+            "embedding": hashed_embedding(text, dimensions),
+            "inputTextTokenCount": estimate_tokens(text),
+        })
+
+    def _handle_invoke_agent(self, body, agent_id, alias_id, session_id):
+        references = self.server.kb.search(body.get("inputText", ""), 3)
+        answer = references[0]["content"]["text"] if references else "No encontré información."
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+        self.send_header("x-amzn-bedrock-agent-content-type", "application/json")
+        self.send_header("x-amz-bedrock-agent-session-id", session_id)
+        self.send_header("x-amzn-RequestId", self.request_id)
+        self.end_headers()
+
+        if body.get("enableTrace"):
+            trace = {
+                "agentId": agent_id, "agentAliasId": alias_id,
+                "sessionId": session_id, "agentVersion": "1",
+                "trace": {"orchestrationTrace": {"observation": {
+                    "type": "KNOWLEDGE_BASE",
+                    "knowledgeBaseLookupOutput": {"retrievedReferences": [
+                        {k: r[k] for k in ("content", "location", "metadata")} for r in references
+                    ]},
+                }}},
+            }
+            self.wfile.write(encode_event("trace", trace))
+            self.wfile.flush()
+
+        # Stream the answer in a few chunks to exercise the client's stream handling
+        pieces = [answer[i:i + 200] for i in range(0, len(answer), 200)] or [""]
+        for piece in pieces:
+            payload = {"bytes": base64.b64encode(piece.encode("utf-8")).decode("ascii")}
+            self.wfile.write(encode_event("chunk", payload))
+            self.wfile.flush()
+            time.sleep(0.01)
+
+
+class LocalBedrockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, kb_folder, latency, throttle_rate, error_rate, max_tps, seed, quiet=False):
+        super().__init__(address, BedrockHandler)
+        self.kb = LocalKnowledgeBase(kb_folder)
+        self.latency = {op: parse_latency(spec) for op, spec in latency.items()}
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.max_tps = max_tps
+        self.quiet = quiet
+        self.stats = Counter()
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._seen = Counter()   # request digest -> times received
+        self._recent = deque()
+
+    def request_rng(self, operation, body):
+        """
+        RNG for one request, seeded from (seed, operation, body, repeat number): a request
+        gets the same faults, latency and completion however many clients run concurrently
+        and in whatever order they arrive, while a retry of it draws afresh.
+        """
+        payload = json.dumps([operation, body], sort_keys=True, ensure_ascii=False)
+        digest = hashlib.sha256(payload.encode("utf-8")).digest()
+        with self._lock:
+            repeat = self._seen[digest]
+            self._seen[digest] += 1
+        key = hashlib.sha256(f"{self.seed}:{repeat}:".encode() + digest).digest()
+        return random.Random(int.from_bytes(key[:8], "big"))
+
+    def draw_fault(self, rng):
+        if self.max_tps:
+            with self._lock:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > 1.0:
+                    self._recent.popleft()
+                if len(self._recent) >= self.max_tps:
+                    return "throttle"
+                self._recent.append(now)
+        roll = rng.random()
+        if roll < self.throttle_rate:
+            return "throttle"
+        if roll < self.throttle_rate + self.error_rate:
+            return "error"
+        return None
+
+# ==========================================
+# 5. MAIN
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Bedrock stand-in server.")
+    parser.add_argument("--host", default=CONFIG["HOST"])
+    parser.add_argument("--port", type=int, default=CONFIG["PORT"])
+    parser.add_argument("--kb-folder", default=CONFIG["KB_FOLDER"])
+    parser.add_argument("--seed", type=int, default=CONFIG["SEED"])
+    parser.add_argument("--throttle-rate", type=float, default=CONFIG["THROTTLE_RATE"])
+    parser.add_argument("--error-rate", type=float, default=CONFIG["ERROR_RATE"])
+    parser.add_argument("--max-tps", type=float, default=CONFIG["MAX_TPS"])
+    for operation, spec in CONFIG["LATENCY"].items():
+        parser.add_argument(f"--{operation.replace('_', '-')}-latency", default=spec, dest=f"latency_{operation}")
+    parser.add_argument("--quiet", action="store_true", help="Don't log every request.")
+    args = parser.parse_args()
+
+    latency = {op: getattr(args, f"latency_{op}") for op in CONFIG["LATENCY"]}
+    server = LocalBedrockServer(
+        (args.host, args.port), args.kb_folder, latency,
+        args.throttle_rate, args.error_rate, args.max_tps, args.seed, args.quiet
+    )
+    print(f"✅ Local Bedrock listening on http://{args.host}:{args.port} "
+          f"({len(server.kb.docs)} KB documents from {args.kb_folder})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("\n--- Request stats ---")
+        for name, count in sorted(server.stats.items()):
+            print(f"  {name}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Bootstrap confidence intervals for the retrieval metrics.
+
+Per-query metrics only take a handful of distinct values (hit_rate is 0/1,
+MRR is 1/rank, precision/recall are j/k), so a bootstrap resample is fully
+described by HOW MANY times each distinct value is drawn: one multinomial draw
+per resample. 10k resamples then cost a (10k x distinct values) matrix,
+independent of the number of rows. Continuous metrics (many distinct values) are
+first binned into MAX_DISTINCT_VALUES equal-width bins, each placed at the mean of
+its values: the sample mean is unchanged and the bins are far finer than any CI.
+
+Inputs are (values, counts) pairs, so the same code serves in-memory frames,
+streamed batches (counts are added up) and the dashboard's stored value counts.
+"""
+import numpy as np
+import pandas as pd
+
+N_RESAMPLES = 10_000
+CONFIDENCE = 0.95
+SEED = 0
+# Above this many distinct values, values are binned before resampling
+MAX_DISTINCT_VALUES = 2_000
+# Max resample-matrix entries held at once
+CHUNK_ELEMENTS = 20_000_000
+
+
+def bin_values(values, counts, n_bins=MAX_DISTINCT_VALUES):
+    """(values, counts) collapsed into `n_bins` equal-width bins, each at the mean of its values."""
+    edges = np.linspace(values.min(), values.max(), n_bins + 1)
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
+    bin_counts = np.bincount(bins, weights=counts, minlength=n_bins)
+    bin_sums = np.bincount(bins, weights=values * counts, minlength=n_bins)
+    used = bin_counts > 0
+    return bin_sums[used] / bin_counts[used], bin_counts[used].astype(np.int64)
+
+
+def bootstrap_means(values, counts, n_resamples=N_RESAMPLES, seed=SEED):
+    """Means of `n_resamples` bootstrap resamples of the sample described by (values, counts)."""
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    n = int(counts.sum())
+    rng = np.random.default_rng(seed)
+    if n == 0:
+        return np.full(n_resamples, np.nan)
+
+    if len(values) > MAX_DISTINCT_VALUES:
+        values, counts = bin_values(values, counts)
+
+    chunk = max(1, CHUNK_ELEMENTS // len(values))
+    means = np.empty(n_resamples)
+    for start in range(0, n_resamples, chunk):
+        stop = min(start + chunk, n_resamples)
+        draws = rng.multinomial(n, counts / n, size=stop - start)   # resamples x distinct
+        means[start:stop] = draws @ values / n
+    return means
+
+
+def bootstrap_ci(values, counts=None, confidence=CONFIDENCE, n_resamples=N_RESAMPLES, seed=SEED):
+    """
+    Percentile bootstrap CI of the mean. Pass raw per-row values, or distinct
+    values + their counts. Returns (mean, ci_low, ci_high).
+    """
+    if counts is None:
+        values, counts = np.unique(np.asarray(values, dtype=np.float64), return_counts=True)
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.int64)
+    if counts.sum() == 0:
+        return np.nan, np.nan, np.nan
+    mean = float(values @ counts / counts.sum())
+    means = bootstrap_means(values, counts, n_resamples, seed)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return mean, float(low), float(high)
+
+
+def value_counts(df, metrics, by=()):
+    """
+    Long frame [*by, metric, value, count]: how often each metric value occurs
+    per group. Frames for different batches can be concatenated and re-summed.
+    """
+    by = list(by)
+    parts = []
+    for metric in metrics:
+        counts = df.groupby(by + [metric], sort=False).size() if by else df[metric].value_counts(sort=False)
+        counts = counts.rename('count').reset_index().rename(columns={metric: 'value'})
+        counts.insert(len(by), 'metric', metric)
+        parts.append(counts)
+    return merge_value_counts(parts, by)
+
+
+def merge_value_counts(frames, by=()):
+    """Adds up value-count frames (e.g. one per streamed batch)."""
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=list(by) + ['metric', 'value', 'count'])
+    keys = list(by) + ['metric', 'value']
+    return pd.concat(frames).groupby(keys, sort=False)['count'].sum().reset_index()
+
+
+def bootstrap_table(counts, by=None, confidence=CONFIDENCE, n_resamples=N_RESAMPLES, seed=SEED):
+    """
+    CIs from a value-count frame: one row per metric (and per `by` group) with
+    n, mean, ci_low, ci_high. Groups of the frame not listed in `by` are pooled.
+    """
+    by = [by] if isinstance(by, str) else list(by or [])
+    rows = []
+    for key, group in counts.groupby(by + ['metric'], sort=False):
+        key = key if isinstance(key, tuple) else (key,)
+        pooled = group.groupby('value')['count'].sum()
+        mean, low, high = bootstrap_ci(
+            pooled.index.to_numpy(), pooled.to_numpy(), confidence, n_resamples, seed
+        )
+        rows.append((*key, int(pooled.sum()), mean, low, high))
+    return pd.DataFrame(rows, columns=by + ['metric', 'n', 'mean', 'ci_low', 'ci_high'])
+
+
+# ==========================================
+# PAIRED TESTS (run B vs run A on the same queries)
+# ==========================================
+
+def paired_permutation_pvalue(diffs, n_permutations=N_RESAMPLES, seed=SEED):
+    """
+    Two-sided sign-flip permutation test of mean(diffs) == 0.
+
+    Under H0 each paired difference keeps its magnitude and gets a random sign.
+    For the c queries sharing the same |d|, the flipped sum is |d| * (2B - c)
+    with B ~ Binomial(c, 1/2), so one permutation is one binomial draw per
+    DISTINCT magnitude instead of one coin per query.
+    """
+    diffs = np.asarray(diffs, dtype=np.float64)
+    diffs = diffs[diffs != 0]        # zero differences are unchanged by any flip
+    if len(diffs) == 0:
+        return 1.0
+    magnitudes, counts = np.unique(np.abs(diffs), return_counts=True)
+    rng = np.random.default_rng(seed)
+
+    observed = abs(diffs.sum())
+    exceed = 0
+    chunk = max(1, CHUNK_ELEMENTS // len(magnitudes))
+    for start in range(0, n_permutations, chunk):
+        size = min(chunk, n_permutations - start)
+        positives = rng.binomial(counts, 0.5, size=(size, len(counts)))
+        sums = (2 * positives - counts) @ magnitudes
+        exceed += int((np.abs(sums) >= observed - 1e-12).sum())
+    return (exceed + 1) / (n_permutations + 1)
+
+
+def paired_comparison(a, b, confidence=CONFIDENCE, n_resamples=N_RESAMPLES, seed=SEED):
+    """
+    Paired comparison of per-query values (b - a): mean difference with a
+    bootstrap CI, permutation p-value and Cohen's d_z (mean / std of the diffs).
+    """
+    diffs = np.asarray(b, dtype=np.float64) - np.asarray(a, dtype=np.float64)
+    n = len(diffs)
+    if n == 0:
+        return {'n': 0, 'mean_a': np.nan, 'mean_b': np.nan, 'diff': np.nan,
+                'ci_low': np.nan, 'ci_high': np.nan, 'p_value': np.nan, 'effect_size': np.nan}
+    diff, low, high = bootstrap_ci(diffs, confidence=confidence, n_resamples=n_resamples, seed=seed)
+    std = diffs.std(ddof=1) if n > 1 else 0.0
+    return {
+        'n': n,
+        'mean_a': float(np.mean(a)),
+        'mean_b': float(np.mean(b)),
+        'diff': diff,
+        'ci_low': low,
+        'ci_high': high,
+        'p_value': paired_permutation_pvalue(diffs, n_resamples, seed),
+        'effect_size': float(diff / std) if std > 0 else 0.0,
+    }
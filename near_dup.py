@@ -0,0 +1,241 @@
+"""
+Near-duplicate question filter: incremental MinHash-LSH index.
+
+Questions are compared as SETS of content words: accents folded, lowercased,
+Spanish stopwords removed and plurals lightly stemmed, so
+"¿Qué es FOGAES?" and "que es el fogaes" are the same set {fogae}.
+Similarity is the Jaccard index of those sets.
+
+MinHash signatures (NUM_PERM hashes) are split into bands; questions sharing
+any band bucket are candidates, and candidates are then checked with the
+exact Jaccard of their word sets (no false positives). A lookup costs one
+signature plus NUM_PERM / rows dict lookups, independent of the index size.
+
+Post-pass for RAGAS / deepeval outputs (keeps the first of each group):
+    python near_dup.py testsets/test_nuevo_pipeline.parquet
+    python near_dup.py synthetic_data/chilean_bank_goldens.json --threshold 0.7
+"""
+import argparse
+import hashlib
+import os
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from testset_io import read_testset, write_testset
+
+DEFAULT_THRESHOLD = 0.75   # Jaccard of the content-word sets
+NUM_PERM = 128
+SEED = 1
+# Band layout favours recall: candidates are verified with the exact Jaccard,
+# so a false positive only costs one set comparison, a false negative a duplicate
+FALSE_NEGATIVE_WEIGHT = 0.9
+# Question column of each generator's output (first one present is used)
+QUESTION_COLUMNS = ['user_input', 'question', 'input']
+
+# Accent-folded Spanish stopwords (question words included: they carry no topic)
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bien cada
+como con contra cual cuales cualquier cuando cuanto cuanta cuantos cuantas de del
+desde donde dos e el ella ellas ello ellos en entre era eran es esa esas ese eso esos
+esta estan estar estas este esto estos fue fueron ha hace hacer han hasta hay la las le les lo
+los mas me mi mis mucho muy nada ni no nos nuestra nuestro o os otra otro otros para pero
+poco por porque puede pueden puedo que quien quienes se sea ser si sin sobre son su sus
+tambien tan tanto te tengo tiene tienen todo todos tu tus un una unas uno unos usted ustedes
+y ya yo dime oye hola gracias saber quiero quisiera necesito favor
+""".split())
+
+
+def fold(text):
+    """Lowercase, accents removed (NFKD), everything but letters/digits -> space."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return re.sub(r'[^a-z0-9]+', ' ', text).strip()
+
+
+def stem(word):
+    """Light plural stripping (tasas -> tasa, creditos -> credito); same rule on both sides."""
+    return word[:-1] if len(word) > 4 and word.endswith('s') else word
+
+
+def tokenize(text):
+    """Content-word set of a question (all words if it has no content words)."""
+    words = fold(text).split()
+    tokens = {stem(w) for w in words if w not in SPANISH_STOPWORDS}
+    return frozenset(tokens or words)
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def optimal_bands(threshold, num_perm=NUM_PERM, fn_weight=FALSE_NEGATIVE_WEIGHT):
+    """
+    (bands, rows) with bands * rows <= num_perm minimizing the weighted false
+    positive + false negative probability mass around `threshold` (as in datasketch).
+    """
+    s = np.linspace(0, 1, 201)
+    best, best_error = (1, num_perm), np.inf
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        p = 1 - (1 - s ** rows) ** bands
+        error = np.trapezoid(np.where(s < threshold, (1 - fn_weight) * p, fn_weight * (1 - p)), s)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash-LSH index of questions. add / query / remove by key.
+    query() returns (key, similarity) of the most similar indexed question with
+    Jaccard >= threshold, or None.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=NUM_PERM, seed=SEED):
+        self.threshold = threshold
+        self.bands, self.rows = optimal_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        size = self.bands * self.rows
+        # Multiply-add hashing mod 2^64, keeping the (well mixed) high 32 bits
+        self._mul = rng.integers(1, 2**63, size=size, dtype=np.uint64) | np.uint64(1)
+        self._add = rng.integers(0, 2**63, size=size, dtype=np.uint64)
+        self._buckets = [dict() for _ in range(self.bands)]
+        self.tokens = {}     # key -> token set
+        self.texts = {}      # key -> original question
+        self._band_keys = {}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def _signature(self, tokens):
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(t.encode('utf-8'), digest_size=8).digest(), 'little')
+             for t in sorted(tokens)] or [0],
+            dtype=np.uint64
+        )
+        with np.errstate(over='ignore'):
+            permuted = (hashes[:, None] * self._mul + self._add) >> np.uint64(32)
+        return permuted.min(axis=0)
+
+    def _bands_of(self, tokens):
+        signature = self._signature(tokens)
+        return [signature[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(self.bands)]
+
+    def _best_match(self, tokens, band_keys):
+        candidates = set()
+        for buckets, band_key in zip(self._buckets, band_keys):
+            candidates.update(buckets.get(band_key, ()))
+        best = None
+        for key in candidates:
+            similarity = jaccard(tokens, self.tokens[key])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def query(self, text):
+        tokens = tokenize(text)
+        return self._best_match(tokens, self._bands_of(tokens))
+
+    def add(self, text, key):
+        tokens = tokenize(text)
+        self._insert(key, text, tokens, self._bands_of(tokens))
+
+    def add_if_new(self, text, key):
+        """Indexes `text` unless it near-duplicates an indexed question; returns that match (or None)."""
+        tokens = tokenize(text)
+        band_keys = self._bands_of(tokens)
+        match = self._best_match(tokens, band_keys)
+        if match is None:
+            self._insert(key, text, tokens, band_keys)
+        return match
+
+    def _insert(self, key, text, tokens, band_keys):
+        if key in self.tokens:
+            self.remove(key)
+        for buckets, band_key in zip(self._buckets, band_keys):
+            buckets.setdefault(band_key, set()).add(key)
+        self.tokens[key] = tokens
+        self.texts[key] = text
+        self._band_keys[key] = band_keys
+
+    def remove(self, key):
+        if key not in self.tokens:
+            return
+        for buckets, band_key in zip(self._buckets, self._band_keys.pop(key)):
+            bucket = buckets[band_key]
+            bucket.discard(key)
+            if not bucket:
+                del buckets[band_key]
+        del self.tokens[key]
+        del self.texts[key]
+
+
+def find_question_column(df):
+    for col in QUESTION_COLUMNS:
+        if col in df.columns:
+            return col
+    raise ValueError(f"No question column found (looked for {QUESTION_COLUMNS}).")
+
+
+def drop_near_duplicates(df, column=None, threshold=DEFAULT_THRESHOLD):
+    """
+    Keeps the first question of each near-duplicate group.
+    Returns (kept rows, dropped rows with `duplicate_of` (row index) and `similarity`).
+    """
+    column = column or find_question_column(df)
+    index = NearDuplicateIndex(threshold)
+    duplicate_of, similarity = {}, {}
+    for row, question in zip(df.index, df[column]):
+        match = index.add_if_new(question, row)
+        if match is not None:
+            duplicate_of[row], similarity[row] = match
+    is_dup = df.index.isin(list(duplicate_of))
+    dropped = df[is_dup].copy()
+    dropped['duplicate_of'] = [duplicate_of[r] for r in dropped.index]
+    dropped['similarity'] = [similarity[r] for r in dropped.index]
+    return df[~is_dup], dropped
+
+
+# ==========================================
+# CLI: post-pass over a generated testset
+# ==========================================
+
+def read_any(path):
+    return pd.read_json(path) if path.endswith('.json') else read_testset(path)
+
+
+def write_any(df, path):
+    if path.endswith('.json'):
+        df.to_json(path, orient='records', force_ascii=False, indent=2)
+    else:
+        write_testset(df, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop near-duplicate questions from a testset.")
+    parser.add_argument("path", help="Testset (.parquet, .csv or deepeval .json)")
+    parser.add_argument("--column", help=f"Question column (default: first of {QUESTION_COLUMNS})")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Jaccard similarity of the content words above which a question is a duplicate.")
+    parser.add_argument("--output", help="Default: <name>.dedup.<ext> next to the input")
+    args = parser.parse_args()
+
+    df = read_any(args.path)
+    column = args.column or find_question_column(df)
+    kept, dropped = drop_near_duplicates(df, column, args.threshold)
+
+    for row, r in dropped.iterrows():
+        print(f"  ✂️ [{r['similarity']:.2f}] {r[column]!r}  ~  {df.loc[r['duplicate_of'], column]!r}")
+    stem_path, ext = os.path.splitext(args.path)
+    output = args.output or f"{stem_path}.dedup{ext}"
+    write_any(kept.reset_index(drop=True), output)
+    print(f"\n✅ {len(df)} questions -> {len(kept)} kept, {len(dropped)} near-duplicates dropped.")
+    print(f"Saved to: {output}")
+
+if __name__ == "__main__":
+    main()
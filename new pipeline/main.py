@@ -1,7 +1,16 @@
 import os
+import sys
 import json
+import math
+import hashlib
+import argparse
+import time
 import random
+import asyncio
 import boto3
+from collections import Counter, deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from typing import List, Dict, Optional
 from tqdm import tqdm # You may need to pip install tqdm
@@ -11,20 +20,73 @@ from langchain_community.document_loaders import DirectoryLoader, UnstructuredMa
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 
+# Shared modules live at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from testset_io import write_testset
+from llm_cache import LLMCache, CachedChatModel
+from near_dup import NearDuplicateIndex
+from sampler import ChunkSampler
+from precritic import PreCritic
+from llm_telemetry import LLMTelemetry, in_stage
+from rate_limiter import RATE_LIMITER
+
 # ==========================================
 # CONFIGURATION
 # ==========================================
 
 FOLDER_PATH = "./kb_nuevo_pipeline"
-OUTPUT_FILE = "testsets/test_nuevo_pipeline_manual.csv"
+OUTPUT_FILE = "testsets/test_nuevo_pipeline_manual.parquet"
+EXPORT_CSV_FILE = "testsets/test_nuevo_pipeline_manual.csv"  # human-readable copy
+# Crash-safe JSONL journal of every launched attempt and every verdict (approved AND
+# rejected, with reasons). `python main.py --resume` continues from it.
+JOURNAL_FILE = "testsets/test_nuevo_pipeline_manual.journal.jsonl"
+# Draws / approved samples per source document (see sampler.py)
+COVERAGE_FILE = "testsets/test_nuevo_pipeline_manual.coverage.csv"
+# One record per Bedrock call (stage, tokens, latency, retries, cost); see llm_telemetry.py
+TELEMETRY_FILE = "testsets/test_nuevo_pipeline_manual.telemetry.jsonl"
+# None = new random seed per run (stored in the journal, so --resume can replay it).
+# Generator answers are cached per (seed, attempt): only a run started with the SAME seed
+# (`--seed N`, or a fixed value here) replays an earlier run's inputs and cached answers.
+RANDOM_SEED = None
+# Shared on-disk LLM response cache (llm_cache.py): identical calls are not paid twice
+USE_LLM_CACHE = True
 TESTSET_SIZE = 30 # Number of *successful* samples desired
 MAX_RETRIES = 3   # How many times to retry generating if the Critic rejects
 
+# CONCURRENCY (generation and critique run as separate bounded pools, linked by a queue)
+GENERATOR_CONCURRENCY = 8   # generation calls in flight
+CRITIC_CONCURRENCY = 8      # critic calls in flight
+CRITIC_QUEUE_SIZE = 16      # generated samples waiting for the critic (backpressure)
+# Candidates in flight are sized from the observed acceptance rate:
+#   needed = remaining / acceptance_rate * OVERPROVISION_FACTOR
+PRIOR_ACCEPTANCE_RATE = 0.5 # assumed until the critic has judged a few samples
+PRIOR_WEIGHT = 4            # how many "virtual" verdicts the prior is worth
+OVERPROVISION_FACTOR = 1.2
+MAX_ATTEMPTS = TESTSET_SIZE * 20  # hard stop if (almost) everything is rejected
+# Chunks below these are never drawn (filtered once when the sampler is built)
+MIN_CHUNK_LENGTH = 100      # very short chunks are usually noise
+MIN_CHUNK_WORDS = 15
+
+# PRE-CRITIC: local rules (meta-references, BD1 codes, length, answer grounding) reject
+# obvious failures before any critic call (see precritic.py)
+USE_PRECRITIC = True
+
+# NEAR-DUPLICATES: a question whose content words overlap an approved / in-critique
+# question by at least this Jaccard is dropped before the critic (None = off, see near_dup.py)
+NEAR_DUP_THRESHOLD = 0.75
+
+# BATCHED CRITIC: one request audits up to CRITIC_BATCH_SIZE pairs (1 = one call per pair).
+# Pairs missing from / unparseable in the batch answer are re-checked one by one.
+CRITIC_BATCH_SIZE = 5
+CRITIC_BATCH_WAIT = 0.5     # seconds a critic worker waits to fill a batch
+
 # BEDROCK CONFIG
 # Note: Ensure "openai.gpt-oss-120b-1:0" is the correct ID for your Bedrock Setup. 
 # Usually Bedrock IDs look like "anthropic.claude-3-sonnet-..." or "amazon.titan..."
 BEDROCK_MODEL_ID = "openai.gpt-oss-120b-1:0" 
 REGION_NAME = "us-east-2"
+# Optional endpoint override, e.g. http://localhost:8787 for local_bedrock_server.py
+ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")
 
 # ==========================================
 # PERSONAS DEFINITION
@@ -61,6 +123,8 @@ PERSONAS = [
     }
 ]
 
+PERSONAS_BY_NAME = {p["name"]: p for p in PERSONAS}
+
 # ==========================================
 # PROMPTS
 # ==========================================
@@ -107,6 +171,32 @@ Salida (JSON):
 }}
 """
 
+BATCH_CRITIC_PROMPT = """
+Actúa como un Auditor de Calidad de Datos (Critic).
+Evalúa POR SEPARADO cada uno de los siguientes pares Pregunta/Respuesta. Cada par fue generado a partir de su propio contexto.
+
+{items}
+
+Criterios de Aprobación (para cada par deben cumplirse TODOS):
+1. La pregunta NO menciona "el texto", "el documento", "la información dada" ni nada meta-referencial.
+2. La respuesta es correcta y está totalmente respaldada por el Contexto de ESE par.
+3. La pregunta tiene sentido por sí misma (no depende de leer el contexto previamente).
+4. El idioma parece Español Chileno / Natural (no robótico).
+
+Salida (JSON), exactamente un veredicto por id:
+{{
+    "verdicts": [
+        {{"id": 1, "approved": true/false, "reason": "Explica brevemente por qué aprobaste o rechazaste"}}
+    ]
+}}
+"""
+
+BATCH_CRITIC_ITEM = """### Par {item_id}
+Contexto: "{context_text}"
+Pregunta Generada: "{question}"
+Respuesta Generada: "{ground_truth}"
+"""
+
 # ==========================================
 # HELPER FUNCTIONS
 # ==========================================
@@ -121,14 +211,23 @@ def clean_json_output(content: str) -> dict:
         content = content[start:end]
     return json.loads(content)
 
-def init_llm():
-    boto3_client = boto3.client(service_name='bedrock-runtime', region_name=REGION_NAME)
-    return ChatBedrockConverse(
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token) when the response carries no usage data."""
+    return max(1, len(text) // 4)
+
+def init_llm(telemetry=None):
+    boto3_client = boto3.client(service_name='bedrock-runtime', region_name=REGION_NAME, endpoint_url=ENDPOINT_URL)
+    if telemetry is not None:
+        telemetry.instrument_client(boto3_client)
+    # Paces calls to the account quota and retries throttles (rate_limiter.py)
+    RATE_LIMITER.instrument_client(boto3_client)
+    llm = ChatBedrockConverse(
         client=boto3_client,
         model=BEDROCK_MODEL_ID,
         temperature=0.7, # Creativity for questions
         max_tokens=2000,
     )
+    return CachedChatModel(llm, LLMCache() if USE_LLM_CACHE else None)
 
 def load_documents():
     print(f"Loading documents from {FOLDER_PATH}...")
@@ -145,97 +244,621 @@ def load_documents():
     return chunks
 
 # ==========================================
-# MAIN LOGIC
+# JOURNAL (CHECKPOINT / RESUME)
 # ==========================================
 
-def main():
-    llm = init_llm()
-    chunks = load_documents()
-    
-    if not chunks:
-        print("Error: No documents found.")
-        return
+class GenerationJournal:
+    """
+    Append-only JSONL journal; every line is flushed and fsynced, so a crash or
+    Ctrl-C loses at most the calls still in flight. Record types:
+      header   {"seed", "testset_size", "n_chunks", "chunks_hash", "created_at"}
+      attempt  {"attempt", "chunk_index", "persona", "redo"}   a generation was launched
+      verdict  {"attempt", "approved", "reason", "stage", "question", "ground_truth",
+                "reference_contexts", "persona", "source"}     decision (approved or rejected);
+                stage "critic", or "precritic" (+ "rule") / "near_duplicate" when
+                dropped before the critic
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        if self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            if torn:
+                self._file.write("\n")   # close a line torn by a crash before appending
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def load(path):
+        """All complete records (a line torn by a crash is ignored)."""
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+
+def chunks_fingerprint(chunks):
+    """Identifies the chunk list, so a resume can tell whether chunk indices still match."""
+    digest = hashlib.blake2b(digest_size=16)
+    for chunk in chunks:
+        digest.update(chunk.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def make_sampler(chunks, rng):
+    return ChunkSampler(chunks, rng, root=FOLDER_PATH, min_length=MIN_CHUNK_LENGTH, min_words=MIN_CHUNK_WORDS)
+
+
+def draw_inputs(rng, sampler):
+    """1. Select Inputs (the ONLY place the pipeline consumes the RNG, directly or via the sampler)."""
+    chunk_index = sampler.draw()
+    persona = rng.choice(PERSONAS)
+    return chunk_index, persona
+
+
+def restore_from_journal(records, chunks, target):
+    """
+    Rebuilds the state of an interrupted run from its journal:
+      - approved samples (first `target`, in journal order) and verdict counts
+      - attempts launched but never judged (in flight / failed), to be redone first
+      - the RNG and chunk sampler, re-seeded and fast-forwarded through the same draws
+    """
+    header = next((r for r in records if r["type"] == "header"), None)
+    if header is None:
+        raise ValueError("journal has no header record")
+
+    rng = random.Random(header["seed"])
+    sampler = make_sampler(chunks, rng)
+    attempts, judged = {}, set()
+    testset_data, rejected, duplicates = [], 0, 0
+    precritic_rules = Counter()
+    approved_questions = []   # all of them (also late approvals), for the near-duplicate index
+    replay_ok = header["chunks_hash"] == chunks_fingerprint(chunks)
+
+    for record in records:
+        if record["type"] == "attempt":
+            attempts[record["attempt"]] = record
+            if not record.get("redo") and replay_ok:
+                chunk_index, persona = draw_inputs(rng, sampler)
+                replay_ok = (chunk_index, persona["name"]) == (record["chunk_index"], record["persona"])
+        elif record["type"] == "verdict":
+            judged.add(record["attempt"])
+            if record["attempt"] in attempts:
+                sampler.record_verdict(attempts[record["attempt"]]["chunk_index"], record["approved"])
+            if record["approved"]:
+                approved_questions.append(record["question"])
+                if len(testset_data) < target:
+                    testset_data.append({k: record[k] for k in (
+                        "question", "ground_truth", "reference_contexts", "persona", "source"
+                    )} | {"critic_comment": record["reason"]})
+            elif record.get("stage") == "near_duplicate":
+                duplicates += 1
+            elif record.get("stage") == "precritic":
+                precritic_rules[record.get("rule")] += 1
+            else:
+                rejected += 1
+
+    if not replay_ok:
+        # Chunks changed since the journal was written: old indices are meaningless
+        print("⚠️ Chunks differ from the journal: not redoing unfinished attempts, using fresh draws.")
+        rng = random.Random(f"{header['seed']}-resume-{len(attempts)}")
+        sampler = make_sampler(chunks, rng)
+        redo = []
+    else:
+        redo = [
+            (a, r["chunk_index"], PERSONAS_BY_NAME[r["persona"]])
+            for a, r in sorted(attempts.items()) if a not in judged and r["persona"] in PERSONAS_BY_NAME
+        ]
+
+    return {
+        "seed": header["seed"],
+        "rng": rng,
+        "sampler": sampler,
+        "testset_data": testset_data,
+        "redo": redo,
+        "attempts": len(attempts),
+        "next_attempt": max(attempts, default=-1) + 1,
+        "approved": sum(1 for r in records if r["type"] == "verdict" and r["approved"]),
+        "rejected": rejected,
+        "duplicates": duplicates,
+        "precritic_rules": precritic_rules,
+        "approved_questions": approved_questions,
+    }
+
+# ==========================================
+# ASYNC GENERATOR -> CRITIC PIPELINE
+# ==========================================
+
+class PipelineStats:
+    """Counters shared by the pipeline tasks (all run on the same event loop)."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.generation_errors = 0
+        self.critiqued = 0
+        self.approved = 0
+        self.rejected = 0
+        self.critic_errors = 0
+        self.duplicates = 0  # near-duplicates dropped before the critic
+        self.precritic_rejected = 0  # rejected by the local rules before the critic
+        self.pending = 0   # candidates launched but not yet judged (generating, queued or in critique)
+        # Critic cost accounting (batched vs. what one call per pair would have cost)
+        self.critic_requests = 0
+        self.critic_items = 0
+        self.critic_fallbacks = 0
+        self.critic_input_tokens = 0
+        self.critic_output_tokens = 0
+        self.single_input_tokens = 0   # estimated input tokens of one CRITIC_PROMPT call per pair
+        self.single_output_tokens = 0  # estimated output tokens of one call per pair
+
+    def record_critic_call(self, usage, prompt_tokens_single, n_items):
+        """
+        `prompt_tokens_single`: estimated input tokens if the n_items had been sent
+        one by one. Fallback re-checks pass n_items=0: they are pure extra cost.
+        """
+        self.critic_requests += 1
+        self.critic_items += n_items
+        self.critic_input_tokens += usage["input_tokens"]
+        self.critic_output_tokens += usage["output_tokens"]
+        self.single_input_tokens += prompt_tokens_single
+        if n_items:
+            # Per-pair verdicts are about the same size alone or in a batch
+            self.single_output_tokens += usage["output_tokens"]
+
+    def critic_savings(self):
+        """(requests saved, tokens saved) versus one critic call per pair."""
+        requests = self.critic_items - self.critic_requests
+        tokens = (self.single_input_tokens + self.single_output_tokens
+                  - self.critic_input_tokens - self.critic_output_tokens)
+        return requests, tokens
+
+    def acceptance_rate(self):
+        """
+        Approved / judged (pre-critic rejections and near-duplicates count as judged:
+        they also used up a launched candidate), smoothed with the prior so early
+        estimates stay sane.
+        """
+        judged = self.critiqued + self.duplicates + self.precritic_rejected
+        return (self.approved + PRIOR_ACCEPTANCE_RATE * PRIOR_WEIGHT) / (judged + PRIOR_WEIGHT)
+
+    def candidates_needed(self, target):
+        """How many candidates should be in flight to end up with `target` approvals."""
+        remaining = target - self.approved
+        return math.ceil(remaining / max(self.acceptance_rate(), 0.05) * OVERPROVISION_FACTOR)
+
+
+async def call_llm(llm, executor, prompt, stage, cache_variant=None):
+    """
+    Runs the (blocking) LangChain call on the pipeline's thread pool.
+    Returns (parsed JSON, usage) with usage = {"input_tokens", "output_tokens"}.
+    `stage` ("generator" / "critic") tags the call in the telemetry log.
+    `cache_variant` keeps identical prompts apart in the LLM cache (None = shared answer).
+    """
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(executor, in_stage, stage, llm.invoke, prompt, cache_variant)
+    usage = getattr(response, "usage_metadata", None) or {}
+    usage = {
+        "input_tokens": usage.get("input_tokens") or estimate_tokens(prompt),
+        "output_tokens": usage.get("output_tokens") or estimate_tokens(response.content),
+    }
+    return clean_json_output(response.content), usage
+
+
+async def generate_candidate(llm, executor, chunk, persona, attempt=None, seed=None):
+    """
+    STEP 1: GENERATION. Returns a candidate dict (raises if the output was unusable).
+    The same chunk + persona is drawn many times at temperature > 0, so the cache
+    key includes the run seed and attempt: only a rerun of the SAME attempt of the
+    SAME seed (--resume / --seed) reuses the answer.
+    """
+    context_text = chunk.page_content
+    gen_data, _ = await call_llm(llm, executor, GENERATOR_PROMPT.format(
+        persona_desc=persona["desc"],
+        context_text=context_text
+    ), "generator", cache_variant=f"{seed}-{attempt}")
+    return {
+        "question": gen_data.get("question"),
+        "ground_truth": gen_data.get("ground_truth"),
+        "context_text": context_text,
+        "persona": persona,
+        "chunk": chunk,
+    }
 
-    testset_data = []
-    
-    # Progress bar loop
-    pbar = tqdm(total=TESTSET_SIZE, desc="Generating Testset")
-    
-    while len(testset_data) < TESTSET_SIZE:
-        
-        # 1. Select Random Inputs
-        chunk = random.choice(chunks)
-        persona = random.choice(PERSONAS)
-        context_text = chunk.page_content
-        
-        # Skip very short chunks (usually noise)
-        if len(context_text) < 100:
-            continue
 
-        # -----------------------
-        # STEP 1: GENERATION
-        # -----------------------
+def single_critic_prompt(candidate):
+    return CRITIC_PROMPT.format(
+        context_text=candidate["context_text"],
+        question=candidate["question"],
+        ground_truth=candidate["ground_truth"]
+    )
+
+
+async def critique_candidate(llm, executor, candidate, stats, fallback=False):
+    """STEP 2: CRITIC VALIDATION (one pair). Returns (approved, reason)."""
+    prompt = single_critic_prompt(candidate)
+    critic_data, usage = await call_llm(llm, executor, prompt, "critic")
+    if fallback:
+        stats.record_critic_call(usage, 0, 0)
+    else:
+        stats.record_critic_call(usage, usage["input_tokens"], 1)
+    return critic_data.get("approved", False), critic_data.get("reason", "No reason provided")
+
+
+async def critique_batch(llm, executor, candidates, stats):
+    """
+    STEP 2 (batched): audits all `candidates` in one call, verdicts matched by id.
+    Returns a list aligned with `candidates` of (approved, reason), or None for
+    pairs without a usable verdict (the caller re-checks those one by one).
+    """
+    if len(candidates) == 1:
+        return [await critique_candidate(llm, executor, candidates[0], stats)]
+
+    items = "\n".join(
+        BATCH_CRITIC_ITEM.format(
+            item_id=i,
+            context_text=c["context_text"],
+            question=c["question"],
+            ground_truth=c["ground_truth"]
+        )
+        for i, c in enumerate(candidates, start=1)
+    )
+    prompt = BATCH_CRITIC_PROMPT.format(items=items)
+    try:
+        critic_data, usage = await call_llm(llm, executor, prompt, "critic")
+    except Exception:
+        return [None] * len(candidates)
+
+    # Input tokens the same pairs would have cost one by one (same tokens-per-char ratio)
+    tokens_per_char = usage["input_tokens"] / max(len(prompt), 1)
+    single_tokens = sum(len(single_critic_prompt(c)) for c in candidates) * tokens_per_char
+    stats.record_critic_call(usage, int(single_tokens), len(candidates))
+
+    verdicts = {}
+    for verdict in critic_data.get("verdicts", []) if isinstance(critic_data, dict) else []:
         try:
-            gen_prompt = GENERATOR_PROMPT.format(
-                persona_desc=persona["desc"],
-                context_text=context_text
-            )
-            
-            response = llm.invoke(gen_prompt)
-            gen_data = clean_json_output(response.content)
-            
-            question = gen_data.get("question")
-            ground_truth = gen_data.get("ground_truth")
-
-        except Exception as e:
-            # print(f"Generation parsing error: {e}")
-            continue # Skip to next attempt
-
-        # -----------------------
-        # STEP 2: CRITIC VALIDATION
-        # -----------------------
+            if isinstance(verdict.get("approved"), bool):
+                verdicts[int(verdict["id"])] = (verdict["approved"], verdict.get("reason", "No reason provided"))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            continue
+    return [verdicts.get(i) for i in range(1, len(candidates) + 1)]
+
+
+async def run_pipeline(llm, chunks, journal, state, target=TESTSET_SIZE):
+    """
+    Producer/consumer pipeline:
+      dispatcher --(GENERATOR_CONCURRENCY generation tasks)--> queue --> CRITIC_CONCURRENCY critic workers
+
+    The dispatcher only launches a new generation while fewer than
+    `candidates_needed` candidates are pending, so the work in flight follows the
+    observed acceptance rate. Everything stops once `target` samples are approved
+    (extra approvals from calls already in flight are journaled, not used).
+
+    `state` comes from restore_from_journal (or is a fresh one): unfinished
+    attempts of a previous run are redone before new inputs are drawn.
+    """
+    stats = PipelineStats()
+    rng = state["rng"]
+    sampler = state["sampler"]
+    redo = deque(state["redo"])
+    next_attempt = state["next_attempt"]
+    testset_data = state["testset_data"][:target]
+    stats.attempts = state["attempts"]
+    stats.approved = len(testset_data)
+    stats.rejected = state["rejected"]
+    stats.critiqued = state["approved"] + state["rejected"]
+    stats.duplicates = state["duplicates"]
+    precritic = PreCritic() if USE_PRECRITIC else None
+    if precritic is not None:
+        precritic.rejections.update(state["precritic_rules"])
+        stats.precritic_rejected = precritic.rejected
+        precritic.checked = stats.critiqued + stats.duplicates + stats.precritic_rejected
+    # Approved questions + those in critique; a candidate leaves it again if not approved
+    near_dups = NearDuplicateIndex(NEAR_DUP_THRESHOLD) if NEAR_DUP_THRESHOLD is not None else None
+    for i, question in enumerate(state["approved_questions"] if near_dups is not None else []):
+        near_dups.add(str(question or ""), key=-(i + 1))
+    queue = asyncio.Queue(maxsize=CRITIC_QUEUE_SIZE)
+    generator_slots = asyncio.Semaphore(GENERATOR_CONCURRENCY)
+    progress = asyncio.Event()   # set whenever a candidate is judged or dropped
+    done = asyncio.Event()
+    executor = ThreadPoolExecutor(max_workers=GENERATOR_CONCURRENCY + CRITIC_CONCURRENCY)
+    pbar = tqdm(total=target, initial=len(testset_data), desc="Generating Testset")
+    if len(testset_data) >= target:
+        done.set()
+
+    def candidate_finished():
+        stats.pending -= 1
+        progress.set()
+
+    async def generation_task(attempt, chunk_index, persona):
         try:
-            critic_input = CRITIC_PROMPT.format(
-                context_text=context_text,
-                question=question,
-                ground_truth=ground_truth
-            )
-            
-            # Use lower temp for critic to be strict
-            response_critic = llm.invoke(critic_input) 
-            critic_data = clean_json_output(response_critic.content)
-            
-            is_approved = critic_data.get("approved", False)
-            reason = critic_data.get("reason", "No reason provided")
-
-            if is_approved:
-                # Success! Add to dataset
-                testset_data.append({
-                    "question": question,
-                    "ground_truth": ground_truth,
-                    "reference_contexts": [context_text], 
-                    "persona": persona["name"],
-                    "source": chunk.metadata.get("source", "unknown"),
-                    "critic_comment": reason
-                })
-                pbar.update(1)
-            else:
-                # Optional: Print why it failed to fine-tune prompts later
-                # print(f"Rejected ({persona['name']}): {reason}")
+            candidate = await generate_candidate(llm, executor, chunks[chunk_index], persona, attempt, state["seed"])
+            candidate["attempt"] = attempt
+            candidate["chunk_index"] = chunk_index
+        except Exception:
+            stats.generation_errors += 1
+            candidate_finished()
+            return
+        finally:
+            generator_slots.release()
+        if precritic is not None:
+            failure = precritic.check(candidate)
+            if failure is not None:
+                record_precritic_rejection(candidate, *failure)
+                candidate_finished()
+                return
+        if near_dups is not None:
+            match = near_dups.add_if_new(str(candidate["question"] or ""), key=attempt)
+            if match is not None:
+                record_duplicate(candidate, *match)
+                candidate_finished()
+                return
+        await queue.put(candidate)
+
+    async def next_batch():
+        """Up to CRITIC_BATCH_SIZE queued candidates (waits at most CRITIC_BATCH_WAIT to fill it)."""
+        batch = [await queue.get()]
+        deadline = asyncio.get_running_loop().time() + CRITIC_BATCH_WAIT
+        while len(batch) < CRITIC_BATCH_SIZE and not done.is_set():
+            try:
+                batch.append(queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
                 pass
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            # Not asyncio.wait_for: before Python 3.12 it can time out AFTER queue.get()
+            # took an item, losing that candidate (and leaving it pending forever).
+            # A getter that is not done has not taken its item yet, so it can be cancelled.
+            getter = asyncio.ensure_future(queue.get())
+            try:
+                await asyncio.wait({getter}, timeout=timeout)
+            finally:
+                if not getter.done():
+                    getter.cancel()
+            if getter.cancelled() or not getter.done():
+                break
+            batch.append(getter.result())
+        return batch
+
+    def sample_fields(candidate):
+        return {
+            "question": candidate["question"],
+            "ground_truth": candidate["ground_truth"],
+            "reference_contexts": [candidate["context_text"]],
+            "persona": candidate["persona"]["name"],
+            "source": candidate["chunk"].metadata.get("source", "unknown"),
+        }
+
+    def record_precritic_rejection(candidate, rule, reason):
+        stats.precritic_rejected += 1
+        sampler.record_verdict(candidate["chunk_index"], False)
+        journal.write({
+            "type": "verdict", "attempt": candidate["attempt"], "approved": False,
+            "reason": f"Pre-critic ({rule}): {reason}", "stage": "precritic", "rule": rule,
+            **sample_fields(candidate),
+        })
+
+    def record_duplicate(candidate, match_key, similarity):
+        stats.duplicates += 1
+        sampler.record_verdict(candidate["chunk_index"], False)
+        journal.write({
+            "type": "verdict", "attempt": candidate["attempt"], "approved": False,
+            "reason": f"Near-duplicate (Jaccard {similarity:.2f}) of: {near_dups.texts[match_key]}",
+            "stage": "near_duplicate", **sample_fields(candidate),
+        })
+
+    def record_verdict(candidate, is_approved, reason):
+        stats.critiqued += 1
+        sample = sample_fields(candidate)
+        # Journal every verdict (rejections too, with the critic's reason)
+        journal.write({
+            "type": "verdict", "attempt": candidate["attempt"],
+            "approved": bool(is_approved), "reason": reason, "stage": "critic", **sample,
+        })
+        sampler.record_verdict(candidate["chunk_index"], is_approved)
+        # Set last: a candidate whose verdict failed to record is not kept as a near-dup reference
+        candidate["approved"] = bool(is_approved)
+        if is_approved and len(testset_data) < target:
+            # Success! Add to dataset
+            testset_data.append({**sample, "critic_comment": reason})
+            stats.approved += 1
+            pbar.update(1)
+            if len(testset_data) >= target:
+                done.set()
+        elif not is_approved:
+            stats.rejected += 1
+
+    async def critic_worker():
+        while True:
+            batch = await next_batch()
+            try:
+                try:
+                    verdicts = await critique_batch(llm, executor, batch, stats)
+                except Exception:
+                    # The batch call itself failed: no candidate got a verdict
+                    stats.critic_errors += len(batch)
+                    verdicts = []
+                for candidate, verdict in zip(batch, verdicts):
+                    # One failing candidate must not cost the others their verdict
+                    try:
+                        if verdict is None:
+                            # Missing / unparseable in the batch answer: single-pair critique
+                            stats.critic_fallbacks += 1
+                            verdict = await critique_candidate(llm, executor, candidate, stats, fallback=True)
+                        record_verdict(candidate, *verdict)
+                    except Exception:
+                        stats.critic_errors += 1
+            finally:
+                for candidate in batch:
+                    if near_dups is not None and not candidate.get("approved"):
+                        near_dups.remove(candidate["attempt"])   # rejected / failed: not a reference
+                    queue.task_done()
+                    candidate_finished()
+
+    critics = [asyncio.create_task(critic_worker()) for _ in range(CRITIC_CONCURRENCY)]
+    generators = set()
+
+    try:
+        while not done.is_set() and (redo or stats.attempts < MAX_ATTEMPTS):
+            if stats.pending >= stats.candidates_needed(target):
+                # Enough candidates in flight for the current acceptance rate: wait for verdicts
+                progress.clear()
+                await progress.wait()
+                continue
+            await generator_slots.acquire()
+            if done.is_set():
+                generator_slots.release()
+                break
+
+            if redo:
+                # Launched by the interrupted run but never judged: same inputs again
+                attempt, chunk_index, persona = redo.popleft()
+                journal.write({"type": "attempt", "attempt": attempt, "chunk_index": chunk_index,
+                               "persona": persona["name"], "redo": True})
+            else:
+                # 1. Select Random Inputs
+                chunk_index, persona = draw_inputs(rng, sampler)
+                attempt = next_attempt
+                next_attempt += 1
+                stats.attempts += 1
+                journal.write({"type": "attempt", "attempt": attempt, "chunk_index": chunk_index,
+                               "persona": persona["name"], "redo": False})
+
+            stats.pending += 1
+            task = asyncio.create_task(generation_task(attempt, chunk_index, persona))
+            generators.add(task)
+            task.add_done_callback(generators.discard)
+
+        # Out of attempts: let the candidates already launched finish
+        while not done.is_set() and stats.pending > 0:
+            progress.clear()
+            await progress.wait()
+    finally:
+        for task in list(generators) + critics:
+            task.cancel()
+        await asyncio.gather(*generators, *critics, return_exceptions=True)
+        executor.shutdown(wait=False, cancel_futures=True)
+        pbar.close()
+
+    return testset_data, stats, precritic
 
-        except Exception as e:
-            # print(f"Critic error: {e}")
-            continue
+# ==========================================
+# MAIN LOGIC
+# ==========================================
 
-    pbar.close()
+def open_journal(path, chunks, resume, seed=None):
+    """Returns (journal, pipeline state): restored from `path` with --resume, else a new journal."""
+    if resume and os.path.exists(path):
+        state = restore_from_journal(GenerationJournal.load(path), chunks, TESTSET_SIZE)
+        print(f"Resuming from {path}: {len(state['testset_data'])} approved, "
+              f"{state['rejected']} rejected, {len(state['redo'])} unfinished attempts to redo.")
+        return GenerationJournal(path), state
+
+    if resume:
+        print(f"⚠️ No journal at {path}, starting a new run.")
+    elif os.path.exists(path):
+        # Never overwrite paid-for work: keep the previous journal next to the new one
+        backup = f"{path}.{datetime.now().strftime('%Y%m%dT%H%M%S')}.bak"
+        os.replace(path, backup)
+        print(f"Previous journal moved to {backup}")
+
+    if seed is None:
+        seed = RANDOM_SEED if RANDOM_SEED is not None else random.randrange(2**32)
+    journal = GenerationJournal(path)
+    journal.write({
+        "type": "header", "seed": seed, "testset_size": TESTSET_SIZE,
+        "n_chunks": len(chunks), "chunks_hash": chunks_fingerprint(chunks),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    rng = random.Random(seed)
+    state = {"seed": seed, "rng": rng, "sampler": make_sampler(chunks, rng), "testset_data": [], "redo": [],
+             "attempts": 0, "next_attempt": 0, "approved": 0, "rejected": 0, "duplicates": 0,
+             "precritic_rules": Counter(), "approved_questions": []}
+    return journal, state
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a validated testset (generator + critic).")
+    parser.add_argument("--resume", action="store_true",
+                        help=f"Continue an interrupted run from its journal ({JOURNAL_FILE}).")
+    parser.add_argument("--journal", default=JOURNAL_FILE)
+    parser.add_argument("--seed", type=int,
+                        help="Replay the draws (and cached generator answers) of the run with this seed.")
+    args = parser.parse_args()
+
+    telemetry = LLMTelemetry(TELEMETRY_FILE)
+    llm = init_llm(telemetry)
+    chunks = load_documents()
+    
+    if not chunks:
+        print("Error: No documents found.")
+        return
 
-    # Save to CSV
+    journal, state = open_journal(args.journal, chunks, args.resume, args.seed)
+    print(f"Run seed: {state['seed']} (python main.py --seed {state['seed']} replays this run)")
+    if not len(state["sampler"]):
+        print(f"Error: No chunks with at least {MIN_CHUNK_LENGTH} characters / {MIN_CHUNK_WORDS} words.")
+        journal.close()
+        return
+    start = time.perf_counter()
+    try:
+        testset_data, stats, precritic = asyncio.run(run_pipeline(llm, chunks, journal, state, TESTSET_SIZE))
+    except KeyboardInterrupt:
+        print(f"\n⚠️ Interrupted. Progress is in {args.journal}; continue with: python main.py --resume")
+        return
+    finally:
+        journal.close()
+    elapsed = time.perf_counter() - start
+
+    print(f"\nAttempts: {stats.attempts} | approved: {stats.approved} | rejected: {stats.rejected} | "
+          f"generation errors: {stats.generation_errors} | critic errors: {stats.critic_errors}")
+    if precritic is not None:
+        precritic.print_report()
+    if stats.duplicates:
+        print(f"Near-duplicates dropped before the critic: {stats.duplicates}")
+    print(f"Acceptance rate: {stats.acceptance_rate():.0%} | {elapsed:.1f}s "
+          f"({len(testset_data) / max(elapsed, 1e-9) * 60:.1f} samples/min)")
+    saved_requests, saved_tokens = stats.critic_savings()
+    per_sample = max(len(testset_data), 1)
+    print(f"Critic: {stats.critic_requests} requests for {stats.critic_items} pairs "
+          f"(batch size {CRITIC_BATCH_SIZE}, {stats.critic_fallbacks} single-pair fallbacks)")
+    print(f"Critic savings vs. one call per pair: {saved_requests} requests, ~{saved_tokens} tokens "
+          f"({saved_requests / per_sample:.2f} requests, ~{saved_tokens / per_sample:.0f} tokens per approved sample)")
+    if llm.cache is not None:
+        print(f"LLM cache: {llm.cache.hits} hits / {llm.cache.misses} misses "
+              f"({llm.cache.hit_rate():.0%} of calls not paid)")
+    telemetry.print_report(accepted=len(testset_data))
+    RATE_LIMITER.print_report()
+    if len(testset_data) < TESTSET_SIZE:
+        print(f"⚠️ Stopped after {MAX_ATTEMPTS} attempts with {len(testset_data)} approved samples.")
+
+    # Save (parquet keeps reference_contexts as list<string>; CSV is an export)
     df = pd.DataFrame(testset_data)
-    os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
-    df.to_csv(OUTPUT_FILE, index=False)
+    write_testset(df, OUTPUT_FILE)
+    write_testset(df, EXPORT_CSV_FILE)
     print(f"\nSuccess! Generated {len(df)} validated samples.")
     print(f"Saved to: {OUTPUT_FILE}")
 
+    print()
+    state["sampler"].print_coverage().to_csv(COVERAGE_FILE, index=False, encoding="utf-8")
+    print(f"Coverage per source document saved to: {COVERAGE_FILE}")
+    if telemetry.records:
+        print(f"LLM telemetry saved to: {TELEMETRY_FILE} ({telemetry.write_parquet()})")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,187 @@
+"""
+Deterministic pre-critic: cheap local rules run before the LLM critic.
+
+Each rule catches a mechanical violation the critic would reject anyway
+(COMMON_RULES / CRITIC_PROMPT): meta-references to "el texto" / "documento",
+internal BD1-xxxxx codes, empty / overlong questions, and answers whose
+numbers (digits or spelled out: "3" vs "tres") or key words do not appear in
+the context. Only candidates that pass
+every rule are sent to Bedrock. Rules run cheapest first; the first failing
+rule is the rejection reason and is counted per rule.
+
+Text is compared accent-folded and lowercased (near_dup.fold), so
+"según el documento" and "segun el DOCUMENTO" hit the same pattern.
+"""
+import re
+from collections import Counter
+
+from near_dup import fold, stem, SPANISH_STOPWORDS
+
+MIN_QUESTION_WORDS = 3
+MAX_QUESTION_WORDS = 35     # users ask short questions (see COMMON_RULES examples)
+MAX_QUESTION_CHARS = 250
+MIN_ANSWER_OVERLAP = 0.6    # share of the answer's content words present in the context
+
+# Folded text: "segun el documento", "en este fragmento", "la informacion provista", ...
+META_REFERENCE = re.compile(
+    r"\b(?:"
+    r"(?:el|este|del|al|dicho|ese|en el|segun el|de acuerdo al) (?:texto|documento|fragmento|contexto|pdf|archivo|extracto|parrafo)"
+    r"|(?:la|esta|dicha) (?:informacion|guia|seccion) (?:provista|dada|entregada|proporcionada|anterior|adjunta)"
+    r"|segun (?:la informacion|lo (?:indicado|descrito|mencionado|senalado))"
+    r"|(?:se|como se) (?:menciona|indica|describe|senala) (?:en el|arriba)"
+    r")\b"
+)
+# Internal document codes (BD1-00594, bd1 00594, BD1_00594)
+INTERNAL_CODE = re.compile(r"\bbd\d[\s_-]?\d{3,5}\b")
+NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Folded Spanish number words, added up within a run: "doscientos treinta y dos" -> 232
+NUMBER_WORDS = {
+    "cero": 0, "un": 1, "uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+    "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "once": 11, "doce": 12,
+    "trece": 13, "catorce": 14, "quince": 15, "dieciseis": 16, "diecisiete": 17,
+    "dieciocho": 18, "diecinueve": 19, "veinte": 20, "veintiun": 21, "veintiuno": 21,
+    "veintiuna": 21, "veintidos": 22, "veintitres": 23, "veinticuatro": 24, "veinticinco": 25,
+    "veintiseis": 26, "veintisiete": 27, "veintiocho": 28, "veintinueve": 29,
+    "treinta": 30, "cuarenta": 40, "cincuenta": 50, "sesenta": 60, "setenta": 70,
+    "ochenta": 80, "noventa": 90, "cien": 100, "ciento": 100,
+    **{f"{prefix}{suffix}": value for prefix, value in [
+        ("doscient", 200), ("trescient", 300), ("cuatrocient", 400), ("quinient", 500),
+        ("seiscient", 600), ("setecient", 700), ("ochocient", 800), ("novecient", 900),
+    ] for suffix in ("os", "as")},
+}
+NUMBER_MULTIPLIERS = {"mil": 1_000, "millon": 1_000_000, "millones": 1_000_000}
+
+
+def content_words(folded):
+    """Stemmed content words (numbers, in digits or words, are checked by check_answer_numbers)."""
+    return {stem(w) for w in folded.split()
+            if len(w) > 2 and not w.isdigit() and w not in SPANISH_STOPWORDS
+            and w not in NUMBER_WORDS and w not in NUMBER_MULTIPLIERS}
+
+
+def numbers(text):
+    """Numbers of the RAW text, digits only: "1.000" / "1000" and "0,5" / "0.5" compare equal."""
+    return {re.sub(r"\D", "", n) for n in NUMBER.findall(text)}
+
+
+def spelled_numbers(folded):
+    """Numbers written out in FOLDED text, as digit strings: "tres cuotas" -> {"3"}."""
+    found = set()
+    tokens = folded.split()
+    total = current = 0
+    in_number = False
+    for i, word in enumerate(tokens):
+        if word in NUMBER_WORDS:
+            current += NUMBER_WORDS[word]
+        elif word in NUMBER_MULTIPLIERS:
+            total += max(current, 1) * NUMBER_MULTIPLIERS[word]
+            current = 0
+        elif word == "y" and in_number and i + 1 < len(tokens) and tokens[i + 1] in NUMBER_WORDS:
+            continue   # "treinta y dos"
+        else:
+            if in_number:
+                found.add(str(total + current))
+                total = current = 0
+                in_number = False
+            continue
+        in_number = True
+    if in_number:
+        found.add(str(total + current))
+    return found
+
+
+# ==========================================
+# RULES: (name, check) -> check returns a reason string when the candidate fails
+# ==========================================
+
+def check_empty(c):
+    if not c["question"].strip() or not c["ground_truth"].strip():
+        return "pregunta o respuesta vacía"
+
+
+def check_meta_reference(c):
+    match = META_REFERENCE.search(c["question_folded"])
+    if match:
+        return f"referencia meta: '{match.group(0)}'"
+
+
+def check_internal_code(c):
+    match = INTERNAL_CODE.search(c["question_folded"])
+    if match:
+        return f"código interno: '{match.group(0)}'"
+
+
+def check_question_length(c):
+    n_words = len(c["question_folded"].split())
+    if n_words < MIN_QUESTION_WORDS:
+        return f"pregunta muy corta ({n_words} palabras)"
+    if n_words > MAX_QUESTION_WORDS or len(c["question"]) > MAX_QUESTION_CHARS:
+        return f"pregunta muy larga ({n_words} palabras, {len(c['question'])} caracteres)"
+
+
+def check_answer_numbers(c):
+    # The context may spell out what the answer writes in digits ("tres cuotas" / "3 cuotas")
+    missing = numbers(c["ground_truth"]) - numbers(c["context"]) - spelled_numbers(c["context_folded"])
+    if missing:
+        return f"cifras de la respuesta ausentes del contexto: {sorted(missing)}"
+
+
+def check_answer_overlap(c):
+    answer_words = content_words(c["answer_folded"])
+    if not answer_words:
+        return None
+    overlap = len(answer_words & content_words(c["context_folded"])) / len(answer_words)
+    if overlap < MIN_ANSWER_OVERLAP:
+        return f"respuesta poco respaldada por el contexto ({overlap:.0%} de palabras clave)"
+
+
+DEFAULT_RULES = [
+    ("empty", check_empty),
+    ("meta_reference", check_meta_reference),
+    ("internal_code", check_internal_code),
+    ("question_length", check_question_length),
+    ("answer_numbers", check_answer_numbers),
+    ("answer_overlap", check_answer_overlap),
+]
+
+
+class PreCritic:
+    """Runs the rules on a candidate ({"question", "ground_truth", "context_text"}); counts rejections per rule."""
+
+    def __init__(self, rules=DEFAULT_RULES):
+        self.rules = list(rules)
+        self.checked = 0
+        self.rejections = Counter()
+
+    def check(self, candidate):
+        """Returns None if the candidate passes, else (rule name, reason)."""
+        question = str(candidate.get("question") or "")
+        answer = str(candidate.get("ground_truth") or "")
+        context = str(candidate.get("context_text") or "")
+        prepared = {
+            "question": question,
+            "ground_truth": answer,
+            "context": context,
+            "question_folded": fold(question),
+            "answer_folded": fold(answer),
+            "context_folded": fold(context),
+        }
+        self.checked += 1
+        for name, rule in self.rules:
+            reason = rule(prepared)
+            if reason:
+                self.rejections[name] += 1
+                return name, reason
+        return None
+
+    @property
+    def rejected(self):
+        return sum(self.rejections.values())
+
+    def print_report(self):
+        print(f"Pre-critic: {self.rejected}/{self.checked} candidates rejected locally "
+              f"({self.rejected / max(self.checked, 1):.0%} of critic calls avoided)")
+        for name, _ in self.rules:
+            if self.rejections[name]:
+                print(f"  {name:<16}{self.rejections[name]:>6}")
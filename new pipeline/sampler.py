@@ -0,0 +1,174 @@
+"""
+Coverage-aware chunk sampler for the generator (built once at startup).
+
+- Pre-filter: chunks too short / with too few words / exact duplicates are
+  never drawn (no LLM call is spent on them).
+- Without replacement: every eligible chunk is drawn once before any chunk is
+  drawn again (a new "epoch" starts when the pool is exhausted).
+- Stratified: each draw goes to the (category, subcategory) stratum furthest
+  below its share (proportional to its number of source documents), then to
+  its least-drawn source document, then to that document's next unused chunk.
+  Any prefix of the draws therefore spans the whole KB as evenly as possible.
+- Coverage: draws and approvals per source document, for the end-of-run report.
+
+All randomness comes from the rng passed in, so the draw sequence is
+reproducible from the seed (the journal's --resume replays it).
+"""
+import os
+import re
+import json
+from collections import defaultdict
+
+import pandas as pd
+
+MIN_CHUNK_LENGTH = 100      # characters (very short chunks are usually noise)
+MIN_CHUNK_WORDS = 15        # headings / link lists / table fragments have few real words
+UNKNOWN = "Unknown"
+
+
+def source_strata(source, root=None):
+    """
+    (category, subcategory) of a KB file: from its Bedrock sidecar
+    '<name>.docx.metadata.json' when present, else from its folders under `root`.
+    """
+    stem = os.path.splitext(source)[0]
+    for sidecar in (f"{stem}.docx.metadata.json", f"{source}.metadata.json", f"{stem}.metadata.json"):
+        if os.path.exists(sidecar):
+            try:
+                with open(sidecar, "r", encoding="utf-8") as f:
+                    attributes = json.load(f).get("metadataAttributes", {})
+                return attributes.get("category") or UNKNOWN, attributes.get("subcategory") or UNKNOWN
+            except (OSError, ValueError, AttributeError):
+                break
+
+    folder = os.path.dirname(source)
+    folders = os.path.relpath(folder, root).split(os.sep) if root and folder else []
+    folders = [f for f in folders if f not in (".", "..", "")]
+    return (folders + [UNKNOWN, UNKNOWN])[0], (folders[1:] + [UNKNOWN])[0]
+
+
+def is_eligible(text, min_length=MIN_CHUNK_LENGTH, min_words=MIN_CHUNK_WORDS):
+    text = text.strip()
+    return len(text) >= min_length and len(re.findall(r"\w{2,}", text)) >= min_words
+
+
+class ChunkSampler:
+    """Draws chunk indices (into the `chunks` list it was built from), see module docstring."""
+
+    def __init__(self, chunks, rng, root=None, min_length=MIN_CHUNK_LENGTH, min_words=MIN_CHUNK_WORDS):
+        self.rng = rng
+        self.chunks = chunks
+        self.sources = [c.metadata.get("source", UNKNOWN) for c in chunks]
+
+        # Pre-filter (exact duplicates after whitespace normalization are dropped too)
+        seen = set()
+        self.eligible = []
+        for index, chunk in enumerate(chunks):
+            normalized = " ".join(chunk.page_content.split())
+            if is_eligible(normalized, min_length, min_words) and normalized not in seen:
+                seen.add(normalized)
+                self.eligible.append(index)
+
+        # stratum -> source -> eligible chunk indices
+        strata_cache = {}
+        self.pool = defaultdict(lambda: defaultdict(list))
+        for index in self.eligible:
+            source = self.sources[index]
+            if source not in strata_cache:
+                strata_cache[source] = source_strata(source, root)
+            self.pool[strata_cache[source]][source].append(index)
+        self.strata = strata_cache
+        total_sources = sum(len(sources) for sources in self.pool.values())
+        self.share = {s: len(sources) / total_sources for s, sources in self.pool.items()}
+
+        self.epoch = 0
+        self.draws = 0
+        self.stratum_draws = defaultdict(int)
+        self.source_draws = defaultdict(int)
+        self.source_approved = defaultdict(int)
+        self.remaining = {}
+        self._new_epoch()
+
+    def __len__(self):
+        return len(self.eligible)
+
+    def _new_epoch(self):
+        """Every eligible chunk becomes available again, in a fresh random order per source."""
+        self.epoch += 1
+        self.remaining = {}
+        for stratum, sources in self.pool.items():
+            self.remaining[stratum] = {}
+            for source, indices in sources.items():
+                order = list(indices)
+                self.rng.shuffle(order)
+                self.remaining[stratum][source] = order
+
+    def draw(self):
+        """Next chunk index."""
+        if not self.eligible:
+            raise ValueError("no eligible chunks to sample from")
+        open_strata = [s for s, sources in self.remaining.items() if any(sources.values())]
+        if not open_strata:
+            self._new_epoch()
+            open_strata = list(self.remaining)
+
+        # Stratum furthest below its share of the draws so far (random tie-break)
+        def deficit(stratum):
+            return self.share[stratum] * (self.draws + 1) - self.stratum_draws[stratum]
+        best = max(deficit(s) for s in open_strata)
+        stratum = self.rng.choice(sorted(s for s in open_strata if deficit(s) >= best - 1e-9))
+
+        # Least-drawn source with chunks left in this epoch, then its next chunk
+        sources = {src: order for src, order in self.remaining[stratum].items() if order}
+        fewest = min(self.source_draws[src] for src in sources)
+        source = self.rng.choice(sorted(src for src in sources if self.source_draws[src] == fewest))
+        index = sources[source].pop()
+
+        self.draws += 1
+        self.stratum_draws[stratum] += 1
+        self.source_draws[source] += 1
+        return index
+
+    def record_verdict(self, chunk_index, approved):
+        """Counts an approved sample for the chunk's source (coverage report only)."""
+        if approved:
+            self.source_approved[self.sources[chunk_index]] += 1
+
+    def coverage(self):
+        """One row per source document: stratum, chunks, eligible chunks, draws, approved samples."""
+        chunks_per_source = defaultdict(int)
+        for source in self.sources:
+            chunks_per_source[source] += 1
+        rows = []
+        for (category, subcategory), sources in self.pool.items():
+            for source, indices in sources.items():
+                rows.append({
+                    "category": category,
+                    "subcategory": subcategory,
+                    "source": source,
+                    "chunks": chunks_per_source[source],
+                    "eligible_chunks": len(indices),
+                    "drawn": self.source_draws[source],
+                    "approved": self.source_approved[source],
+                })
+        return pd.DataFrame(rows, columns=[
+            "category", "subcategory", "source", "chunks", "eligible_chunks", "drawn", "approved"
+        ])
+
+    def print_coverage(self):
+        coverage = self.coverage()
+        n_sources = len(set(self.sources))
+        print(f"Sampler: {len(self.eligible)}/{len(self.chunks)} chunks eligible "
+              f"from {len(coverage)}/{n_sources} source documents, {self.draws} draws (epoch {self.epoch})")
+        if coverage.empty:
+            return coverage
+        covered = int((coverage["approved"] > 0).sum())
+        print(f"Coverage: {covered}/{len(coverage)} source documents with at least one approved sample")
+        by_stratum = coverage.groupby(["category", "subcategory"]).agg(
+            sources=("source", "size"),
+            covered=("approved", lambda a: int((a > 0).sum())),
+            drawn=("drawn", "sum"),
+            approved=("approved", "sum"),
+        )
+        print(by_stratum.to_string())
+        return coverage
@@ -0,0 +1,349 @@
+"""
+Process-wide rate limiter for Bedrock callers: token buckets + AIMD + jittered backoff.
+
+Every model id (or, for calls without one, "<service>.<operation>") gets two
+token buckets, sized from its account quota in LIMITS:
+- requests per minute, one token per request attempt
+- tokens per minute, reserving estimated input + max output tokens before the
+  request is sent and settling the difference from the real usage afterwards
+  (as Bedrock's own quota accounting does)
+
+Adaptation (AIMD): each ThrottlingException halves both rates (at most once per
+DECREASE_COOLDOWN, so one burst of throttles counts once); each success adds
+ADDITIVE_INCREASE of the quota back, up to the quota. Throttled calls are
+retried after a full-jitter exponential backoff and then wait for the bucket
+again, so callers converge on the highest rate the account actually sustains.
+
+boto3 clients (LangChain / RAGAS / direct calls) are limited through botocore
+event hooks; anything else (litellm) goes through `call()`. The time spent
+waiting for the buckets is left in the request context as "queue_wait_s", so
+llm_telemetry reports it apart from the Bedrock latency:
+
+    RATE_LIMITER.instrument_client(boto3_client)
+    RATE_LIMITER.call(model_id, lambda: completion(...), estimated_tokens=...)
+
+All callers of a process share RATE_LIMITER, so the buckets, not the worker
+count, set the request rate, as long as per-call timeouts that include the
+bucket wait leave room for the queue (see `max_queue_wait`).
+"""
+import json
+import random
+import threading
+import time
+
+from llm_telemetry import base_model_id
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Account quotas: (requests per minute, tokens per minute; None = not limited).
+# Defaults vary per account and region: copy yours from Service Quotas > Amazon Bedrock.
+LIMITS = {
+    "openai.gpt-oss-120b-1:0": (250, 500_000),
+    "openai.gpt-oss-20b-1:0": (250, 500_000),
+    "meta.llama4-maverick-17b-instruct-v1:0": (200, 300_000),
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": (50, 400_000),
+    "amazon.titan-embed-text-v2:0": (2_000, 300_000),
+    "bedrock-agent-runtime.Retrieve": (1_200, None),
+    "bedrock-agent.ListAgents": (600, None),
+    "bedrock-agent.ListAgentAliases": (600, None),
+}
+DEFAULT_LIMITS = (100, 200_000)
+# Bucket capacity in seconds of quota: short bursts are allowed, minute-long ones are not
+BURST_SECONDS = 2.0
+# Output tokens reserved when the request sets no max_tokens
+DEFAULT_OUTPUT_TOKENS = 1_000
+CHARS_PER_TOKEN = 4
+
+# AIMD
+DECREASE_FACTOR = 0.5       # rate multiplier on a throttle
+ADDITIVE_INCREASE = 0.02    # share of the quota added back per successful call
+MIN_RATE_FRACTION = 0.02    # never below this share of the quota
+DECREASE_COOLDOWN = 2.0     # seconds; throttles of requests already in flight count once
+
+# Retries of throttled calls (full-jitter exponential backoff)
+MAX_ATTEMPTS = 8
+BASE_BACKOFF = 0.5          # seconds
+MAX_BACKOFF = 20.0
+
+THROTTLE_CODES = {
+    "ThrottlingException", "Throttling", "TooManyRequestsException",
+    "RequestLimitExceeded", "RateLimitError",
+}
+
+
+def is_throttle(error):
+    """True for a throttling error: botocore ClientError, litellm RateLimitError or any 429."""
+    code = getattr(error, "response", {}) or {}
+    if isinstance(code, dict):
+        code = (code.get("Error") or {}).get("Code")
+    return (
+        code in THROTTLE_CODES
+        or type(error).__name__ in THROTTLE_CODES
+        or getattr(error, "status_code", None) == 429
+    )
+
+
+def backoff_delay(attempt, rng=random):
+    """Full jitter: uniform in [0, min(MAX_BACKOFF, BASE_BACKOFF * 2^(attempt-1))]."""
+    return rng.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `rate` (tokens/second) can be changed at any time."""
+
+    def __init__(self, rate, burst_seconds=BURST_SECONDS):
+        self.rate = rate
+        self.burst_seconds = burst_seconds
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate * self.burst_seconds)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1.0):
+        """
+        Blocks until the bucket can pay `amount`; returns the seconds waited.
+        Requests larger than the capacity only wait for a full bucket and leave
+        it in debt (paid back before anyone else goes).
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(amount, self.capacity)
+                if self.level >= needed:
+                    self.level -= amount
+                    return waited
+                delay = (needed - self.level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """Drops the saved-up burst (after a rate decrease)."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.level, 0)
+
+    def refund(self, amount):
+        """Gives back tokens reserved but not used (negative = charge extra)."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+
+
+class ModelLimiter:
+    """Request + token buckets of one model id, adapted with AIMD."""
+
+    def __init__(self, key, requests_per_minute, tokens_per_minute=None):
+        self.key = key
+        self.max_request_rate = requests_per_minute / 60
+        self.max_token_rate = tokens_per_minute / 60 if tokens_per_minute else None
+        self.requests = TokenBucket(self.max_request_rate)
+        self.tokens = TokenBucket(self.max_token_rate) if self.max_token_rate else None
+        self.fraction = 1.0          # current rate as a share of the quota
+        self.last_decrease = float("-inf")
+        self.throttles = 0
+        self.successes = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, estimated_tokens=0):
+        """Waits for one request slot (and `estimated_tokens`); returns (tokens reserved, seconds waited)."""
+        waited = self.requests.acquire(1)
+        reserved = 0
+        if self.tokens is not None and estimated_tokens:
+            reserved = estimated_tokens
+            waited += self.tokens.acquire(reserved)
+        with self._lock:
+            self.waited += waited
+        return reserved, waited
+
+    def settle(self, reserved, used_tokens):
+        """Corrects a reservation with the real token usage (None = keep the estimate)."""
+        if self.tokens is not None and used_tokens is not None:
+            self.tokens.refund(reserved - used_tokens)
+
+    def _set_fraction(self, fraction):
+        self.fraction = min(1.0, max(MIN_RATE_FRACTION, fraction))
+        self.requests.rate = self.max_request_rate * self.fraction
+        if self.tokens is not None:
+            self.tokens.rate = self.max_token_rate * self.fraction
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            if self.fraction < 1.0:
+                self._set_fraction(self.fraction + ADDITIVE_INCREASE)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= DECREASE_COOLDOWN:
+                self.last_decrease = now
+                self._set_fraction(self.fraction * DECREASE_FACTOR)
+                # Requests already granted by the old rate must not go out as a burst
+                self.requests.drain()
+
+
+class RateLimiter:
+    """Registry of ModelLimiters (one per model id / operation) shared by the whole process."""
+
+    def __init__(self, limits=LIMITS, default_limits=DEFAULT_LIMITS, max_attempts=MAX_ATTEMPTS):
+        self.limits = limits
+        self.default_limits = default_limits
+        self.max_attempts = max_attempts
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, key):
+        with self._lock:
+            if key not in self.models:
+                limits = self.limits.get(key) or self.limits.get(base_model_id(key)) or self.default_limits
+                self.models[key] = ModelLimiter(key, *limits)
+            return self.models[key]
+
+    def max_queue_wait(self, key, workers, tokens_per_call=0, slowdown=1 / DECREASE_FACTOR):
+        """
+        Seconds the last of `workers` simultaneous calls may wait in `key`'s buckets
+        (at the quota, divided by `slowdown` to leave room for AIMD decreases).
+        Add it to per-call timeouts that also cover the bucket wait (e.g. RAGAS RunConfig).
+        """
+        limiter = self.limiter(key)
+        wait = workers / limiter.max_request_rate
+        if limiter.max_token_rate and tokens_per_call:
+            wait = max(wait, workers * tokens_per_call / limiter.max_token_rate)
+        return wait * slowdown
+
+    # ==========================================
+    # boto3 / botocore hooks
+    # ==========================================
+
+    def instrument_client(self, client):
+        """
+        Paces every request attempt of a boto3 client (retries included) and
+        retries its throttled calls with jittered backoff, ahead of botocore's
+        own retry handler (which still handles every other retryable error).
+        """
+        events = client.meta.events
+        service = client.meta.service_model.service_name
+
+        def on_params(params, context, model, **kwargs):
+            model_id = params.get("modelId")
+            context["rate_limit_key"] = model_id or f"{service}.{model.name}"
+            context["rate_limit_tokens"] = estimate_request_tokens(params) if model_id else 0
+
+        def before_send(request, **kwargs):
+            context = getattr(request, "context", None) or {}
+            if "rate_limit_key" in context:
+                limiter = self.limiter(context["rate_limit_key"])
+                context["rate_limit_reserved"], waited = limiter.acquire(context["rate_limit_tokens"])
+                context["queue_wait_s"] = context.get("queue_wait_s", 0.0) + waited
+
+        def needs_retry(response, attempts, caught_exception, request_dict, **kwargs):
+            context = request_dict.get("context", {})
+            if "rate_limit_key" not in context:
+                return None
+            limiter = self.limiter(context["rate_limit_key"])
+            http_response, parsed = response if response is not None else (None, {})
+            code = (parsed.get("Error") or {}).get("Code")
+            status = getattr(http_response, "status_code", None)
+            if caught_exception is None and code is None and (status or 200) < 300:
+                return None    # success: settled in after-call
+            # Failed attempt: its reservation goes back, the retry reserves again
+            limiter.settle(context.pop("rate_limit_reserved", 0), 0)
+            if code in THROTTLE_CODES or status == 429:
+                limiter.on_throttle()
+                if attempts < self.max_attempts:
+                    return backoff_delay(attempts)
+            return None
+
+        def on_response(http_response, parsed, context, **kwargs):
+            if "rate_limit_key" not in context or parsed.get("Error"):
+                return
+            limiter = self.limiter(context["rate_limit_key"])
+            limiter.settle(context.pop("rate_limit_reserved", 0), response_tokens(http_response, parsed))
+            limiter.on_success()
+
+        events.register("provide-client-params.*.*", on_params)
+        events.register("before-send.*.*", before_send)
+        events.register_first("needs-retry.*.*", needs_retry)
+        events.register("after-call.*.*", on_response)
+        return client
+
+    # ==========================================
+    # Manual wrapping (litellm / anything not going through boto3)
+    # ==========================================
+
+    def call(self, key, fn, estimated_tokens=0, usage=None, on_wait=None):
+        """
+        fn() paced by `key`'s buckets, retried on throttling with jittered backoff.
+        `usage(result)` -> total tokens used, to settle the reservation.
+        `on_wait(seconds)` is told the bucket wait of each attempt (e.g. TrackedCall.add_queue_wait).
+        """
+        limiter = self.limiter(key)
+        for attempt in range(1, self.max_attempts + 1):
+            reserved, waited = limiter.acquire(estimated_tokens)
+            if on_wait is not None:
+                on_wait(waited)
+            try:
+                result = fn()
+            except Exception as e:
+                limiter.settle(reserved, 0)
+                if not is_throttle(e) or attempt == self.max_attempts:
+                    raise
+                limiter.on_throttle()
+                time.sleep(backoff_delay(attempt))
+                continue
+            limiter.settle(reserved, usage(result) if usage else None)
+            limiter.on_success()
+            return result
+
+    def print_report(self):
+        for key, limiter in sorted(self.models.items()):
+            print(f"Rate limiter [{key}]: {limiter.successes} calls, {limiter.throttles} throttled, "
+                  f"{limiter.waited:.1f}s waiting, now at {limiter.fraction:.0%} of the quota "
+                  f"({limiter.requests.rate * 60:.0f} req/min)")
+
+
+def estimate_request_tokens(params):
+    """Input tokens (~4 chars per token) + reserved output tokens of a Bedrock request."""
+    if "body" in params:    # InvokeModel: raw JSON body
+        body = params["body"]
+        size = len(body) if isinstance(body, (bytes, str)) else len(json.dumps(body, default=str))
+        try:
+            max_tokens = json.loads(body).get("max_tokens") if isinstance(body, (bytes, str)) else None
+        except (ValueError, AttributeError):
+            max_tokens = None
+    else:                   # Converse
+        content = {k: params.get(k) for k in ("messages", "system", "toolConfig")}
+        size = len(json.dumps(content, ensure_ascii=False, default=str))
+        max_tokens = (params.get("inferenceConfig") or {}).get("maxTokens")
+    if "embed" in str(params.get("modelId", "")).lower():
+        max_tokens = 0
+    output_tokens = DEFAULT_OUTPUT_TOKENS if max_tokens is None else max_tokens
+    return size // CHARS_PER_TOKEN + output_tokens
+
+
+def response_tokens(http_response, parsed):
+    """Total tokens of a Bedrock response (Converse usage or InvokeModel headers), None if unknown."""
+    usage = parsed.get("usage") or {}
+    if "totalTokens" in usage:
+        return usage["totalTokens"]
+    headers = getattr(http_response, "headers", {}) or {}
+    counts = [headers.get(f"x-amzn-bedrock-{kind}-token-count") for kind in ("input", "output")]
+    if counts[0] is None:
+        return None
+    return sum(int(c or 0) for c in counts)
+
+
+# Shared by every Bedrock caller of the process
+RATE_LIMITER = RateLimiter()
@@ -0,0 +1,264 @@
+"""
+Append-only store of evaluation runs.
+
+Layout (hive-partitioned Parquet dataset, one directory per run):
+
+    evaluations/runs/
+        _runs.jsonl                        manifest: one JSON line per run (config + summary)
+        run_id=<run_id>/part-0.parquet     per-query results of that run
+        run_id=<run_id>/cube.parquet       sums/counts per (complexity, style, persona, synthesizer)
+        run_id=<run_id>/value_counts.parquet   metric value histograms per cell (bootstrap CIs)
+
+Readers select runs from the manifest and only open those partitions / columns,
+so loading stays fast no matter how many runs are stored. Dashboard aggregates
+come from the (tiny) cube: any filter combination is a sum over its cells.
+"""
+import json
+import os
+import re
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from metric_stats import value_counts, merge_value_counts
+
+RESULTS_DIR = "evaluations/runs"
+MANIFEST_FILE = "_runs.jsonl"   # '_' prefix: ignored by dataset discovery
+PART_FILE = "part-0.parquet"
+CUBE_FILE = "cube.parquet"     # not in the dataset's explicit file list, so never mixed with rows
+VALUE_COUNTS_FILE = "value_counts.parquet"
+PARTITIONING = ds.partitioning(pa.schema([("run_id", pa.string())]), flavor="hive")
+
+# Aggregate cube: one row per combination of these dimensions
+CUBE_DIMENSIONS = ["complexity", "query_style", "persona_name", "synthesizer_name"]
+CUBE_METRICS = ["hit_rate", "mrr", "precision", "recall"]
+# Cutoff metrics (e.g. "ndcg@5") are summed into the cube too when present
+
+
+def cube_metric_columns(columns):
+    """CUBE_METRICS plus every metric@k column among `columns`."""
+    return CUBE_METRICS + [c for c in columns if "@" in c and c not in CUBE_METRICS]
+
+
+def make_run_id(run_config, created_at=None):
+    """
+    Human-readable, sortable id: <timestamp>_<retriever>_k<top_k>
+    e.g. 20261017T101500_bedrock-kb-3TPM53DPBN_k3
+    """
+    created_at = created_at or datetime.now()
+    retriever = run_config.get("retriever") or f"kb-{run_config.get('kb_id') or 'unknown'}"
+    parts = [created_at.strftime("%Y%m%dT%H%M%S"), retriever]
+    if run_config.get("top_k"):
+        parts.append(f"k{run_config['top_k']}")
+    return re.sub(r"[^A-Za-z0-9._-]+", "-", "_".join(parts))
+
+
+def partition_file(run_id, results_dir=RESULTS_DIR):
+    return os.path.join(results_dir, f"run_id={run_id}", PART_FILE)
+
+
+def cube_file(run_id, results_dir=RESULTS_DIR):
+    return os.path.join(results_dir, f"run_id={run_id}", CUBE_FILE)
+
+
+def value_counts_file(run_id, results_dir=RESULTS_DIR):
+    return os.path.join(results_dir, f"run_id={run_id}", VALUE_COUNTS_FILE)
+
+
+def register_run(record, results_dir=RESULTS_DIR):
+    """Appends one run to the manifest (only after its partition is fully written)."""
+    os.makedirs(results_dir, exist_ok=True)
+    with open(os.path.join(results_dir, MANIFEST_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+def list_runs(results_dir=RESULTS_DIR):
+    """All registered runs, oldest first (runs whose partition is missing are skipped)."""
+    path = os.path.join(results_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    return [r for r in runs if os.path.exists(partition_file(r["run_id"], results_dir))]
+
+
+def runs_dataset(run_ids, results_dir=RESULTS_DIR):
+    """Dataset over ONLY the given runs' partitions (no directory scan of the other runs)."""
+    files = [partition_file(run_id, results_dir) for run_id in run_ids]
+    return ds.dataset(
+        files, format="parquet",
+        partitioning=PARTITIONING, partition_base_dir=results_dir
+    )
+
+
+def load_runs(run_ids, columns=None, filter=None, results_dir=RESULTS_DIR):
+    """
+    Reads the selected runs into pandas. `columns` / `filter` (a pyarrow.dataset
+    expression) are pushed down, so unused columns and row groups are never read.
+    """
+    if not run_ids:
+        return pd.DataFrame()
+    table = runs_dataset(run_ids, results_dir).to_table(columns=columns, filter=filter)
+    return table.to_pandas()
+
+
+def run_columns(run_id, results_dir=RESULTS_DIR):
+    """Column names stored for a run (schema only, no data read)."""
+    return runs_dataset([run_id], results_dir).schema.names
+
+
+def load_row(run_id, row_id, columns=None, results_dir=RESULTS_DIR):
+    """One row by its row_id (row-group statistics let the scan skip everything else)."""
+    return load_runs([run_id], columns, filter=ds.field("row_id") == row_id, results_dir=results_dir)
+
+
+def load_page(run_id, offset, limit, columns=None, filter=None, results_dir=RESULTS_DIR):
+    """
+    Rows [offset, offset + limit) of the filtered run, in storage order.
+    Batches are streamed and the scan stops as soon as the page is full, so a
+    page costs the same no matter how many rows the run has.
+    """
+    scanner = runs_dataset([run_id], results_dir).scanner(columns=columns, filter=filter)
+    batches, seen, taken = [], 0, 0
+    for batch in scanner.to_batches():
+        if seen + batch.num_rows > offset:
+            piece = batch.slice(max(offset - seen, 0), limit - taken)
+            batches.append(piece)
+            taken += piece.num_rows
+            if taken >= limit:
+                break
+        seen += batch.num_rows
+    return pa.Table.from_batches(batches, schema=scanner.projected_schema).to_pandas()
+
+
+# ==========================================
+# AGGREGATE CUBE
+# ==========================================
+
+def get_complexity(name):
+    """Maps a synthesizer name to Single Hop / Multi Hop / Other."""
+    name = str(name).lower()
+    if 'single' in name:
+        return 'Single Hop'
+    elif 'multi' in name:
+        return 'Multi Hop'
+    return 'Other'
+
+
+def add_cube_dimensions(df):
+    """Adds `complexity` and fills missing dimension columns/values with 'Unknown'."""
+    if 'synthesizer_name' in df.columns:
+        df['complexity'] = df['synthesizer_name'].apply(get_complexity)
+    for dim in CUBE_DIMENSIONS:
+        if dim not in df.columns:
+            df[dim] = 'Unknown'
+        else:
+            df[dim] = df[dim].fillna('Unknown').astype(str)
+    return df
+
+
+def build_cube(df):
+    """
+    Per-cell `count` and `sum_<metric>` over CUBE_DIMENSIONS (metric@k columns included).
+    Sums (not means) so cells can be added: mean = sum(sum_x) / sum(count).
+    """
+    metrics = cube_metric_columns(df.columns)
+    df = add_cube_dimensions(df[[c for c in df.columns if c in CUBE_DIMENSIONS + metrics]].copy())
+    grouped = df.groupby(CUBE_DIMENSIONS, sort=False)
+    cube = grouped[metrics].sum().add_prefix("sum_")
+    cube.insert(0, "count", grouped.size())
+    return cube.reset_index()
+
+
+def merge_cubes(cubes):
+    """Adds up partial cubes (e.g. one per streamed batch)."""
+    cubes = [c for c in cubes if not c.empty]
+    if not cubes:
+        return pd.DataFrame(columns=CUBE_DIMENSIONS + ["count"] + [f"sum_{m}" for m in CUBE_METRICS])
+    return pd.concat(cubes).groupby(CUBE_DIMENSIONS, sort=False).sum().reset_index()
+
+
+def write_cube(cube, run_id, results_dir=RESULTS_DIR):
+    path = cube_file(run_id, results_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cube.to_parquet(path, index=False)
+    return path
+
+
+def load_cube(run_id, results_dir=RESULTS_DIR):
+    """The run's cube; runs stored before cubes existed get one built from their rows."""
+    path = cube_file(run_id, results_dir)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    columns = runs_dataset([run_id], results_dir).schema.names
+    return build_cube(load_runs(
+        [run_id], [c for c in CUBE_DIMENSIONS + cube_metric_columns(columns) if c in columns],
+        results_dir=results_dir
+    ))
+
+
+def dimension_filter(cube, selections):
+    """
+    pyarrow expression for the rows behind the selected cube values
+    ({dimension: allowed values}), pushed down into the Parquet scan.
+    `complexity` is not stored, so it becomes a synthesizer_name condition;
+    dimensions with every value selected add no condition.
+    """
+    if any(len(values) == 0 for values in selections.values()):
+        return ds.scalar(False)
+    allowed = dict(selections)
+    if "complexity" in allowed:
+        complexity_cells = cube[cube["complexity"].isin(allowed.pop("complexity"))]
+        allowed["synthesizer_name"] = set(complexity_cells["synthesizer_name"]) & set(
+            allowed.get("synthesizer_name", complexity_cells["synthesizer_name"])
+        )
+
+    expression = None
+    for dim, values in allowed.items():
+        values = set(values)
+        if values >= set(cube[dim]):
+            continue
+        condition = ds.field(dim).isin(sorted(values - {"Unknown"}))
+        if "Unknown" in values:   # add_cube_dimensions maps missing values to 'Unknown'
+            condition = condition | ds.field(dim).is_null()
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def build_value_counts(df):
+    """How often each metric value occurs per cube cell (enough for a bootstrap, see metric_stats)."""
+    df = add_cube_dimensions(df[[c for c in df.columns if c in CUBE_DIMENSIONS + CUBE_METRICS]].copy())
+    return value_counts(df, CUBE_METRICS, CUBE_DIMENSIONS)
+
+
+def merge_run_value_counts(frames):
+    return merge_value_counts(frames, CUBE_DIMENSIONS)
+
+
+def write_value_counts(counts, run_id, results_dir=RESULTS_DIR):
+    path = value_counts_file(run_id, results_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    counts.to_parquet(path, index=False)
+    return path
+
+
+def load_value_counts(run_id, results_dir=RESULTS_DIR):
+    """The run's value counts; older runs get them built from their metric columns."""
+    path = value_counts_file(run_id, results_dir)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    columns = set(run_columns(run_id, results_dir))
+    return build_value_counts(load_runs(
+        [run_id], [c for c in CUBE_DIMENSIONS + CUBE_METRICS if c in columns], results_dir=results_dir
+    ))
+
+
+def cube_means(cube, by=None):
+    """Metric means from cube cells, overall (Series) or per `by` dimension(s) (DataFrame)."""
+    sum_columns = [c for c in cube.columns if c.startswith("sum_")]
+    sums = cube[["count"] + sum_columns]
+    sums = sums.groupby([cube[b] for b in ([by] if isinstance(by, str) else by)]).sum() if by else sums.sum()
+    means = sums[sum_columns].div(sums["count"], axis=0)
+    return means.rename(lambda c: c[len("sum_"):], axis=1 if by else 0)
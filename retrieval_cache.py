@@ -0,0 +1,188 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+# Shared by every script in the repo (absolute path, so it works from any cwd)
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "retrieval_cache.sqlite"
+)
+# Entries older than this are ignored (None = never expire)
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+
+class RetrievalCache:
+    """
+    Persistent, content-addressed cache for Bedrock KB `retrieve` calls.
+
+    Key = sha256(KB id + query text + full retrievalConfiguration), so changing
+    numberOfResults or any other retrieval setting produces a different entry.
+    The value is the RAW `retrievalResults` list, so any cleaning logic
+    (e.g. clean_chunk_text) can change without paying for new API calls.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared across threads, serialized by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS retrievals (
+                key TEXT PRIMARY KEY,
+                kb_id TEXT NOT NULL,
+                query TEXT NOT NULL,
+                config TEXT NOT NULL,
+                results TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_retrievals_kb ON retrievals (kb_id)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(kb_id, query, retrieval_configuration):
+        """Stable hash of everything that can change the retrieve() response."""
+        payload = json.dumps(
+            {"kb_id": kb_id, "query": query, "config": retrieval_configuration},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, kb_id, query, retrieval_configuration):
+        """Returns the cached retrievalResults list, or None on miss/expired."""
+        key = self.make_key(kb_id, query, retrieval_configuration)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created_at FROM retrievals WHERE key = ?", (key,)
+            ).fetchone()
+            expired = (
+                row is not None
+                and self.ttl_seconds is not None
+                and time.time() - row[1] > self.ttl_seconds
+            )
+            # Counted under the lock: concurrent retrieve threads share one cache
+            if row is None or expired:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, kb_id, query, retrieval_configuration, results):
+        key = self.make_key(kb_id, query, retrieval_configuration)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO retrievals VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key, kb_id, query,
+                    json.dumps(retrieval_configuration, sort_keys=True),
+                    json.dumps(results, ensure_ascii=False, default=str),
+                    time.time(),
+                )
+            )
+            self._conn.commit()
+
+    def invalidate(self, kb_id=None, before=None):
+        """
+        Deletes entries (e.g. after the KB is re-synced).
+        - kb_id:  only entries for this KB (None = all KBs)
+        - before: only entries created before this unix timestamp (None = all)
+        Returns the number of deleted entries.
+        """
+        sql = "DELETE FROM retrievals WHERE 1 = 1"
+        params = []
+        if kb_id is not None:
+            sql += " AND kb_id = ?"
+            params.append(kb_id)
+        if before is not None:
+            sql += " AND created_at < ?"
+            params.append(before)
+        with self._lock:
+            deleted = self._conn.execute(sql, params).rowcount
+            self._conn.commit()
+        return deleted
+
+    def purge_expired(self):
+        """Physically removes entries older than the TTL."""
+        if self.ttl_seconds is None:
+            return 0
+        return self.invalidate(before=time.time() - self.ttl_seconds)
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kb_id, COUNT(*) FROM retrievals GROUP BY kb_id"
+            ).fetchall()
+        return {
+            "entries_per_kb": dict(rows),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def cached_retrieve(client, cache, kb_id, query, retrieval_configuration):
+    """
+    Drop-in for client.retrieve(...)['retrievalResults'] that goes through the cache.
+    If `cache` is None it simply calls the API.
+    """
+    if cache is not None:
+        cached = cache.get(kb_id, query, retrieval_configuration)
+        if cached is not None:
+            return cached
+
+    response = client.retrieve(
+        knowledgeBaseId=kb_id,
+        retrievalQuery={'text': query},
+        retrievalConfiguration=retrieval_configuration
+    )
+    results = response.get('retrievalResults', [])
+
+    if cache is not None:
+        cache.put(kb_id, query, retrieval_configuration, results)
+    return results
+
+
+# ==========================================
+# CLI: inspect / invalidate the cache
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the local KB retrieval cache.")
+    parser.add_argument("--path", default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--invalidate", metavar="KB_ID",
+                        help="Drop all entries for this KB (use after a re-sync). Use 'ALL' for every KB.")
+    parser.add_argument("--purge-expired", action="store_true",
+                        help="Delete entries older than the TTL.")
+    args = parser.parse_args()
+
+    cache = RetrievalCache(args.path)
+
+    if args.invalidate:
+        kb_id = None if args.invalidate == "ALL" else args.invalidate
+        print(f"🗑️ Deleted {cache.invalidate(kb_id=kb_id)} cached retrievals.")
+    if args.purge_expired:
+        print(f"🗑️ Purged {cache.purge_expired()} expired retrievals.")
+
+    print(f"Cache: {args.path}")
+    for kb_id, count in cache.stats()["entries_per_kb"].items():
+        print(f"  {kb_id}: {count} entries")
+    cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Pluggable retrievers for eval_set_generator.py.
+
+Every retriever returns RAW results in the same shape as Bedrock's
+`retrievalResults` ({'content': {'text': ...}, 'location': ..., 'score': ...}),
+so the existing clean_chunk_text() logic produces the same cleaned-context format.
+
+- BedrockKBRetriever:  the remote Knowledge Base (via the retrieval cache).
+- LocalDenseRetriever: embeds kb_nuevo_pipeline chunks once into a memory-mapped
+                       float32 matrix and answers top-k queries in batches with
+                       NumPy matrix products (optional IVF partition).
+
+Build a local index:
+    python retrievers.py build --chunk-size 800 --chunk-overlap 150
+Query it:
+    python retrievers.py query "qué es casaverso"
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+from retrieval_cache import cached_retrieve
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_KB_FOLDER = os.path.join(REPO_ROOT, "kb", "kb_nuevo_pipeline")
+DEFAULT_INDEX_DIR = os.path.join(REPO_ROOT, ".cache", "local_index")
+QUERY_BATCH_SIZE = 1024   # queries scored per matrix product (bounds memory)
+EMBED_BATCH_SIZE = 256    # chunks embedded per call while building
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# ==========================================
+# 1. EMBEDDERS
+# ==========================================
+
+class HashingEmbedder:
+    """
+    Network-free embedder: hashed unigrams + bigrams of accent-folded tokens,
+    L2-normalized. Deterministic, good enough to compare chunking strategies.
+    """
+
+    def __init__(self, dimensions=1024):
+        self.dimensions = dimensions
+        self.name = f"hashing-{dimensions}"
+
+    @staticmethod
+    def _tokens(text):
+        text = unicodedata.normalize("NFKD", text.lower())
+        text = "".join(c for c in text if not unicodedata.combining(c))
+        words = TOKEN_RE.findall(text)
+        return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for tok in self._tokens(text):
+                h = int.from_bytes(hashlib.blake2b(tok.encode(), digest_size=8).digest(), "little")
+                matrix[i, h % self.dimensions] += 1.0 if (h >> 63) else -1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+class BedrockTitanEmbedder:
+    """Titan text embeddings through bedrock-runtime (one InvokeModel call per text)."""
+
+    def __init__(self, client, model_id="amazon.titan-embed-text-v2:0", dimensions=1024):
+        self.client = client
+        self.model_id = model_id
+        self.dimensions = dimensions
+        self.name = f"{model_id}-{dimensions}"
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            response = self.client.invoke_model(
+                modelId=self.model_id,
+                body=json.dumps({"inputText": text, "dimensions": self.dimensions, "normalize": True})
+            )
+            matrix[i] = json.loads(response["body"].read())["embedding"]
+        return matrix
+
+# ==========================================
+# 2. RETRIEVERS
+# ==========================================
+
+class BedrockKBRetriever:
+    """The remote Bedrock Knowledge Base (the original behaviour)."""
+
+    def __init__(self, client, kb_id, cache=None):
+        self.client = client
+        self.kb_id = kb_id
+        self.cache = cache
+        self.name = f"bedrock-kb-{kb_id}"
+
+    def retrieve(self, query, top_k):
+        config = {'vectorSearchConfiguration': {'numberOfResults': top_k}}
+        return cached_retrieve(self.client, self.cache, self.kb_id, query, config)
+
+    def retrieve_batch(self, queries, top_k):
+        return [self.retrieve(q, top_k) for q in queries]
+
+
+def split_text(text, chunk_size, chunk_overlap):
+    """Character-based splitter that prefers to cut on whitespace. None = whole document."""
+    if not chunk_size or len(text) <= chunk_size:
+        return [text]
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            cut = text.rfind(" ", start + chunk_size // 2, end)
+            end = cut if cut != -1 else end
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - chunk_overlap, start + 1)
+    return [c for c in chunks if c]
+
+
+def kmeans(matrix, n_clusters, n_iter=20, seed=42):
+    """Plain Lloyd's k-means on L2-normalized rows (cosine / spherical k-means)."""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = matrix[assign == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids, np.argmax(matrix @ centroids.T, axis=1)
+
+
+class LocalDenseRetriever:
+    """
+    Dense retriever over a local index directory:
+      embeddings.npy   float32 [n_chunks, dim], opened with mmap_mode='r'
+      chunks.jsonl     one {'text', 'uri', 'metadata'} per row
+      index.json       build config (embedder, chunking, IVF lists)
+      ivf_*.npy        optional IVF partition (rows are stored sorted by list)
+    """
+
+    def __init__(self, index_dir, embedder, n_probe=4):
+        with open(os.path.join(index_dir, "index.json"), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        if self.config["embedder"] != embedder.name:
+            raise ValueError(
+                f"Index was built with '{self.config['embedder']}', got embedder '{embedder.name}'."
+            )
+
+        self.embedder = embedder
+        self.n_probe = n_probe
+        self.embeddings = np.load(os.path.join(index_dir, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(index_dir, "chunks.jsonl"), "r", encoding="utf-8") as f:
+            self.chunks = [json.loads(line) for line in f]
+
+        self.centroids = None
+        if self.config.get("n_lists"):
+            self.centroids = np.load(os.path.join(index_dir, "ivf_centroids.npy"))
+            self.list_offsets = np.load(os.path.join(index_dir, "ivf_offsets.npy"))
+
+        chunking = f"{self.config['chunk_size']}-{self.config['chunk_overlap']}"
+        self.name = f"local-dense-{embedder.name}-chunks{chunking}"
+
+    @classmethod
+    def build(cls, embedder, kb_folder=DEFAULT_KB_FOLDER, index_dir=DEFAULT_INDEX_DIR,
+              chunk_size=None, chunk_overlap=0, n_lists=None, n_probe=4):
+        """Chunks + embeds every .md file once and writes the index to `index_dir`."""
+        chunks = []
+        for root, _, files in os.walk(kb_folder):
+            for name in sorted(files):
+                if not name.endswith(".md"):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                metadata = {}
+                sidecar = path[:-3] + ".docx.metadata.json"
+                if os.path.exists(sidecar):
+                    with open(sidecar, "r", encoding="utf-8") as f:
+                        metadata = json.load(f).get("metadataAttributes", {})
+                uri = os.path.relpath(path, kb_folder).replace(os.sep, "/")
+                for piece in split_text(text, chunk_size, chunk_overlap):
+                    chunks.append({"text": piece, "uri": uri, "metadata": metadata})
+
+        if not chunks:
+            raise FileNotFoundError(f"No .md files found in {kb_folder}")
+
+        os.makedirs(index_dir, exist_ok=True)
+        embeddings = np.lib.format.open_memmap(
+            os.path.join(index_dir, "embeddings.npy"), mode="w+",
+            dtype=np.float32, shape=(len(chunks), embedder.dimensions)
+        )
+        for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+            batch = chunks[start:start + EMBED_BATCH_SIZE]
+            embeddings[start:start + len(batch)] = embedder.embed([c["text"] for c in batch])
+
+        if n_lists:
+            # Reorder rows so each IVF list is a contiguous slice of the matrix
+            n_lists = min(n_lists, len(chunks))
+            centroids, assign = kmeans(np.asarray(embeddings), n_lists)
+            order = np.argsort(assign, kind="stable")
+            embeddings[:] = np.asarray(embeddings)[order]
+            chunks = [chunks[i] for i in order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+            np.save(os.path.join(index_dir, "ivf_centroids.npy"), centroids)
+            np.save(os.path.join(index_dir, "ivf_offsets.npy"), offsets)
+        embeddings.flush()
+
+        with open(os.path.join(index_dir, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+        with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "embedder": embedder.name,
+                "kb_folder": kb_folder,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "n_lists": n_lists,
+                "n_chunks": len(chunks),
+            }, f, indent=4)
+
+        print(f"✅ Indexed {len(chunks)} chunks into {index_dir}")
+        return cls(index_dir, embedder, n_probe=n_probe)
+
+    def _format(self, row, score):
+        chunk = self.chunks[row]
+        return {
+            "content": {"text": chunk["text"], "type": "TEXT"},
+            "location": {"type": "LOCAL", "s3Location": {"uri": chunk["uri"]}},
+            "metadata": chunk["metadata"],
+            "score": float(score),
+        }
+
+    def _top_k_exact(self, query_vectors, top_k):
+        scores = query_vectors @ self.embeddings.T
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def _top_k_ivf(self, query_vectors, top_k):
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argsort(-(query_vectors @ self.centroids.T), axis=1)[:, :n_probe]
+        # Running top-k per query, merged one probed list at a time: each list is read once
+        # and scored with one matrix product for all the queries that probe it
+        dtype = np.result_type(query_vectors.dtype, self.embeddings.dtype)
+        best_rows = np.full((len(query_vectors), top_k), -1, dtype=np.int64)
+        best_scores = np.full((len(query_vectors), top_k), -np.inf, dtype=dtype)
+        for l in np.unique(probes):
+            start, end = self.list_offsets[l], self.list_offsets[l + 1]
+            if start == end:
+                continue
+            queries = np.flatnonzero((probes == l).any(axis=1))
+            scores = query_vectors[queries] @ self.embeddings[start:end].T
+            merged_scores = np.concatenate([best_scores[queries], scores], axis=1)
+            merged_rows = np.concatenate(
+                [best_rows[queries], np.broadcast_to(np.arange(start, end), scores.shape)], axis=1
+            )
+            top = np.argpartition(-merged_scores, top_k - 1, axis=1)[:, :top_k]
+            best_scores[queries] = np.take_along_axis(merged_scores, top, axis=1)
+            best_rows[queries] = np.take_along_axis(merged_rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        # Probed lists holding fewer than top_k chunks leave -1 slots
+        found = best_rows >= 0
+        return ([rows[mask] for rows, mask in zip(best_rows, found)],
+                [scores[mask] for scores, mask in zip(best_scores, found)])
+
+    def retrieve_batch(self, queries, top_k):
+        results = []
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            query_vectors = self.embedder.embed(queries[start:start + QUERY_BATCH_SIZE])
+            if self.centroids is not None:
+                rows, scores = self._top_k_ivf(query_vectors, top_k)
+            else:
+                rows, scores = self._top_k_exact(query_vectors, top_k)
+            for query_rows, query_scores in zip(rows, scores):
+                results.append([self._format(r, s) for r, s in zip(query_rows, query_scores)])
+        return results
+
+    def retrieve(self, query, top_k):
+        return self.retrieve_batch([query], top_k)[0]
+
+# ==========================================
+# 3. CLI
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the local dense KB index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build")
+    build.add_argument("--kb-folder", default=DEFAULT_KB_FOLDER)
+    build.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    build.add_argument("--chunk-size", type=int, default=None, help="Characters per chunk (default: whole file).")
+    build.add_argument("--chunk-overlap", type=int, default=0)
+    build.add_argument("--n-lists", type=int, default=None, help="IVF lists (default: exact search).")
+    build.add_argument("--dimensions", type=int, default=1024)
+
+    query = sub.add_parser("query")
+    query.add_argument("text")
+    query.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    query.add_argument("--top-k", type=int, default=3)
+    query.add_argument("--dimensions", type=int, default=1024)
+
+    args = parser.parse_args()
+    embedder = HashingEmbedder(args.dimensions)
+
+    if args.command == "build":
+        LocalDenseRetriever.build(
+            embedder, args.kb_folder, args.index_dir,
+            args.chunk_size, args.chunk_overlap, args.n_lists
+        )
+    else:
+        retriever = LocalDenseRetriever(args.index_dir, embedder)
+        for i, item in enumerate(retriever.retrieve(args.text, args.top_k), 1):
+            print(f"{i}. [{item['score']:.3f}] {item['location']['s3Location']['uri']}")
+
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,20 @@ from ragas.testset.synthesizers import (
 )
 from ragas.testset.persona import Persona
 import boto3
+import os
+import sys
 
-boto3_bedrock = boto3.client(service_name='bedrock-runtime', region_name='us-east-2')
+# Shared modules live at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from testset_io import write_testset
+from llm_cache import LLMCache, LangChainLLMCache
+from llm_telemetry import LLMTelemetry
+from rate_limiter import RATE_LIMITER
+
+# Optional endpoint override, e.g. http://localhost:8787 for local_bedrock_server.py
+ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")
+
+boto3_bedrock = boto3.client(service_name='bedrock-runtime', region_name='us-east-2', endpoint_url=ENDPOINT_URL)
 
 config = {
     "llm": "openai.gpt-oss-120b-1:0",
@@ -23,13 +35,31 @@ config = {
 }
 
 FOLDER_PATH = "./kb_nuevo_pipeline"
-OUTPUT_FILE = "testsets/test_nuevo_pipeline.csv"
+OUTPUT_FILE = "testsets/test_nuevo_pipeline.parquet"
+# CSV copy for humans (Excel); downstream scripts read the parquet
+EXPORT_CSV_FILE = "testsets/test_nuevo_pipeline.csv"
 TESTSET_SIZE = 30
-
-
-sequential_config = RunConfig(
-    max_workers=1,
-    timeout=60,     # seconds to wait per call
+# Shared on-disk LLM response cache (llm_cache.py): a rerun does not re-pay identical calls
+USE_LLM_CACHE = True
+llm_cache = LLMCache() if USE_LLM_CACHE else None
+# One record per Bedrock call (tokens, latency, retries, cost); embeddings are logged as "embedding"
+TELEMETRY_FILE = "testsets/test_nuevo_pipeline.telemetry.jsonl"
+telemetry = LLMTelemetry(TELEMETRY_FILE)
+telemetry.instrument_client(boto3_bedrock, default_stage="synthesizer")
+# Paces every call to the account quota and retries throttles with jittered backoff,
+# so RAGAS can run many workers instead of one (rate_limiter.py)
+RATE_LIMITER.instrument_client(boto3_bedrock)
+
+
+# RAGAS' per-call timeout also covers the wait in the rate limiter's buckets: it grows
+# with the queue MAX_WORKERS calls can form at the model's quota, so queued calls do not
+# time out and get retried (adding load) while the limiter is doing its job
+MAX_WORKERS = 16
+MAX_TOKENS = 4000
+CALL_TIMEOUT = 60   # seconds for the Bedrock call itself
+run_config = RunConfig(
+    max_workers=MAX_WORKERS,
+    timeout=int(CALL_TIMEOUT + RATE_LIMITER.max_queue_wait(config["llm"], MAX_WORKERS, MAX_TOKENS)),
     max_retries=3   
 )
 
@@ -37,10 +67,12 @@ generator_llm = LangchainLLMWrapper(ChatBedrockConverse(
     client=boto3_bedrock,
     model=config["llm"],
     temperature=config["temperature"],
-    max_tokens=4000,
+    max_tokens=MAX_TOKENS,
+    cache=LangChainLLMCache(llm_cache) if llm_cache else None,
 ))
 
 generator_embeddings = LangchainEmbeddingsWrapper(BedrockEmbeddings(
+    client=boto3_bedrock,
     model_id=config["embeddings"],
 ))
 
@@ -147,15 +179,21 @@ generator = TestsetGenerator(
 dataset = generator.generate_with_langchain_docs(
     documents, 
     testset_size=TESTSET_SIZE,
-    run_config=sequential_config, 
+    run_config=run_config, 
     query_distribution=distributions,  
 )
 
 df = dataset.to_pandas()
 
-output_filename = OUTPUT_FILE
-df.to_csv(output_filename, index=False)
+write_testset(df, OUTPUT_FILE)
+write_testset(df, EXPORT_CSV_FILE)
 
-print(f"Success! Testset saved to {OUTPUT_FILE}")
+print(f"Success! Testset saved to {OUTPUT_FILE} (CSV export: {EXPORT_CSV_FILE})")
+if llm_cache:
+    print(f"LLM cache: {llm_cache.hits} hits / {llm_cache.misses} misses")
+telemetry.print_report(accepted=len(df))
+RATE_LIMITER.print_report()
+if telemetry.records:
+    print(f"LLM telemetry saved to: {TELEMETRY_FILE} ({telemetry.write_parquet()})")
 
 ['Contexto erróneo para test']
\ No newline at end of file
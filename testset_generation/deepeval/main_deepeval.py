@@ -1,4 +1,5 @@
 import os
+import sys
 import glob
 from dotenv import load_dotenv
 
@@ -7,6 +8,12 @@ from deepeval.models.base_model import DeepEvalBaseLLM
 from litellm import completion
 # -----------------------------------------------
 
+# Shared modules live at the repo root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from llm_cache import LLMCache, cached_completion
+from llm_telemetry import LLMTelemetry
+from rate_limiter import RATE_LIMITER, DEFAULT_OUTPUT_TOKENS, CHARS_PER_TOKEN
+
 from deepeval.synthesizer import Synthesizer, Evolution
 from deepeval.synthesizer.config import (
     StylingConfig, 
@@ -28,29 +35,56 @@ load_dotenv()
 if not os.getenv("OPENAI_API_KEY"):
     raise ValueError("OPENAI_API_KEY not found in .env file")
 
+# Optional endpoint override, e.g. http://localhost:8787 for local_bedrock_server.py
+BEDROCK_ENDPOINT_URL = os.getenv("BEDROCK_ENDPOINT_URL")
+# Shared on-disk LLM response cache (llm_cache.py): a rerun does not re-pay identical calls
+USE_LLM_CACHE = True
+# One record per Bedrock call (tokens, latency, cost); cache hits are not calls and are not logged
+TELEMETRY_FILE = "./synthetic_data/chilean_bank_goldens.telemetry.jsonl"
+
 # --- NEW: CUSTOM WRAPPER CLASS FOR BEDROCK ---
 class BedrockWrapper(DeepEvalBaseLLM):
-    def __init__(self, model_name):
+    def __init__(self, model_name, cache=None, telemetry=None):
         self.model_name = model_name
+        self.cache = cache
+        self.telemetry = telemetry
 
     def load_model(self):
         return self.model_name
 
     def generate(self, prompt: str) -> str:
-        # This sends the prompt to AWS Bedrock via LiteLLM
-        response = completion(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        # This sends the prompt to AWS Bedrock via LiteLLM (through the LLM cache)
+        messages = [{"role": "user", "content": prompt}]
+        return cached_completion(self.cache, lambda: self._completion(messages), self.model_name, messages)
+
+    def _completion(self, messages):
+        if self.telemetry is None:
+            return self._call(messages).choices[0].message.content
+        with self.telemetry.track("synthesizer", self.model_name) as call:
+            response = self._call(messages, on_wait=call.add_queue_wait)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                call.set_usage(usage.prompt_tokens, usage.completion_tokens)
         return response.choices[0].message.content
 
+    def _call(self, messages, on_wait=None):
+        # Paced by the shared rate limiter (litellm does not go through the boto3 hooks)
+        estimated_tokens = sum(len(m["content"]) for m in messages) // CHARS_PER_TOKEN + DEFAULT_OUTPUT_TOKENS
+        return RATE_LIMITER.call(
+            self.model_name,
+            lambda: completion(
+                model=self.model_name,
+                messages=messages,
+                aws_bedrock_runtime_endpoint=BEDROCK_ENDPOINT_URL
+            ),
+            estimated_tokens,
+            usage=lambda response: response.usage.total_tokens if getattr(response, "usage", None) else None,
+            on_wait=on_wait,
+        )
+
     async def a_generate(self, prompt: str) -> str:
         # Async version required by DeepEval
-        response = completion(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.choices[0].message.content
+        return self.generate(prompt)
 
     def get_model_name(self):
         return self.model_name
@@ -118,7 +152,10 @@ def generate_chilean_bank_testset():
     # You can change the model ID below to any Bedrock model (e.g., meta.llama3-70b-instruct-v1:0)
     # bedrock_model = BedrockWrapper(model_name="us.anthropic.claude-3-5-sonnet-20240620-v1:0")
     # bedrock_model = BedrockWrapper(model_name="openai.gpt-oss-120b-1:0")
-    bedrock_model = BedrockWrapper(model_name="us.meta.llama4-maverick-17b-instruct-v1:0")
+    llm_cache = LLMCache() if USE_LLM_CACHE else None
+    telemetry = LLMTelemetry(TELEMETRY_FILE)
+    bedrock_model = BedrockWrapper(model_name="us.meta.llama4-maverick-17b-instruct-v1:0", cache=llm_cache,
+                                   telemetry=telemetry)
 
     
     synthesizer = Synthesizer(
@@ -165,6 +202,12 @@ def generate_chilean_bank_testset():
     df = synthesizer.to_pandas()
     print("\nPreview of Generated Data:")
     print(df[['input', 'expected_output']].head())
+    if llm_cache:
+        print(f"LLM cache: {llm_cache.hits} hits / {llm_cache.misses} misses")
+    telemetry.print_report(accepted=len(df))
+    RATE_LIMITER.print_report()
+    if telemetry.records:
+        print(f"LLM telemetry saved to: {TELEMETRY_FILE} ({telemetry.write_parquet()})")
 
 if __name__ == "__main__":
     generate_chilean_bank_testset()
\ No newline at end of file
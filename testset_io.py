@@ -0,0 +1,153 @@
+"""
+Shared read/write helpers for testsets and result files.
+
+Parquet is the working format: context columns are stored as true Arrow
+list<string> columns, so loading them needs no ast.literal_eval.
+CSV is only an export format (and a legacy input, parsed once here).
+
+Convert the existing CSVs (writes a .parquet next to each file):
+    python testset_io.py testsets/*.csv
+"""
+import ast
+import json
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Columns that hold a list per row (list<string> unless listed in LIST_VALUE_TYPES)
+LIST_COLUMNS = [
+    'reference_contexts', 'retrieved_contexts', 'context',
+    'retrieved_scores', 'match_mask', 'matched_gt_indices',
+]
+LIST_VALUE_TYPES = {
+    'retrieved_scores': pa.float64(),   # retriever score per retrieved context (rank order)
+    'match_mask': pa.bool_(),           # per retrieved item: inside any ground truth?
+    'matched_gt_indices': pa.int64(),   # ground truths containing a retrieved item
+}
+# Parquet schema metadata key holding how the file was produced (retriever, top_k, ...)
+METADATA_KEY = b'testset_metadata'
+
+
+def parse_list_column(data):
+    """
+    Safely parses a stringified list (e.g., "['a', 'b']") into a Python list.
+    Lists / arrays (already parsed) are returned as lists; anything else -> [].
+    """
+    try:
+        if isinstance(data, list):
+            return data
+        if hasattr(data, 'tolist'):
+            return data.tolist()
+        if not isinstance(data, str):
+            return []
+        return ast.literal_eval(data)
+    except (ValueError, SyntaxError):
+        return []
+
+
+def to_arrow_table(df, metadata=None):
+    """
+    Builds an Arrow table with list<string> types for the context columns
+    (list<bool> / list<int64> for the match columns, see LIST_VALUE_TYPES).
+    `metadata` (a JSON-able dict) is stored in the schema metadata.
+    """
+    arrays, names = [], []
+    for col in df.columns:
+        if col in LIST_VALUE_TYPES:
+            values = [list(parse_list_column(v)) for v in df[col]]
+            arrays.append(pa.array(values, type=pa.list_(LIST_VALUE_TYPES[col])))
+        elif col in LIST_COLUMNS:
+            values = [[str(x) for x in parse_list_column(v)] for v in df[col]]
+            arrays.append(pa.array(values, type=pa.list_(pa.string())))
+        else:
+            arrays.append(pa.Array.from_pandas(df[col]))
+        names.append(str(col))
+    table = pa.Table.from_arrays(arrays, names=names)
+    if metadata:
+        table = table.replace_schema_metadata({METADATA_KEY: json.dumps(metadata)})
+    return table
+
+
+def read_testset(path, columns=None):
+    """
+    Loads a testset/results file into pandas.
+    - .parquet: list columns come back as arrays of strings (no parsing)
+    - .csv:     legacy format, stringified lists are parsed once
+    """
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path, columns=columns)
+    else:
+        df = pd.read_csv(path, usecols=columns)
+        for col in LIST_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].apply(parse_list_column)
+    return df
+
+
+def read_testset_metadata(path):
+    """Returns the metadata dict written by write_testset ({} for CSV / plain files)."""
+    if not path.endswith('.parquet'):
+        return {}
+    schema_metadata = pq.read_schema(path).metadata or {}
+    return json.loads(schema_metadata.get(METADATA_KEY, b'{}'))
+
+
+def iter_testset_batches(path, batch_size, columns=None):
+    """
+    Yields the file as pandas DataFrames of at most `batch_size` rows, so huge
+    files can be processed with bounded memory (parquet record batches / CSV chunks).
+    """
+    if path.endswith('.parquet'):
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for df in pd.read_csv(path, chunksize=batch_size, usecols=columns):
+            for col in LIST_COLUMNS:
+                if col in df.columns:
+                    df[col] = df[col].apply(parse_list_column)
+            yield df
+
+
+def stable_schema(schema):
+    """
+    Null-typed columns (all values missing in one batch) become strings, so the
+    schema of the first batch can be reused for every later batch.
+    """
+    return pa.schema([
+        pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+        for f in schema
+    ])
+
+
+def write_testset(df, path, metadata=None, row_group_size=None):
+    """
+    Writes a testset. .parquet keeps list<string> columns (+ optional metadata);
+    .csv is an export. Smaller row groups let filtered readers skip more data.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.parquet'):
+        pq.write_table(to_arrow_table(df, metadata), path, row_group_size=row_group_size)
+    else:
+        export = df.copy()
+        for col in LIST_COLUMNS:
+            if col in export.columns:
+                export[col] = export[col].apply(lambda v: str(parse_list_column(v)))
+        export.to_csv(path, index=False, encoding='utf-8')
+
+
+def convert_csv_to_parquet(csv_path):
+    parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+    write_testset(read_testset(csv_path), parquet_path)
+    return parquet_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python testset_io.py <file.csv> [more.csv ...]")
+        sys.exit(1)
+    for csv_path in sys.argv[1:]:
+        print(f"✅ {csv_path} -> {convert_csv_to_parquet(csv_path)}")